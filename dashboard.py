@@ -1,12 +1,19 @@
+import os
+import sys
+import time
+
 import streamlit as st
-import requests
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-import time
-import folium
-from streamlit_folium import st_folium
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'dashboard'))
+
+import maps
+from clock import local_time
+from ingest import IngestWorker
+from signal_db import J1939_DATABASE, SPNS, load_database
+
+# Reexecução só do painel de dados (Streamlit >= 1.33); sem ela, o script inteiro roda a cada ciclo
+FRAGMENT = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
 
 # Configuração inicial do Streamlit
 st.set_page_config(
@@ -19,8 +26,8 @@ st.set_page_config(
 st.title("🚜 Monitor ISOBUS - Trator John Deere")
 
 # Inicialização do estado da sessão
-if 'dados_historicos' not in st.session_state:
-    st.session_state.dados_historicos = pd.DataFrame()
+if 'zoom' not in st.session_state:
+    st.session_state.zoom = 16
 
 # Configurações no sidebar
 with st.sidebar:
@@ -29,83 +36,80 @@ with st.sidebar:
     intervalo_atualizacao = st.slider("Intervalo de atualização (s)", 1, 10, 2)
     max_pontos = st.slider("Máximo de pontos no gráfico", 50, 500, 100)
 
-# Layout em três colunas
-col1, col2, col3 = st.columns([2, 2, 1])
-
-# Função para buscar dados do ESP32
-def buscar_dados_esp32(url):
-    try:
-        response = requests.get(f"http://{url}", timeout=2)
-        return response.json()
-    except:
-        return None
-
-# Criação dos placeholders para atualização
-with col1:
-    st.subheader("Dados do Motor")
-    motor_metrics = st.empty()
-    rpm_chart = st.empty()
-
-with col2:
-    st.subheader("Localização")
-    mapa = st.empty()
-    
-with col3:
-    st.subheader("Dados de Implemento")
-    implemento_info = st.empty()
-    st.subheader("Dados de Produtividade")
-    yield_info = st.empty()
+# Coleta em segundo plano: o ESP32 serve frames CAN brutos, decodificados aqui
+# pela base J1939 (RPM, carga, consumo, posição GPS)
+@st.cache_resource
+def coletor(ip):
+    worker = IngestWorker(ip, "Binário", database=load_database(J1939_DATABASE))
+    worker.start()
+    return worker
+
+def nome_sinal(worker, papel):
+    return worker.state.database.spn_name(SPNS[papel])
 
 # Função para atualizar o dashboard
 def atualizar_dashboard():
-    dados = buscar_dados_esp32(esp32_ip)
-    if dados:
-        # Atualiza métricas do motor
-        engine_data = dados['engine_data']
-        with col1:
-            motor_metrics.columns([
-                dict(
-                    metric="RPM",
-                    value=f"{engine_data.get('rpm', 0):.0f}",
-                    delta=f"{engine_data.get('load', 0):.1f}%"
-                ),
-                dict(
-                    metric="Consumo",
-                    value=f"{engine_data.get('fuel_rate', 0):.1f} L/h"
-                )
-            ])
-            
-            # Gráfico de RPM histórico
-            if 'historico' in dados:
-                df_hist = pd.DataFrame(dados['historico'])
-                fig_rpm = px.line(df_hist, x='timestamp', y='valores.Engine_Speed',
-                                title='RPM do Motor')
-                rpm_chart.plotly_chart(fig_rpm, use_container_width=True)
-        
-        # Atualiza mapa
-        position_data = dados['position_data']
-        if position_data.get('latitude') and position_data.get('longitude'):
-            m = folium.Map(
-                location=[position_data['latitude'], position_data['longitude']],
-                zoom_start=16
-            )
-            folium.Marker(
-                [position_data['latitude'], position_data['longitude']],
-                popup="Trator",
-                icon=folium.Icon(color='green', icon='info-sign')
-            ).add_to(m)
-            mapa.empty()
-            st_folium(m, width=400, height=300)
-        
-        # Atualiza dados do implemento
-        implement_data = dados['implement_data']
-        implemento_info.json(implement_data)
-        
-        # Atualiza dados de produtividade
-        yield_data = dados['yield_data']
-        yield_info.json(yield_data)
-
-# Loop principal de atualização
-while True:
+    # Layout em três colunas, desenhado dentro do painel: o mapa (st_folium) é um
+    # widget e precisa estar no mesmo fragment que o atualiza
+    col1, col2, col3 = st.columns([2, 2, 1])
+
+    with col1:
+        st.subheader("Dados do Motor")
+        motor_metrics = st.empty()
+        rpm_chart = st.empty()
+
+    with col2:
+        st.subheader("Localização")
+        mapa = st.empty()
+
+    with col3:
+        st.subheader("Sinais")
+        sinais_info = st.empty()
+
+    worker = coletor(esp32_ip)
+    snapshot = worker.snapshot()
+    if not snapshot['connected']:
+        motor_metrics.error("Sem conexão com o ESP32")
+        return
+    latest = snapshot['latest']
+
+    # Atualiza métricas do motor
+    with motor_metrics.container():
+        cols = st.columns(2)
+        cols[0].metric(
+            "RPM",
+            f"{latest.get(nome_sinal(worker, 'rpm'), 0):.0f}",
+            delta=f"{latest.get(nome_sinal(worker, 'carga'), 0):.1f}%"
+        )
+        cols[1].metric("Consumo", f"{latest.get(nome_sinal(worker, 'consumo'), 0):.1f} L/h")
+
+    # Gráfico de RPM dos últimos 10 min
+    ts, valores = worker.window(nome_sinal(worker, 'rpm'), 600, max_points=max_pontos)
+    if len(ts):
+        import plotly.express as px
+        df_hist = pd.DataFrame({'timestamp': local_time(ts), 'rpm': valores})
+        fig_rpm = px.line(df_hist, x='timestamp', y='rpm', title='RPM do Motor')
+        rpm_chart.plotly_chart(fig_rpm, use_container_width=True)
+
+    # Atualiza mapa com a posição decodificada (SPN 584/585)
+    zoom = st.session_state.zoom
+    trajeto = worker.track_view(zoom)
+    if trajeto[3] is not None:
+        with mapa.container():
+            # Só a cauda e o marcador são redesenhados (feature_group_to_add)
+            st.session_state.zoom = maps.track_map(trajeto, zoom, width=400, height=300) or zoom
+    else:
+        mapa.caption("Aguardando posição GPS")
+
+    # Últimos valores de todos os sinais decodificados
+    sinais_info.json(latest)
+
+# Loop principal de atualização: um ciclo por execução, para o mapa manter a
+# mesma chave e receber só o feature group novo. Com fragments só o painel de
+# dados é reexecutado; título e barra lateral ficam como estão
+if FRAGMENT is not None:
+    FRAGMENT(run_every=intervalo_atualizacao)(atualizar_dashboard)()
+else:
     atualizar_dashboard()
-    time.sleep(intervalo_atualizacao)
\ No newline at end of file
+    time.sleep(intervalo_atualizacao)
+    st.rerun()
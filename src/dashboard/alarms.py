@@ -0,0 +1,240 @@
+"""Regras de alarme avaliadas a cada lote decodificado.
+
+Regras em JSON (signals/alarms.json):
+
+    {"rules": [
+        {"name": "Motor superaquecido", "severity": "crítico", "for": 10,
+         "all": [{"spn": 110, "op": ">", "value": 105, "hysteresis": 5}]},
+        {"name": "Pressão de óleo baixa", "for": 2,
+         "all": [{"signal": "Pressão Óleo", "op": "<", "value": 1.5},
+                 {"spn": 190, "op": ">", "value": 1200}]}
+    ]}
+
+Cada condição aponta o sinal pelo SPN ("spn"), que vale em qualquer base
+J1939, ou pelo nome de exibição na base em uso ("signal"). Cada condição é um comparador com histerese: liga ao cruzar "value" e só
+desliga ao voltar "hysteresis" além dele. A regra vale quando todas as
+condições valem (cada sinal mantém o último valor recebido) e dispara
+depois de valer por "for" segundos seguidos.
+
+Na compilação, as condições são agrupadas por sinal e sentido com os
+limites ordenados: um searchsorted por amostra diz quais condições do
+grupo estão ligadas, e só as amostras em que esse índice muda são
+percorridas em Python. O custo por lote cresce com o log do número de
+regras e com o número de transições, não com o histórico.
+"""
+import json
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+from signal_db import SIGNALS_DIR
+
+ALARM_RULES = os.path.join(SIGNALS_DIR, 'alarms.json')
+
+# Comparador -> (sentido, inclusivo); "<" vira ">" com o valor negado
+OPERATORS = {'>': (1, False), '>=': (1, True), '<': (-1, False), '<=': (-1, True)}
+
+FIRED = "disparou"
+CLEARED = "normalizou"
+
+
+class AlarmEvent:
+    __slots__ = ('timestamp', 'rule', 'severity', 'state')
+
+    def __init__(self, timestamp, rule, severity, state):
+        self.timestamp = timestamp
+        self.rule = rule
+        self.severity = severity
+        self.state = state
+
+    def to_dict(self):
+        return {'timestamp': self.timestamp, 'rule': self.rule,
+                'severity': self.severity, 'state': self.state}
+
+
+class _Group:
+    """Condições de um sinal num mesmo sentido, com limites de entrada e saída ordenados"""
+
+    def __init__(self, direction, inclusive, atoms, thresholds, hysteresis):
+        self.direction = direction
+        self.side = 'right' if inclusive else 'left'
+        thresholds = direction * np.asarray(thresholds, dtype=np.float64)
+        exits = thresholds - np.asarray(hysteresis, dtype=np.float64)
+        atoms = np.asarray(atoms, dtype=np.int64)
+        on_order = np.argsort(thresholds, kind='stable')
+        off_order = np.argsort(exits, kind='stable')
+        self.enter = thresholds[on_order]
+        self.enter_atoms = atoms[on_order]
+        self.exit = exits[off_order]
+        self.exit_atoms = atoms[off_order]
+        # Índices da última amostra: nenhuma condição ligada, todas desligadas
+        self.last_on = 0
+        self.last_off = len(atoms)
+
+    def transitions(self, timestamps, values):
+        """[(timestamp, átomo, ligado)] nas amostras em que o índice muda"""
+        values = self.direction * values
+        on = np.searchsorted(self.enter, values, side=self.side)
+        off = np.searchsorted(self.exit, values, side=self.side)
+        prev_on = np.r_[self.last_on, on[:-1]]
+        prev_off = np.r_[self.last_off, off[:-1]]
+        events = []
+        for i in np.flatnonzero((on > prev_on) | (off < prev_off)).tolist():
+            t = int(timestamps[i])
+            for atom in self.enter_atoms[prev_on[i]:on[i]].tolist():
+                events.append((t, atom, True))
+            for atom in self.exit_atoms[off[i]:prev_off[i]].tolist():
+                events.append((t, atom, False))
+        self.last_on = int(on[-1])
+        self.last_off = int(off[-1])
+        return events
+
+
+class AlarmEngine:
+    """Regras compiladas para uma base de sinais, avaliadas lote a lote"""
+
+    def __init__(self, rules, database):
+        names = {}
+        for signal_id, (name, _) in enumerate(database.signals):
+            names.setdefault(name, []).append(signal_id)
+
+        def resolve(condition):
+            if 'spn' in condition:
+                return database.signal_ids(int(condition['spn']))
+            return names.get(condition['signal'], [])
+
+        self.rules = []
+        atom_rule = []
+        grouped = {}
+        for rule in rules:
+            conditions = rule.get('all', ())
+            # Regra com sinal que não existe nesta base nunca dispararia
+            if not conditions or not all(resolve(c) for c in conditions):
+                continue
+            index = len(self.rules)
+            self.rules.append((rule['name'], rule.get('severity', "aviso"),
+                               int(float(rule.get('for', 0)) * 1e9), len(conditions)))
+            for condition in conditions:
+                atom = len(atom_rule)
+                atom_rule.append(index)
+                direction, inclusive = OPERATORS[condition['op']]
+                for signal_id in resolve(condition):
+                    entry = grouped.setdefault((signal_id, direction, inclusive), ([], [], []))
+                    entry[0].append(atom)
+                    entry[1].append(float(condition['value']))
+                    entry[2].append(float(condition.get('hysteresis', 0)))
+
+        self._groups = {}
+        for (signal_id, direction, inclusive), (atoms, thresholds, hysteresis) in grouped.items():
+            self._groups.setdefault(signal_id, []).append(
+                _Group(direction, inclusive, atoms, thresholds, hysteresis))
+        self._atom_rule = np.array(atom_rule, dtype=np.int64)
+        self._atoms = np.zeros(len(atom_rule), dtype=bool)
+        # Por regra: condições ligadas e início (ns) da condição; disparadas em active
+        self._true_count = np.zeros(len(self.rules), dtype=np.int64)
+        self._since = {}
+        self.active = set()
+
+    def __len__(self):
+        return len(self.rules)
+
+    @property
+    def signal_ids(self):
+        """Ids dos sinais usados por alguma regra: só as amostras deles importam"""
+        return sorted(self._groups)
+
+    def evaluate(self, timestamps, signals, values):
+        """Processa um lote (ordenado por timestamp) e retorna os AlarmEvent gerados"""
+        events = []
+        if not len(signals) or not self._groups:
+            return events
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        signals = np.asarray(signals)
+        order = np.argsort(signals, kind='stable')
+        ids, starts = np.unique(signals[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        transitions = []
+        for signal_id, start, end in zip(ids.tolist(), starts, ends):
+            groups = self._groups.get(signal_id)
+            if groups is None:
+                continue
+            idx = order[start:end]
+            for group in groups:
+                transitions.extend(group.transitions(timestamps[idx], values[idx]))
+        transitions.sort(key=lambda t: t[0])
+        for t, atom, state in transitions:
+            self._set_atom(t, atom, state, events)
+        now = int(timestamps[-1])
+        # Condições que já valem há "for" segundos
+        for rule, since in list(self._since.items()):
+            if rule not in self.active and now - since >= self.rules[rule][2]:
+                self._fire(rule, since + self.rules[rule][2], events)
+        return events
+
+    def _set_atom(self, t, atom, state, events):
+        if self._atoms[atom] == state:
+            return
+        self._atoms[atom] = state
+        rule = int(self._atom_rule[atom])
+        was_true = self._true_count[rule] == self.rules[rule][3]
+        self._true_count[rule] += 1 if state else -1
+        is_true = self._true_count[rule] == self.rules[rule][3]
+        if is_true and not was_true:
+            self._since[rule] = t
+            if self.rules[rule][2] == 0:
+                self._fire(rule, t, events)
+        elif was_true and not is_true:
+            since = self._since.pop(rule)
+            if rule not in self.active and t - since >= self.rules[rule][2]:
+                # Valeu o tempo todo dentro do lote: dispara e normaliza
+                self._fire(rule, since + self.rules[rule][2], events)
+            if rule in self.active:
+                self.active.discard(rule)
+                name, severity, _, _ = self.rules[rule]
+                events.append(AlarmEvent(t, name, severity, CLEARED))
+
+    def _fire(self, rule, t, events):
+        self.active.add(rule)
+        name, severity, _, _ = self.rules[rule]
+        events.append(AlarmEvent(t, name, severity, FIRED))
+
+    def active_alarms(self):
+        """[(nome, severidade)] das regras disparadas"""
+        return [self.rules[rule][:2] for rule in sorted(self.active)]
+
+
+def load_rules(path=ALARM_RULES):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('rules', [])
+
+
+class AlarmLog:
+    """Eventos recentes em memória e, opcionalmente, em JSON lines no disco"""
+
+    def __init__(self, path=None, maxlen=200):
+        self.path = path
+        self.events = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def extend(self, events):
+        if not events:
+            return
+        with self._lock:
+            self.events.extend(events)
+        if self.path:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    for event in events:
+                        f.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Erro ao gravar log de alarmes: {e}")
+
+    def recent(self, n=None):
+        with self._lock:
+            events = list(self.events)
+        return events[-n:] if n else events
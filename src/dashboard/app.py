@@ -1,12 +1,54 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
 import requests
 import json
 import time
 from datetime import datetime
+import functools
+import os
+import threading
 import numpy as np
+import metrics
+from clock import local_time
+from ingest import IngestWorker, TRANSPORTS
+from rollup import parse_tiers
+from signal_db import SIMULATOR_DATABASE, SPNS, load_database
+
+# Reexecução só do painel (st.fragment a partir do 1.37, experimental no 1.33); sem ela,
+# o auto refresh volta a reexecutar o script inteiro
+FRAGMENT = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+# Diretório do log bruto de frames CAN (um subdiretório por ESP32); vazio desativa
+RAW_LOG_DIR = os.environ.get("JD_MONITOR_LOG_DIR", "logs")
+
+# Arquivo Parquet dos sinais decodificados (um subdiretório por ESP32); vazio desativa
+ARCHIVE_DIR = os.environ.get("JD_MONITOR_ARCHIVE_DIR", "arquivo")
+
+# Base de sinais (.dbc ou .json) usada na decodificação
+SIGNAL_DATABASE = os.environ.get("JD_MONITOR_SIGNAL_DB", SIMULATOR_DATABASE)
+
+# Processos decodificadores (pipeline em memória compartilhada); 0 decodifica na thread de ingestão
+DECODE_WORKERS = int(os.environ.get("JD_MONITOR_DECODE_WORKERS", "0"))
+
+# Modo demonstração: sem conexão com o ESP32, mostra dados simulados (nunca gravados em disco)
+DEMO_MODE = os.environ.get("JD_MONITOR_DEMO", "0") not in ("", "0")
+
+# Amostras guardadas por sinal no histórico bruto (o armazenamento cresce até esse limite)
+HISTORY_SAMPLES = int(os.environ.get("JD_MONITOR_HISTORY_SAMPLES", "200000"))
+
+# Níveis de agregação "resolução:retenção" para janelas longas (padrão: 1 s por 1 dia,
+# 1 min por 14 dias, 1 h por 1 ano)
+ROLLUP_TIERS = parse_tiers(os.environ.get("JD_MONITOR_ROLLUP_TIERS", "1s:1d,1min:14d,1h:365d"))
+
+# Só amostras que mudam de valor (por sinal e ECU) vão para o histórico, com heartbeat
+CHANGE_ONLY = os.environ.get("JD_MONITOR_CHANGE_ONLY", "0") not in ("", "0")
+
+# Porta do endpoint Prometheus /metrics; 0 desativa
+METRICS_PORT = int(os.environ.get("JD_MONITOR_METRICS_PORT", "0"))
+
+# Métricas para o painel de debug sem o endpoint; valem para o processo inteiro,
+# então são ligadas na inicialização e não por uma sessão
+METRICS = os.environ.get("JD_MONITOR_METRICS", "0") not in ("", "0")
 
 # Configurações da página
 st.set_page_config(
@@ -17,11 +59,15 @@ st.set_page_config(
 )
 
 # Inicializa variáveis de estado
-if 'historic_data' not in st.session_state:
-    st.session_state.historic_data = []
 if 'connection_status' not in st.session_state:
     st.session_state.connection_status = False
 
+# Janelas do histórico (s); as longas são lidas dos agregados de 1 min / 1 h
+JANELAS = {
+    "1 min": 60, "5 min": 300, "15 min": 900, "1 h": 3600, "6 h": 6 * 3600,
+    "12 h": 12 * 3600, "1 dia": 86400, "3 dias": 3 * 86400, "7 dias": 7 * 86400,
+}
+
 # Estilo CSS customizado
 st.markdown("""
 <style>
@@ -72,9 +118,19 @@ with st.sidebar:
             st.error("Não foi possível conectar")
             st.session_state.connection_status = False
     
+    # Modo frota: vários ESP32 consultados em paralelo
+    frota_texto = st.text_area("Frota (um IP por linha)", "")
+    frota = [ip.strip() for ip in frota_texto.splitlines() if ip.strip()]
+    if frota:
+        ip_esp32 = st.selectbox("ESP32 em detalhe", frota)
+    
     st.markdown("---")
+    transporte = st.radio("Transporte", TRANSPORTS, horizontal=True)
     auto_refresh = st.checkbox("Auto Refresh", value=True)
     refresh_rate = st.slider("Taxa de Atualização (s)", 1, 10, 2)
+    history_rate = st.slider("Atualização do Histórico (s)", 1, 60, 5)
+    janela_historico = st.select_slider(
+        "Janela do Histórico", list(JANELAS), value="5 min")
     
     st.markdown("---")
     st.subheader("Visualizações")
@@ -83,173 +139,325 @@ with st.sidebar:
     show_temp = st.checkbox("Temperatura", value=True)
     show_fuel = st.checkbox("Combustível", value=True)
     show_load = st.checkbox("Carga do Motor", value=True)
+    show_map = st.checkbox("Mapa do trajeto", value=True)
 
-# Função para criar gauge com dados simulados para teste
-def create_gauge(value, title, min_val, max_val, suffix=""):
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=value,
-        title={'text': title, 'font': {'size': 24}},
-        domain={'x': [0, 1], 'y': [0, 1]},
-        number={'suffix': suffix, 'font': {'size': 20}},
-        gauge={
-            'axis': {'range': [min_val, max_val], 'tickwidth': 1},
-            'bar': {'color': "#2ecc71"},
-            'bgcolor': "white",
-            'borderwidth': 2,
-            'bordercolor': "gray",
-            'steps': [
-                {'range': [min_val, max_val*0.33], 'color': '#ff9999'},
-                {'range': [max_val*0.33, max_val*0.66], 'color': '#ffff99'},
-                {'range': [max_val*0.66, max_val], 'color': '#99ff99'}
-            ],
-        }
-    ))
-    fig.update_layout(
-        height=250,
-        margin=dict(l=10, r=10, t=30, b=10),
-        paper_bgcolor='rgba(0,0,0,0)',
-        font={'color': "#2c3e50", 'family': "Arial"}
-    )
-    return fig
-
-# Função para buscar dados do ESP32 com simulação para teste
-def get_can_data(ip):
-    try:
-        response = requests.get(f"http://{ip}/api/data", timeout=3)
-        if response.status_code == 200:
-            return response.json()
-    except:
-        # Dados simulados para teste
-        if st.session_state.get('test_mode', True):
-            return {
-                'wifi_ssid': 'TEST_NETWORK',
-                'wifi_ip': ip,
-                'wifi_signal': -65,
-                'can_messages': [
-                    f"ID: 0xCF00400 Data: {format(int(np.random.normal(1500, 300)), '04x')}",
-                    f"ID: 0xCF00500 Data: {format(int(np.random.normal(30, 5)), '04x')}",
-                    f"ID: 0xCFEE600 Data: {format(int(np.random.normal(90, 10)), '04x')}",
-                    f"ID: 0xCF00700 Data: {format(int(np.random.normal(75, 15)), '04x')}",
-                    f"ID: 0xCF00800 Data: {format(int(np.random.normal(60, 20)), '04x')}"
-                ]
-            }
-    return None
-
-def process_can_messages(messages):
-    if not messages:
-        return pd.DataFrame()
-    
-    data = []
-    current_time = datetime.now()
-    
-    for msg in messages:
-        try:
-            id_hex = msg.split("ID: ")[1].split(" Data:")[0]
-            data_hex = msg.split("Data: ")[1].strip()
-            
-            can_id = int(id_hex, 16)
-            can_data = bytes.fromhex(data_hex)
-            
-            if can_id == 0xCF00400:  # RPM
-                value = int.from_bytes(can_data, 'big') * 0.125
-                data.append({"timestamp": current_time, "tipo": "RPM", "valor": value})
-                
-            elif can_id == 0xCF00500:  # Velocidade
-                value = int.from_bytes(can_data, 'big') * 0.1
-                data.append({"timestamp": current_time, "tipo": "Velocidade", "valor": value})
-                
-            elif can_id == 0xCFEE600:  # Temperatura
-                value = int.from_bytes(can_data, 'big') - 40
-                data.append({"timestamp": current_time, "tipo": "Temperatura", "valor": value})
-                
-            elif can_id == 0xCF00700:  # Combustível
-                value = int.from_bytes(can_data, 'big') * 0.4
-                data.append({"timestamp": current_time, "tipo": "Combustível", "valor": value})
-                
-            elif can_id == 0xCF00800:  # Carga
-                value = int.from_bytes(can_data, 'big') * 0.4
-                data.append({"timestamp": current_time, "tipo": "Carga", "valor": value})
-        except:
-            continue
-    
-    return pd.DataFrame(data)
+    st.markdown("---")
+    show_debug = st.checkbox("Painel de debug", value=False)
 
-def update_dashboard():
-    data = get_can_data(ip_esp32)
-    
-    if data:
-        # Status da Conexão
-        cols_status = st.columns([1,1,1])
-        with cols_status[0]:
-            st.metric("Status", "CONECTADO" if st.session_state.connection_status else "DESCONECTADO")
-        with cols_status[1]:
-            st.metric("IP", data['wifi_ip'])
-        with cols_status[2]:
-            st.metric("Sinal WiFi", f"{data['wifi_signal']} dBm")
-
-        # Processa dados
-        df = process_can_messages(data['can_messages'])
-        if not df.empty:
-            st.session_state.historic_data.append(df)
-            if len(st.session_state.historic_data) > 100:
-                st.session_state.historic_data.pop(0)
-            
-            # Combina dados históricos
-            df_historic = pd.concat(st.session_state.historic_data)
-            
-            # Gauges
-            st.markdown("### Medidores em Tempo Real")
-            gauge_cols = st.columns(3)
-            
-            if show_rpm:
-                with gauge_cols[0]:
-                    rpm_value = df[df['tipo'] == 'RPM']['valor'].iloc[-1] if not df[df['tipo'] == 'RPM'].empty else 0
-                    st.plotly_chart(create_gauge(rpm_value, "RPM do Motor", 0, 3000, " RPM"), use_container_width=True)
-            
-            if show_speed:
-                with gauge_cols[1]:
-                    speed_value = df[df['tipo'] == 'Velocidade']['valor'].iloc[-1] if not df[df['tipo'] == 'Velocidade'].empty else 0
-                    st.plotly_chart(create_gauge(speed_value, "Velocidade", 0, 40, " km/h"), use_container_width=True)
-            
-            if show_temp:
-                with gauge_cols[2]:
-                    temp_value = df[df['tipo'] == 'Temperatura']['valor'].iloc[-1] if not df[df['tipo'] == 'Temperatura'].empty else 0
-                    st.plotly_chart(create_gauge(temp_value, "Temperatura", 0, 120, " °C"), use_container_width=True)
-
-            # Gráficos de Linha
-            st.markdown("### Histórico")
-            chart_cols = st.columns(2)
-            
-            with chart_cols[0]:
-                if show_fuel:
-                    fuel_data = df_historic[df_historic['tipo'] == 'Combustível']
-                    if not fuel_data.empty:
-                        fig = px.line(fuel_data, x='timestamp', y='valor', 
-                                    title='Nível de Combustível',
-                                    labels={'valor': '%', 'timestamp': 'Tempo'})
-                        fig.update_layout(height=300)
-                        st.plotly_chart(fig, use_container_width=True)
-            
-            with chart_cols[1]:
-                if show_load:
-                    load_data = df_historic[df_historic['tipo'] == 'Carga']
-                    if not load_data.empty:
-                        fig = px.line(load_data, x='timestamp', y='valor',
-                                    title='Carga do Motor',
-                                    labels={'valor': '%', 'timestamp': 'Tempo'})
-                        fig.update_layout(height=300)
-                        st.plotly_chart(fig, use_container_width=True)
-
-            # Terminal CAN
-            with st.expander("Terminal CAN"):
-                for msg in data['can_messages']:
-                    st.code(msg)
-    else:
+# Cada painel ao vivo é um fragment com taxa própria: o resto da página não é reexecutado
+LIVE = auto_refresh and FRAGMENT is not None
+
+def figures():
+    """Figuras reaproveitadas entre refreshes desta sessão; o plotly só é importado no primeiro gráfico"""
+    if 'figures' not in st.session_state:
+        from charts import FigureCache
+        st.session_state.figures = FigureCache()
+    return st.session_state.figures
+
+# Base compilada uma vez por processo (e em cache no disco entre execuções)
+@st.cache_resource
+def get_signal_database(path):
+    return load_database(path)
+
+def signal_name(role):
+    """Nome do sinal de um painel na base em uso, pelo SPN (None se a base não o tem)"""
+    return get_signal_database(SIGNAL_DATABASE).spn_name(SPNS[role])
+
+# Servidor de métricas único por processo
+@st.cache_resource
+def get_metrics_server(port):
+    return metrics.serve(port)
+
+if METRICS_PORT:
+    get_metrics_server(METRICS_PORT)
+elif METRICS:
+    metrics.enable()
+
+# Coletores em execução, compartilhados por todas as sessões: um por ESP32 e um para a frota
+@st.cache_resource
+def get_collectors():
+    return {}, threading.Lock()
+
+def running_collector(key, config, start):
+    """Coletor de `key`; se a configuração (transporte, IPs) mudou, para o atual antes
+    de subir outro, para não haver duas coletas gravando no mesmo log"""
+    collectors, lock = get_collectors()
+    with lock:
+        current = collectors.get(key)
+        if current is not None and current[0] == config:
+            return current[1]
+        if current is not None:
+            current[1].stop()
+        collector = start()
+        collectors[key] = (config, collector)
+        return collector
+
+def start_ingest_worker(ip, transport):
+    archive_dir = os.path.join(ARCHIVE_DIR, ip.replace(':', '_')) if ARCHIVE_DIR else None
+    if DECODE_WORKERS > 0 and transport != "Texto (debug)":
+        from pipeline import PipelineIngest
+        worker = PipelineIngest(ip, transport, workers=DECODE_WORKERS,
+                                database_path=SIGNAL_DATABASE, log_dir=RAW_LOG_DIR or None,
+                                archive_dir=archive_dir, capacity=HISTORY_SAMPLES,
+                                rollup_tiers=ROLLUP_TIERS, change_only=CHANGE_ONLY)
+        worker.start()
+        return worker
+    log_dir = os.path.join(RAW_LOG_DIR, ip.replace(':', '_')) if RAW_LOG_DIR else None
+    worker = IngestWorker(ip, transport, test_mode=DEMO_MODE, log_dir=log_dir, archive_dir=archive_dir,
+                          database=get_signal_database(SIGNAL_DATABASE), capacity=HISTORY_SAMPLES,
+                          rollup_tiers=ROLLUP_TIERS, change_only=CHANGE_ONLY)
+    worker.start()
+    return worker
+
+# Um worker de ingestão por ESP32; o transporte escolhido por último vale para todas as sessões
+def get_ingest_worker(ip, transport):
+    return running_collector(ip, transport, lambda: start_ingest_worker(ip, transport))
+
+def start_fleet_poller(ips, transport):
+    from fleet import FleetPoller
+    poller = FleetPoller(list(ips), transport, log_dir=RAW_LOG_DIR or None,
+                         database=get_signal_database(SIGNAL_DATABASE),
+                         archive_dir=ARCHIVE_DIR or None, capacity=HISTORY_SAMPLES,
+                         rollup_tiers=ROLLUP_TIERS, change_only=CHANGE_ONLY)
+    poller.start()
+    return poller
+
+# Um poller por frota: consultas paralelas com timeout e circuit breaker por ESP32
+def get_fleet_poller(ips, transport):
+    return running_collector("frota", (ips, transport), lambda: start_fleet_poller(ips, transport))
+
+# Pontos enviados por gráfico: ~2x a largura em pixels de um gráfico de meia tela
+CHART_POINTS = 1600
+
+def history_chart(worker, role, seconds, title, unit):
+    tipo = signal_name(role)
+    if tipo is None:
+        return None
+    ts, values = worker.window(tipo, seconds, max_points=CHART_POINTS)
+    if not len(ts):
+        return None
+    return figures().history(ts, values, title, unit)
+
+def debug_panel():
+    """Tempos por etapa e frames/s por PGN desde o rerun anterior"""
+    if not metrics.enabled():
+        st.info("Métricas desligadas: defina JD_MONITOR_METRICS=1 ou JD_MONITOR_METRICS_PORT")
+        return
+    rows = []
+    for name, histogram in (("Consulta", metrics.FETCH_SECONDS), ("Decodificação", metrics.DECODE_SECONDS),
+                            ("Histórico", metrics.STORE_SECONDS), ("Renderização", metrics.RENDER_SECONDS)):
+        for labels, (_, total, n) in histogram.snapshot().items():
+            rows.append({
+                "etapa": " ".join((name,) + labels),
+                "n": n,
+                "média (ms)": 1000 * total / n,
+                "p95 (ms)": 1000 * histogram.quantile(0.95, *labels),
+            })
+
+    now = time.monotonic()
+    frames = {labels[0]: count for labels, count in metrics.FRAMES.snapshot().items()}
+    previous, previous_time = st.session_state.get('debug_frames', ({}, now))
+    st.session_state.debug_frames = (frames, now)
+    elapsed = now - previous_time
+    rates = pd.DataFrame([
+        {"PGN": pgn, "frames/s": (count - previous.get(pgn, 0)) / elapsed}
+        for pgn, count in frames.items()
+    ]) if elapsed > 0 else pd.DataFrame()
+
+    with st.expander("Debug", expanded=True):
+        cols = st.columns(2)
+        with cols[0]:
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+            dropped = ", ".join(f"{labels[0]}: {count}" for labels, count in metrics.DROPPED.snapshot().items())
+            history = sum(metrics.HISTORY_SAMPLES.snapshot().values())
+            st.caption(f"Descartados: {dropped or 0} · amostras no histórico: {history}")
+        with cols[1]:
+            if not rates.empty:
+                st.dataframe(rates.sort_values("frames/s", ascending=False),
+                             hide_index=True, use_container_width=True)
+
+def live_panel(name, run_every):
+    """Painel que se atualiza sozinho a cada run_every s; sem fragments, roda junto com o script"""
+    def decorate(func):
+        @functools.wraps(func)
+        def panel():
+            started = metrics.clock()
+            func()
+            metrics.RENDER_SECONDS.observe_since(started, name)
+        return FRAGMENT(run_every=run_every)(panel) if LIVE else panel
+    return decorate
+
+def current_worker():
+    if frota:
+        return get_fleet_poller(tuple(frota), transporte).devices[ip_esp32]
+    return get_ingest_worker(ip_esp32, transporte)
+
+@live_panel("frota", refresh_rate)
+def fleet_panel():
+    poller = get_fleet_poller(tuple(frota), transporte)
+    st.dataframe(pd.DataFrame(poller.overview()), hide_index=True, use_container_width=True)
+
+@live_panel("status", refresh_rate)
+def status_panel():
+    snapshot = current_worker().snapshot()
+    data = snapshot['status']
+
+    # Alarmes ativos no topo, eventos recentes num expander
+    for nome, severidade in snapshot['alarms']:
+        if severidade == "crítico":
+            st.error(f"🚨 {nome}")
+        else:
+            st.warning(f"⚠️ {nome}")
+    if snapshot['alarm_events']:
+        with st.expander("Alarmes"):
+            st.dataframe(pd.DataFrame([{
+                "horário": pd.Timestamp(local_time([evento['timestamp']])[0]).strftime("%d/%m %H:%M:%S"),
+                "alarme": evento['rule'],
+                "severidade": evento['severity'],
+                "evento": evento['state'],
+            } for evento in reversed(snapshot['alarm_events'])]),
+                hide_index=True, use_container_width=True)
+
+    if not data:
         st.error("Sem conexão com o ESP32")
+        return
+    if data.get('simulated'):
+        st.warning("Modo demonstração: ESP32 sem resposta, dados simulados")
+    # Status da Conexão
+    cols_status = st.columns([1,1,1,1])
+    with cols_status[0]:
+        st.metric("Status", "CONECTADO" if st.session_state.connection_status else "DESCONECTADO")
+    with cols_status[1]:
+        st.metric("IP", data['wifi_ip'])
+    with cols_status[2]:
+        st.metric("Sinal WiFi", f"{data['wifi_signal']} dBm")
+    with cols_status[3]:
+        # Frames que saíram do buffer do ESP32 antes de serem lidos
+        st.metric("Frames perdidos", snapshot['frames_lost'])
+
+@live_panel("medidores", refresh_rate)
+def gauges_panel():
+    latest = current_worker().snapshot()['latest']
+    if not latest:
+        st.caption("Aguardando dados do ESP32")
+        return
+    gauge_cols = st.columns(3)
+
+    if show_rpm:
+        with gauge_cols[0]:
+            rpm_value = latest.get(signal_name('rpm'), 0)
+            st.plotly_chart(figures().gauge(rpm_value, "RPM do Motor", 0, 3000, " RPM"), use_container_width=True)
+
+    if show_speed:
+        with gauge_cols[1]:
+            speed_value = latest.get(signal_name('velocidade'), 0)
+            st.plotly_chart(figures().gauge(speed_value, "Velocidade", 0, 40, " km/h"), use_container_width=True)
+
+    if show_temp:
+        with gauge_cols[2]:
+            temp_value = latest.get(signal_name('temperatura'), 0)
+            st.plotly_chart(figures().gauge(temp_value, "Temperatura", 0, 120, " °C"), use_container_width=True)
+
+# Zoom em que o trajeto é simplificado (tolerância de 1 px)
+TRACK_ZOOM = 16
+
+@live_panel("mapa", refresh_rate)
+def map_panel():
+    import maps
+    zoom = st.session_state.get('map_zoom', TRACK_ZOOM)
+    view = current_worker().track_view(zoom)
+    if view[3] is None:
+        st.caption("Aguardando posição GPS (SPN 584/585)")
+        return
+    if maps.available():
+        # Só a cauda e o marcador são redesenhados; os trechos fechados ficam no mapa base
+        st.session_state.map_zoom = maps.track_map(view, zoom) or zoom
+    else:
+        # Sem o streamlit-folium: figura plotly com o trajeto inteiro a cada atualização
+        _, frozen, tail, last = view
+        st.plotly_chart(figures().track(frozen + [tail], last, zoom), use_container_width=True)
+
+@live_panel("histórico", history_rate)
+def history_panel():
+    worker = current_worker()
+    chart_cols = st.columns(2)
+
+    with chart_cols[0]:
+        if show_fuel:
+            fig = history_chart(worker, 'combustivel', JANELAS[janela_historico],
+                                'Nível de Combustível', '%')
+            if fig is not None:
+                st.plotly_chart(fig, use_container_width=True)
+
+    with chart_cols[1]:
+        if show_load:
+            fig = history_chart(worker, 'carga', JANELAS[janela_historico],
+                                'Carga do Motor', '%')
+            if fig is not None:
+                st.plotly_chart(fig, use_container_width=True)
+
+    consumo = signal_name('consumo')
+    if consumo in worker.snapshot()['latest']:
+        litros = worker.total(consumo, JANELAS[janela_historico])
+        st.metric(f"Combustível consumido ({janela_historico})", f"{litros:.1f} L")
+
+@live_panel("terminal", refresh_rate)
+def network_panel():
+    snapshot = current_worker().snapshot()
+
+    # Frescor por ECU (endereço de origem)
+    fontes = snapshot['sources']
+    paradas = [f"0x{fonte['source']:02X}" for fonte in fontes if fonte['stale']]
+    if paradas:
+        st.warning(f"ECUs sem dados recentes: {', '.join(paradas)}")
+    with st.expander("ECUs na rede"):
+        st.dataframe(pd.DataFrame([{
+            "origem": f"0x{fonte['source']:02X}",
+            "última amostra (s)": round(fonte['age'], 1),
+            "amostras": fonte['samples'],
+        } for fonte in fontes]), hide_index=True, use_container_width=True)
+
+    # Falhas ativas (DM1) e identificação (VIN, software), inclusive multi-pacote
+    if snapshot['diagnostics']:
+        with st.expander("Diagnóstico (DM1/VIN)"):
+            diagnostics = pd.DataFrame(snapshot['diagnostics'])
+            if 'valor' in diagnostics:
+                # SPN (int) e VIN (texto) na mesma coluna: o Arrow exige um tipo só
+                diagnostics['valor'] = diagnostics['valor'].astype(str)
+            st.dataframe(diagnostics, hide_index=True, use_container_width=True)
+
+    # Terminal CAN
+    with st.expander("Terminal CAN"):
+        for msg in snapshot['messages']:
+            st.code(msg)
+
+@live_panel("debug", refresh_rate)
+def debug_fragment():
+    debug_panel()
+
+def update_dashboard():
+    # Títulos fixos; só o conteúdo dos painéis é refeito a cada atualização
+    if frota:
+        st.markdown("### Frota")
+        fleet_panel()
+    status_panel()
+    st.markdown("### Medidores em Tempo Real")
+    gauges_panel()
+    if show_map:
+        st.markdown("### Localização")
+        map_panel()
+    st.markdown("### Histórico")
+    history_panel()
+    network_panel()
+    if show_debug:
+        debug_fragment()
 
 # Loop principal
-if auto_refresh:
+if LIVE:
+    # Cada painel agenda a própria atualização; o script inteiro só roda de novo
+    # quando algum controle da barra lateral muda
+    update_dashboard()
+elif auto_refresh:
     placeholder = st.empty()
     with placeholder.container():
         update_dashboard()
@@ -257,4 +465,4 @@ if auto_refresh:
     st.rerun()
 else:
     if st.button("Atualizar"):
-        update_dashboard() 
\ No newline at end of file
+        update_dashboard()
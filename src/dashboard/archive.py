@@ -0,0 +1,242 @@
+"""Arquivo colunar (Parquet) dos sinais decodificados.
+
+Layout particionado por hora UTC, no estilo Hive:
+
+    <diretório>/date=2024-05-01/hour=13/part-<início em ns><sufixo>.parquet
+
+Colunas: timestamp (ns UTC, como no dashboard; ver clock.py), signal e unit
+(dictionary-encoded: o nome fica uma vez por row group, não por linha),
+value, pgn e source. Cada arquivo é ordenado por sinal e tempo, então as
+estatísticas de min/max dos row groups permitem pular sinais e horários
+fora da consulta.
+
+pyarrow é opcional: sem ele o dashboard funciona, só sem o arquivo.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Linhas por row group: unidade de leitura das consultas
+ROW_GROUP_ROWS = 65_536
+
+# Lotes na fila do escritor; com o disco travado, os seguintes são descartados
+MAX_QUEUED_BATCHES = 512
+
+# Colunas padrão de query()
+QUERY_COLUMNS = ('timestamp', 'signal', 'value')
+
+
+def available():
+    return pa is not None
+
+
+def _require():
+    if pa is None:
+        raise RuntimeError("pyarrow não instalado (pip install pyarrow)")
+
+
+def _hour_start(ns):
+    return ns - ns % 3_600_000_000_000
+
+
+class SignalArchiveWriter:
+    """Grava lotes de amostras decodificadas em Parquet numa thread própria.
+
+    append() só enfileira os arrays; a conversão para Arrow, a ordenação e
+    a escrita rodam fora da ingestão. As amostras se acumulam por hora e
+    viram um arquivo a cada `flush_rows` linhas, `flush_seconds` segundos
+    ou ao virar a hora. Com vários escritores no mesmo diretório (um por
+    decodificador do pipeline), cada um usa um `suffix` próprio.
+
+    A fila guarda no máximo `max_batches` lotes: se a escrita não
+    acompanhar, append() descarta o lote e soma em rows_dropped em vez de
+    acumular memória (a exportação usa block=True). Um lote que falha na
+    gravação é descartado e contado em errors; a thread segue com os
+    próximos.
+    """
+
+    def __init__(self, directory, signals, flush_rows=500_000, flush_seconds=300, suffix="",
+                 max_batches=MAX_QUEUED_BATCHES):
+        _require()
+        self.directory = directory
+        self.suffix = suffix
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        # Dicionários por id de sinal, iguais aos da SignalDatabase
+        names = [name for name, _ in signals]
+        units = [unit for _, unit in signals]
+        unique_units = sorted(set(units))
+        self._names = pa.array(names or [""], type=pa.string())
+        self._units = pa.array(unique_units or [""], type=pa.string())
+        self._unit_index = np.array([unique_units.index(unit) for unit in units] or [0], dtype=np.int16)
+
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_hour = None
+        self._opened_at = time.monotonic()
+        self.rows_written = 0
+        self.files_written = 0
+        self.rows_dropped = 0
+        self.errors = 0
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def append(self, timestamps, signals, values, pgns=None, sources=None, block=False):
+        """Enfileira um lote; timestamps em ns, signals com os ids da base.
+
+        Com block=True (exportação offline) espera lugar na fila em vez de descartar.
+        """
+        if len(timestamps):
+            n = len(timestamps)
+            try:
+                self._queue.put((
+                    np.asarray(timestamps, dtype=np.int64),
+                    np.asarray(signals, dtype=np.int16),
+                    np.asarray(values, dtype=np.float64),
+                    np.zeros(n, dtype=np.uint32) if pgns is None else np.asarray(pgns, dtype=np.uint32),
+                    np.zeros(n, dtype=np.uint8) if sources is None else np.asarray(sources, dtype=np.uint8),
+                ), block=block)
+            except queue.Full:
+                if not self.rows_dropped:
+                    print("Arquivo de sinais atrasado: descartando lotes")
+                self.rows_dropped += n
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread"""
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write_loop(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                batch = False
+            try:
+                if batch is None:
+                    self._flush()
+                elif batch is not False:
+                    self._add(batch)
+                if self._pending and time.monotonic() - self._opened_at >= self.flush_seconds:
+                    self._flush()
+            except Exception as e:
+                # Disco cheio, permissão, erro do Arrow: perde o lote, não a thread
+                print(f"Erro ao gravar arquivo de sinais: {type(e).__name__}: {e}")
+                self.errors += 1
+                self._pending, self._pending_rows, self._pending_hour = [], 0, None
+            if batch is None:
+                return
+
+    def _add(self, batch):
+        timestamps = batch[0]
+        hours = _hour_start(timestamps)
+        # Lote que atravessa a virada da hora é separado por hora
+        unique_hours = np.unique(hours).tolist()
+        for hour in unique_hours:
+            part = tuple(column[hours == hour] for column in batch) if len(unique_hours) > 1 else batch
+            if self._pending_hour is not None and hour != self._pending_hour:
+                self._flush()
+            if not self._pending:
+                self._opened_at = time.monotonic()
+            self._pending_hour = hour
+            self._pending.append(part)
+            self._pending_rows += len(part[0])
+            if self._pending_rows >= self.flush_rows:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        timestamps, signals, values, pgns, sources = (
+            np.concatenate(column) for column in zip(*self._pending))
+        hour = self._pending_hour
+        self._pending, self._pending_rows, self._pending_hour = [], 0, None
+
+        order = np.lexsort((timestamps, signals))
+        signals = signals[order]
+        table = pa.table({
+            'timestamp': pa.array(timestamps[order], type=pa.timestamp('ns')),
+            'signal': pa.DictionaryArray.from_arrays(pa.array(signals), self._names),
+            'unit': pa.DictionaryArray.from_arrays(pa.array(self._unit_index[signals]), self._units),
+            'value': pa.array(values[order]),
+            'pgn': pa.array(pgns[order]),
+            'source': pa.array(sources[order]),
+        })
+        start = datetime(1970, 1, 1) + timedelta(microseconds=hour // 1000)
+        directory = os.path.join(self.directory, f"date={start:%Y-%m-%d}", f"hour={start:%H}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{int(timestamps.min()):020d}{self.suffix}.parquet")
+        pq.write_table(table, path + '.tmp', row_group_size=ROW_GROUP_ROWS,
+                       compression='zstd', write_statistics=True)
+        os.replace(path + '.tmp', path)
+        self.rows_written += len(table)
+        self.files_written += 1
+
+
+class SignalArchive:
+    """Consultas ao arquivo Parquet com projeção de colunas e filtros empurrados ao leitor"""
+
+    def __init__(self, directory):
+        _require()
+        self.directory = directory
+
+    def dataset(self):
+        return ds.dataset(self.directory, format='parquet', partitioning='hive',
+                          exclude_invalid_files=True)
+
+    def _filter(self, signals, start, end):
+        expression = None
+
+        def both(a, b):
+            return b if a is None else a & b
+
+        if signals is not None:
+            expression = both(expression, ds.field('signal').isin(list(signals)))
+        if start is not None:
+            start = np.datetime64(start, 'ns')
+            expression = both(expression, ds.field('timestamp') >= pa.scalar(start, pa.timestamp('ns')))
+        if end is not None:
+            end = np.datetime64(end, 'ns')
+            expression = both(expression, ds.field('timestamp') < pa.scalar(end, pa.timestamp('ns')))
+        if start is not None and end is not None and end - start <= np.timedelta64(31, 'D'):
+            # Poda de partições: só os diretórios date=/hour= do intervalo são abertos
+            first, last = start.astype('datetime64[D]'), end.astype('datetime64[D]')
+            date, hour = ds.field('date'), ds.field('hour')
+            first_hour = int((start - first) // np.timedelta64(1, 'h'))
+            last_hour = int((end - last) // np.timedelta64(1, 'h'))
+            expression = both(expression, date.isin([str(day) for day in np.arange(first, last + 1)]))
+            expression = both(expression, (date > str(first)) | (hour >= first_hour))
+            expression = both(expression, (date < str(last)) | (hour <= last_hour))
+        return expression
+
+    def query(self, signals=None, start=None, end=None, columns=QUERY_COLUMNS):
+        """Amostras dos sinais em [start, end) (UTC) como pyarrow.Table.
+
+        Só as colunas pedidas são lidas, e os row groups cujas estatísticas
+        não cruzam o filtro de sinal/tempo são pulados.
+        """
+        if not os.path.isdir(self.directory):
+            return pa.table({column: pa.array([]) for column in columns})
+        table = self.dataset().to_table(columns=list(columns),
+                                        filter=self._filter(signals, start, end))
+        if 'timestamp' in columns:
+            table = table.sort_by('timestamp')
+        return table
+
+    def frame(self, signals=None, start=None, end=None, columns=QUERY_COLUMNS):
+        """query() como DataFrame do pandas"""
+        return self.query(signals, start, end, columns).to_pandas()
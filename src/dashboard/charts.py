@@ -0,0 +1,147 @@
+import plotly.graph_objects as go
+
+from clock import local_time
+
+
+def create_gauge(value, title, min_val, max_val, suffix=""):
+    fig = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=value,
+        title={'text': title, 'font': {'size': 24}},
+        domain={'x': [0, 1], 'y': [0, 1]},
+        number={'suffix': suffix, 'font': {'size': 20}},
+        gauge={
+            'axis': {'range': [min_val, max_val], 'tickwidth': 1},
+            'bar': {'color': "#2ecc71"},
+            'bgcolor': "white",
+            'borderwidth': 2,
+            'bordercolor': "gray",
+            'steps': [
+                {'range': [min_val, max_val*0.33], 'color': '#ff9999'},
+                {'range': [max_val*0.33, max_val*0.66], 'color': '#ffff99'},
+                {'range': [max_val*0.66, max_val], 'color': '#99ff99'}
+            ],
+        }
+    ))
+    fig.update_layout(
+        height=250,
+        margin=dict(l=10, r=10, t=30, b=10),
+        paper_bgcolor='rgba(0,0,0,0)',
+        font={'color': "#2c3e50", 'family': "Arial"}
+    )
+    return fig
+
+
+def create_history_chart(ts, values, title, unit):
+    """Mesmo visual do px.line usado antes, montado direto com graph_objects"""
+    fig = go.Figure(go.Scatter(
+        x=ts, y=values, mode='lines',
+        hovertemplate=f"Tempo=%{{x}}<br>{unit}=%{{y}}<extra></extra>",
+    ))
+    fig.update_layout(
+        height=300,
+        title=title,
+        xaxis_title='Tempo',
+        yaxis_title=unit,
+    )
+    return fig
+
+
+def track_lines(lines):
+    """Trechos [[lat, lon], ...] numa série só, separados por None"""
+    lats, lons = [], []
+    for line in lines:
+        lats.extend(lat for lat, _ in line)
+        lons.extend(lon for _, lon in line)
+        lats.append(None)
+        lons.append(None)
+    return lats, lons
+
+
+def create_track_map(lines, last, zoom):
+    """Trajeto e posição atual sobre o OpenStreetMap (sem token do Mapbox)"""
+    lats, lons = track_lines(lines)
+    fig = go.Figure([
+        go.Scattermapbox(lat=lats, lon=lons, mode='lines', line={'width': 3, 'color': 'green'},
+                         hoverinfo='skip'),
+        go.Scattermapbox(lat=[last[0]], lon=[last[1]], mode='markers', text=["Trator"],
+                         marker={'size': 12, 'color': 'green'}),
+    ])
+    fig.update_layout(
+        height=400,
+        margin=dict(l=0, r=0, t=0, b=0),
+        showlegend=False,
+        mapbox={'style': 'open-street-map', 'center': {'lat': last[0], 'lon': last[1]}, 'zoom': zoom},
+        # Mantém o zoom e o arraste do usuário entre atualizações
+        uirevision='trajeto',
+    )
+    return fig
+
+
+class FigureCache:
+    """Figuras montadas uma vez por configuração e atualizadas no lugar.
+
+    Montar um go.Figure valida a árvore inteira de propriedades a cada
+    refresh; aqui só o valor do gauge (ou os pontos da série) é trocado.
+    O ganho é só na montagem: o st.plotly_chart ainda serializa a
+    especificação inteira a cada chamada, e uma figura alterada vai inteira
+    para o navegador (o Plotly no Streamlit não tem atualização parcial de
+    traces). Sem amostra nova, history() devolve a mesma figura e o
+    ForwardMsgCache do Streamlit manda só a referência da mensagem.
+    As figuras são alteradas no lugar, então cada sessão do Streamlit deve
+    ter o seu cache.
+    """
+
+    def __init__(self):
+        self._figures = {}
+        self._sources = {}
+        self.built = 0
+        self.updated = 0
+
+    def gauge(self, value, title, min_val, max_val, suffix=""):
+        key = ('gauge', title, min_val, max_val, suffix)
+        fig = self._figures.get(key)
+        if fig is None:
+            fig = self._figures[key] = create_gauge(value, title, min_val, max_val, suffix)
+            self.built += 1
+        elif fig.data[0].value != value:
+            fig.data[0].value = value
+            self.updated += 1
+        return fig
+
+    def history(self, ts, values, title, unit):
+        """Série de histórico; ts em ns UTC (int64) como devolvido por DeviceState.window,
+        mostrado no horário local"""
+        key = ('history', title, unit)
+        fig = self._figures.get(key)
+        source = self._sources.get(key)
+        if source is not None and source[0] is ts and source[1] is values:
+            # O DownsampleCache devolve os mesmos arrays enquanto não chega amostra nova
+            return fig
+        x = local_time(ts)
+        if fig is None:
+            fig = self._figures[key] = create_history_chart(x, values, title, unit)
+            self.built += 1
+        else:
+            with fig.batch_update():
+                fig.data[0].x = x
+                fig.data[0].y = values
+            self.updated += 1
+        self._sources[key] = (ts, values)
+        return fig
+
+    def track(self, lines, last, zoom):
+        """Mapa do trajeto sem o streamlit-folium (ver maps.py); lines são os trechos de
+        DeviceState.track_view. O st.plotly_chart envia a figura inteira a cada atualização"""
+        key = ('track', zoom)
+        fig = self._figures.get(key)
+        if fig is None:
+            fig = self._figures[key] = create_track_map(lines, last, zoom)
+            self.built += 1
+        else:
+            lats, lons = track_lines(lines)
+            with fig.batch_update():
+                fig.data[0].lat, fig.data[0].lon = lats, lons
+                fig.data[1].lat, fig.data[1].lon = [last[0]], [last[1]]
+            self.updated += 1
+        return fig
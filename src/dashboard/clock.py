@@ -0,0 +1,86 @@
+"""Base de tempo do dashboard.
+
+Todo timestamp guardado é UTC desde a época: us no log bruto, ns no
+histórico, nos agregados, nos alarmes e no arquivo Parquet. O horário
+local só aparece na exibição (local_time) e na entrada de horários pelo
+usuário (utc_from_local), sempre com o deslocamento do próprio instante:
+a troca do horário de verão não desloca o que já foi gravado.
+"""
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+NS_PER_HOUR = 3_600_000_000_000
+
+
+class ClockAnchor:
+    """Leva os timestamps do ESP32 (us, relógio próprio) para UTC (us).
+
+    O relógio do ESP32 pode não estar sincronizado, mas anda junto com o
+    local: o deslocamento entre os dois é estimado uma vez por lote como
+    agora - frame mais recente, que nunca é menor que o deslocamento real,
+    e vale o menor dos últimos `window_s` segundos (o lote com menor
+    atraso). Se o relógio do ESP32 voltar (reinício), as estimativas
+    antigas são descartadas. Os timestamps devolvidos nunca voltam no
+    tempo, nem dentro do lote nem entre lotes.
+    """
+
+    def __init__(self, window_s=60):
+        self.window_us = int(window_s * 1_000_000)
+        # Estimativas (agora, deslocamento) com deslocamentos crescentes: a primeira é o mínimo
+        self._estimates = deque()
+        self._newest = None
+        self.last_us = 0
+
+    @property
+    def offset(self):
+        """Deslocamento atual (us) do relógio do ESP32 para UTC, ou None"""
+        return self._estimates[0][1] if self._estimates else None
+
+    def __call__(self, frames, now_us=None):
+        """Cópia dos frames com timestamps em UTC (us)"""
+        frames = frames.copy()
+        if not len(frames):
+            return frames
+        if now_us is None:
+            now_us = time.time_ns() // 1000
+        ts = frames['timestamp'].astype(np.int64)
+        newest = int(ts.max())
+        if self._newest is not None and newest < self._newest:
+            self._estimates.clear()
+        self._newest = newest
+
+        estimate = now_us - newest
+        while self._estimates and self._estimates[-1][1] >= estimate:
+            self._estimates.pop()
+        self._estimates.append((now_us, estimate))
+        while self._estimates[0][0] < now_us - self.window_us:
+            self._estimates.popleft()
+
+        ts = np.maximum.accumulate(np.maximum(ts + self.offset, self.last_us))
+        self.last_us = int(ts[-1])
+        frames['timestamp'] = ts
+        return frames
+
+
+def local_time(timestamps):
+    """datetime64[ns] no horário local de timestamps UTC em ns, só para exibição.
+
+    O deslocamento vem de time.localtime() no início de cada hora UTC, então
+    amostras dos dois lados de uma troca de horário de verão ficam certas.
+    """
+    ts = np.asarray(timestamps, dtype=np.int64)
+    hours, inverse = np.unique(ts // NS_PER_HOUR, return_inverse=True)
+    offsets = np.array([time.localtime(hour * 3600).tm_gmtoff for hour in hours.tolist()],
+                       dtype=np.int64)
+    return (ts + offsets[inverse.reshape(ts.shape)] * 1_000_000_000).view('datetime64[ns]')
+
+
+def utc_from_local(value):
+    """datetime64[ns] UTC de um horário local ISO 8601 (ex.: '2024-05-01T06:00')"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return np.datetime64(moment.astimezone(timezone.utc).replace(tzinfo=None), 'ns')
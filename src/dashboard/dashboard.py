@@ -8,6 +8,8 @@ import time
 import folium
 from streamlit_folium import st_folium
 from src.esp32.isobus.j1939_parser import J1939Parser
+from clock import local_time
+from timeseries import RingBuffer
 
 # Classe principal do dashboard
 class Dashboard:
@@ -25,8 +27,8 @@ class Dashboard:
         st.title("🚜 Monitor ISOBUS - John Deere")
         
     def init_session_state(self):
-        if 'dados_historicos' not in st.session_state:
-            st.session_state.dados_historicos = pd.DataFrame()
+        if 'historico_rpm' not in st.session_state:
+            st.session_state.historico_rpm = RingBuffer(500)
         if 'parser' not in st.session_state:
             st.session_state.parser = J1939Parser()
             
@@ -39,9 +41,17 @@ class Dashboard:
             
     def run(self):
         if st.sidebar.button("Iniciar Monitoramento"):
-            while True:
-                self.update_dashboard()
-                time.sleep(self.intervalo)
+            st.session_state.monitorando = True
+        if not st.session_state.get('monitorando'):
+            return
+        # Só o painel de dados é reexecutado a cada intervalo, sem prender a thread do script
+        fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+        if fragment is not None:
+            fragment(run_every=self.intervalo)(self.update_dashboard)()
+        else:
+            self.update_dashboard()
+            time.sleep(self.intervalo)
+            st.rerun()
                 
     def update_dashboard(self):
         dados = self.get_data()
@@ -73,17 +83,16 @@ class Dashboard:
             st.metric("Carga", f"{engine.get('load', 0):.1f}%")
             
     def update_charts(self, dados):
-        # Atualiza histórico
-        if len(st.session_state.dados_historicos) > self.max_pontos:
-            st.session_state.dados_historicos = (
-                st.session_state.dados_historicos.iloc[-self.max_pontos:]
-            )
+        # Atualiza histórico (buffer circular com capacidade do maior valor do slider)
+        historico = st.session_state.historico_rpm
+        historico.append(time.time_ns(), dados.get('engine', {}).get('engine_speed', 0))
+        timestamps, valores = historico.last(self.max_pontos)
         
         # Gráfico RPM
         fig = px.line(
-            st.session_state.dados_historicos,
-            x='timestamp',
-            y='engine_speed',
+            x=local_time(timestamps),
+            y=valores,
+            labels={'x': 'timestamp', 'y': 'engine_speed'},
             title='RPM do Motor'
         )
         st.plotly_chart(fig, use_container_width=True)
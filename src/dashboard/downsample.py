@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def minmax(timestamps, values, target):
+    """Reduz a série a ~target pontos mantendo o mínimo e o máximo de cada bucket.
+
+    Picos e vales sempre sobrevivem, o que importa para RPM e temperatura.
+    """
+    n = len(values)
+    if n <= target or target < 4:
+        return timestamps, values
+
+    buckets = target // 2
+    size = -(-n // buckets)
+    rows = -(-n // size)
+    padded = np.full(rows * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(rows, size)
+
+    base = np.arange(rows) * size
+    idx = np.concatenate((
+        base + np.nanargmin(padded, axis=1),
+        base + np.nanargmax(padded, axis=1),
+        [0, n - 1],
+    ))
+    idx = np.unique(idx)
+    return timestamps[idx], values[idx]
+
+
+def lttb(timestamps, values, target):
+    """Largest-Triangle-Three-Buckets: ~target pontos preservando a forma visual"""
+    n = len(values)
+    if n <= target or target < 3:
+        return timestamps, values
+
+    x = (timestamps - timestamps[0]).astype(np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    edges = np.linspace(1, n - 1, target - 1).astype(np.int64)
+
+    idx = np.empty(target, dtype=np.int64)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(target - 2):
+        start, end = edges[i], edges[i + 1]
+        # Média do próximo bucket (ou o último ponto)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = end if end < next_end else n - 1
+        cx = x[next_start:next_end].mean()
+        cy = y[next_start:next_end].mean()
+
+        area = np.abs((x[a] - cx) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+
+    return timestamps[idx], values[idx]
+
+
+METHODS = {'minmax': minmax, 'lttb': lttb}
+
+
+class DownsampleCache:
+    """Cache de séries reduzidas por (sinal, janela, alvo, método).
+
+    Cada entrada guarda a versão do sinal no armazenamento; enquanto nada
+    novo for gravado, a redução não é recalculada.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        result = compute()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import metrics
+from frames import advance_cursor, cursor_params, fetch_frames
+from ingest import DeviceState
+from signal_db import SPNS
+
+
+class CircuitBreaker:
+    """Afasta um ESP32 que parou de responder.
+
+    Depois de `failure_threshold` falhas seguidas o circuito abre e o
+    dispositivo fica sem consultas por um backoff exponencial; ao fim do
+    backoff uma única consulta de teste (meio-aberto) decide se ele volta.
+    """
+
+    CLOSED = "fechado"
+    OPEN = "aberto"
+    HALF_OPEN = "meio-aberto"
+
+    def __init__(self, failure_threshold=3, base_backoff=2.0, max_backoff=60.0):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+    def allow(self, now):
+        if self.state == self.OPEN and now >= self.open_until:
+            self.state = self.HALF_OPEN
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self, now):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trips += 1
+            backoff = min(self.base_backoff * 2 ** (self.trips - 1), self.max_backoff)
+            self.state = self.OPEN
+            self.open_until = now + backoff
+
+
+class FleetDevice:
+    """Um ESP32 da frota: conexão keep-alive, circuit breaker e histórico próprios"""
+
+    def __init__(self, ip, timeout, log_dir=None, database=None, archive_dir=None, **state_options):
+        self.ip = ip
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.breaker = CircuitBreaker()
+        self.state = DeviceState(ip, log_dir=log_dir, database=database, archive_dir=archive_dir,
+                                 **state_options)
+        self.in_flight = False
+        self.latency = None
+        self.last_error = None
+        # Próximo número de sequência a pedir (None: snapshot do buffer)
+        self.cursor = None
+
+    def snapshot(self):
+        return self.state.snapshot()
+
+    def window(self, tipo, seconds, max_points=None, method='minmax'):
+        return self.state.window(tipo, seconds, max_points, method)
+
+    def total(self, tipo, seconds):
+        return self.state.total(tipo, seconds)
+
+    def track_view(self, zoom):
+        return self.state.track_view(zoom)
+
+
+class FleetPoller(threading.Thread):
+    """Consulta N ESP32 em paralelo com um pool de threads limitado.
+
+    Cada ciclo dispara as consultas de todos os dispositivos liberados pelo
+    circuit breaker ao mesmo tempo, então uma atualização da frota leva
+    cerca do tempo da consulta mais lenta, limitado pelo timeout de cada um.
+    Um dispositivo com consulta ainda em andamento é pulado no ciclo.
+    """
+
+    def __init__(self, ips, transport="Binário", interval=2.0, timeout=2.0, timeouts=None,
+                 max_workers=16, log_dir=None, database=None, archive_dir=None, **state_options):
+        super().__init__(daemon=True)
+        self.transport = transport
+        self.interval = interval
+        self.devices = {
+            ip: FleetDevice(
+                ip,
+                (timeouts or {}).get(ip, timeout),
+                os.path.join(log_dir, ip.replace(':', '_')) if log_dir else None,
+                database,
+                os.path.join(archive_dir, ip.replace(':', '_')) if archive_dir else None,
+                **state_options,
+            )
+            for ip in ips
+        }
+        self._pool = ThreadPoolExecutor(max_workers=min(max_workers, max(len(ips), 1)),
+                                        thread_name_prefix="fleet")
+        self._stop_event = threading.Event()
+        self.cycles = 0
+
+    def run(self):
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            for device in self.devices.values():
+                if not device.in_flight and device.breaker.allow(started):
+                    device.in_flight = True
+                    self._pool.submit(self._poll, device)
+            self.cycles += 1
+            self._stop_event.wait(max(0, self.interval - (time.monotonic() - started)))
+
+    def _fetch(self, device):
+        since = 0 if device.cursor is None else device.cursor
+        if self.transport == "Texto (debug)":
+            started = metrics.clock()
+            try:
+                response = device.session.get(f"http://{device.ip}/api/data", params=cursor_params(since),
+                                              timeout=device.timeout)
+                response.raise_for_status()
+            except Exception:
+                metrics.FETCH_ERRORS.inc(1, "data")
+                raise
+            metrics.FETCH_SECONDS.observe_since(started, "data")
+            return response.json()
+        status, frames = fetch_frames(device.ip, timeout=device.timeout, session=device.session,
+                                      since=since)
+        return dict(status, frames=frames)
+
+    def _poll(self, device):
+        started = time.monotonic()
+        try:
+            data = self._fetch(device)
+            device.latency = time.monotonic() - started
+            device.cursor, more = advance_cursor(data, device.cursor)
+            device.state.ingest(data)
+            # Lote cheio: o buffer do ESP32 tem mais frames, consulta de novo sem esperar o ciclo
+            while more and not self._stop_event.is_set():
+                data = self._fetch(device)
+                device.cursor, more = advance_cursor(data, device.cursor)
+                device.state.ingest(data)
+        except Exception as e:
+            device.last_error = str(e)
+            device.breaker.record_failure(time.monotonic())
+            device.state.ingest(None)
+        else:
+            device.last_error = None
+            device.breaker.record_success()
+        finally:
+            device.in_flight = False
+
+    def overview(self, roles=("rpm", "velocidade", "temperatura", "combustivel", "carga")):
+        """Uma linha por dispositivo para a tabela da frota; as colunas de sinais
+        são resolvidas pelo SPN (signal_db.SPNS) na base de cada dispositivo"""
+        rows = []
+        for ip, device in self.devices.items():
+            database = device.state.database
+            snapshot = device.snapshot()
+            row = {
+                "ESP32": ip,
+                "Conectado": snapshot['connected'],
+                "Circuito": device.breaker.state,
+                "Latência (ms)": round(device.latency * 1000) if device.latency is not None else None,
+                "Última leitura": snapshot['last_update'],
+                "Erro": device.last_error or "",
+                "Perdidos": snapshot['frames_lost'],
+                "Alarmes": ", ".join(name for name, _ in snapshot['alarms']),
+            }
+            for role in roles:
+                name = database.spn_name(SPNS[role])
+                if name is not None:
+                    row[name] = snapshot['latest'].get(name)
+            rows.append(row)
+        return rows
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout=5)
+        # Consultas em andamento terminam (limitadas pelo timeout) antes de fechar os logs
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        for device in self.devices.values():
+            device.state.close()
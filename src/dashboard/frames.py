@@ -0,0 +1,91 @@
+import numpy as np
+import requests
+
+import metrics
+from j1939_parser import FRAME_DTYPE
+
+# Frames pedidos por consulta com cursor (?since=&limit=); o firmware limita ao tamanho
+# do buffer (MAX_FRAMES), então um lote cheio quer dizer que ainda há frames esperando
+CURSOR_BATCH = 256
+
+
+def decode_frames(buf):
+    """Interpreta registros binários do ESP32 como array estruturado, sem copiar"""
+    view = memoryview(buf)
+    usable = len(view) - len(view) % FRAME_DTYPE.itemsize
+    return np.frombuffer(view[:usable], dtype=FRAME_DTYPE)
+
+
+def frames_to_messages(frames):
+    """Converte frames para o formato texto "ID: 0x... Data: ..." (terminal CAN)"""
+    return [
+        f"ID: 0x{int(frame['can_id']):X} Data: {bytes(frame['data'][:frame['dlc']]).hex()}"
+        for frame in frames
+    ]
+
+
+def messages_to_frames(messages, timestamp_us):
+    """Converte mensagens texto para registros FRAME_DTYPE, ignorando as inválidas"""
+    frames = np.zeros(len(messages), dtype=FRAME_DTYPE)
+    count = 0
+    for msg in messages:
+        try:
+            can_id = int(msg.split("ID: ")[1].split(" Data:")[0], 16)
+            data = bytes.fromhex(msg.split("Data: ")[1].strip())[:8]
+        except (IndexError, ValueError):
+            continue
+        frame = frames[count]
+        frame['timestamp'] = timestamp_us
+        frame['can_id'] = can_id
+        frame['dlc'] = len(data)
+        frame['data'][:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        count += 1
+    return frames[:count]
+
+
+def cursor_params(since):
+    """Query string de uma consulta com cursor (nenhuma se since é None)"""
+    return None if since is None else {'since': since, 'limit': CURSOR_BATCH}
+
+
+def fetch_frames(ip, timeout=3, session=None, since=None):
+    """Busca /api/frames.bin e retorna (status WiFi, frames).
+
+    Com since, pede só os frames a partir desse número de sequência; o
+    status traz então 'seq' (cursor da próxima consulta) e 'gap' (frames
+    perdidos), se o firmware suportar.
+    """
+    http = session or requests
+    started = metrics.clock()
+    try:
+        response = http.get(f"http://{ip}/api/frames.bin", params=cursor_params(since),
+                            timeout=timeout)
+        response.raise_for_status()
+    except Exception:
+        metrics.FETCH_ERRORS.inc(1, "frames.bin")
+        raise
+    metrics.FETCH_SECONDS.observe_since(started, "frames.bin")
+    status = {
+        'wifi_ssid': response.headers.get('X-WiFi-SSID', ''),
+        'wifi_ip': response.headers.get('X-WiFi-IP') or ip,
+        'wifi_signal': int(response.headers.get('X-WiFi-Signal', 0)),
+    }
+    if 'X-Seq' in response.headers:
+        status['seq'] = int(response.headers['X-Seq'])
+        status['gap'] = int(response.headers.get('X-Gap', 0))
+    return status, decode_frames(response.content)
+
+
+def advance_cursor(data, cursor):
+    """Cursor depois de uma resposta: (próximo since, ainda há frames no buffer).
+
+    Resposta sem 'seq' (firmware antigo ou falha) volta para o snapshot
+    inteiro. Na primeira consulta, o que saiu do buffer antes de conectar
+    não conta como perda.
+    """
+    if data is None or 'seq' not in data:
+        return None, False
+    if cursor is None:
+        data['gap'] = 0
+    count = len(data['frames']) if 'frames' in data else len(data.get('can_messages', ()))
+    return data['seq'], count >= CURSOR_BATCH
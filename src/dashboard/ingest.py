@@ -0,0 +1,428 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+import archive
+import metrics
+from alarms import AlarmEngine, AlarmLog, load_rules
+from downsample import METHODS, DownsampleCache
+from latest import LatestTable
+from clock import ClockAnchor
+from frames import advance_cursor, cursor_params, fetch_frames, frames_to_messages, messages_to_frames
+from j1939_parser import J1939Parser
+from rawlog import RawLogWriter
+from rollup import TIERS, RollupStore, rollup_series
+from signal_db import SIMULATOR_DATABASE, SPNS, load_database, pgn_of, pgns_of
+from stream_client import FrameStream
+from timeseries import SignalStore, frame_groups
+from track import TrackStore
+
+TRANSPORTS = ("Streaming", "Binário", "Texto (debug)")
+
+# Heartbeat do change_only (s): abaixo do max_gap dos agregados, para a integral
+# por retenção do valor anterior não perder os trechos de valor constante, e do
+# prazo em que uma ECU é dada como parada (5 s)
+CHANGE_HEARTBEAT = 2.0
+
+
+# Função para buscar dados do ESP32; test_mode (modo demonstração) inventa dados se não houver conexão
+def get_can_data(ip, test_mode=False, session=None, since=None):
+    http = session or requests
+    started = metrics.clock()
+    try:
+        response = http.get(f"http://{ip}/api/data", params=cursor_params(since), timeout=3)
+        if response.status_code == 200:
+            metrics.FETCH_SECONDS.observe_since(started, "data")
+            return response.json()
+        metrics.FETCH_ERRORS.inc(1, "data")
+    except:
+        metrics.FETCH_ERRORS.inc(1, "data")
+        # Dados simulados, só no modo demonstração; marcados para não irem para o disco
+        if test_mode:
+            return {
+                'simulated': True,
+                'wifi_ssid': 'TEST_NETWORK',
+                'wifi_ip': ip,
+                'wifi_signal': -65,
+                'can_messages': [
+                    f"ID: 0xCF00400 Data: {format(int(np.random.normal(1500, 300)), '04x')}",
+                    f"ID: 0xCF00500 Data: {format(int(np.random.normal(30, 5)), '04x')}",
+                    f"ID: 0xCFEE600 Data: {format(int(np.random.normal(90, 10)), '04x')}",
+                    f"ID: 0xCF00700 Data: {format(int(np.random.normal(75, 15)), '04x')}",
+                    f"ID: 0xCF00800 Data: {format(int(np.random.normal(60, 20)), '04x')}"
+                ]
+            }
+    return None
+
+
+def get_can_frames(ip, test_mode=False, session=None, since=None):
+    """Busca frames no endpoint binário; cai para o JSON em texto se falhar"""
+    try:
+        status, frames = fetch_frames(ip, session=session, since=since)
+        return dict(status, frames=frames)
+    except Exception:
+        return get_can_data(ip, test_mode, session, since)
+
+
+def process_can_messages(messages, database=None):
+    if not messages:
+        return pd.DataFrame()
+
+    database = database or load_database(SIMULATOR_DATABASE)
+    started = metrics.clock()
+    data = []
+    # Mensagens texto não têm timestamp: horário de chegada, em UTC
+    current_time = pd.Timestamp(time.time_ns())
+
+    for msg in messages:
+        try:
+            id_hex = msg.split("ID: ")[1].split(" Data:")[0]
+            data_hex = msg.split("Data: ")[1].strip()
+
+            can_id = int(id_hex, 16)
+            can_data = bytes.fromhex(data_hex)
+
+            for signal_id, value in database.decode(can_id, can_data) or ():
+                data.append({"timestamp": current_time, "tipo": database.signals[signal_id][0],
+                             "valor": value, "pgn": pgn_of(can_id), "origem": can_id & 0xFF,
+                             "sinal": signal_id})
+        except:
+            metrics.DROPPED.inc(1, "unparseable")
+            continue
+
+    df = pd.DataFrame(data)
+    metrics.DECODE_SECONDS.observe_since(started, "messages")
+    return df
+
+
+def process_can_frames(frames, database=None):
+    """Versão vetorizada de process_can_messages para o array binário de frames.
+
+    Os timestamps dos frames já devem estar em UTC (us), ver ClockAnchor.
+    """
+    if len(frames) == 0:
+        return pd.DataFrame()
+
+    database = database or load_database(SIMULATOR_DATABASE)
+    started = metrics.clock()
+    index, signals, values = database.decode_batch(frames['can_id'], frames['data'], frames['dlc'])
+    if not len(index):
+        metrics.DECODE_SECONDS.observe_since(started, "frames")
+        return pd.DataFrame()
+
+    timestamps = (frames['timestamp'].astype(np.int64) * 1000).view('datetime64[ns]')
+
+    names = np.array([name for name, _ in database.signals], dtype=object)
+    can_ids = frames['can_id'][index]
+    df = pd.DataFrame({
+        "timestamp": timestamps[index],
+        "tipo": names[signals],
+        "valor": values,
+        "pgn": pgns_of(can_ids),
+        "origem": can_ids & 0xFF,
+        "sinal": signals,
+    }).sort_values("timestamp", kind="stable", ignore_index=True)
+    metrics.DECODE_SECONDS.observe_since(started, "frames")
+    return df
+
+
+class DeviceState:
+    """Estado decodificado de um ESP32: histórico, últimos valores e terminal.
+
+    Recebe os dados de um coletor (IngestWorker ou FleetPoller) por ingest()
+    e atende as sessões do Streamlit por snapshot() e window().
+    """
+
+    def __init__(self, ip, capacity=200_000, terminal_size=50, log_dir=None, database=None,
+                 alarm_rules=None, archive_dir=None, raw_log=True, history=True, archive_suffix="",
+                 rollup_tiers=TIERS, change_only=False):
+        self.ip = ip
+        # Sem history, só status, contadores e alarmes: o histórico e os últimos
+        # valores ficam em outro lugar (decodificadores do pipeline)
+        self.history = history
+        # Base de sinais (DBC/JSON) usada na decodificação
+        self.database = database or load_database(SIMULATOR_DATABASE)
+        self._lock = threading.Lock()
+        self.store = SignalStore(capacity)
+        # Agregados (padrão: 1 s / 1 min / 1 h) para janelas que o histórico bruto não cobre
+        self.rollups = RollupStore(rollup_tiers)
+        self.downsample_cache = DownsampleCache()
+        # Log bruto em disco de todos os frames recebidos (opcional)
+        self.raw_log = None
+        if log_dir and raw_log:
+            try:
+                self.raw_log = RawLogWriter(log_dir)
+            except RuntimeError as e:
+                print(f"{e}: log bruto desativado para {ip}")
+        # Arquivo Parquet dos sinais decodificados (opcional, precisa do pyarrow)
+        self.archive = None
+        if archive_dir:
+            if archive.available():
+                self.archive = archive.SignalArchiveWriter(archive_dir, self.database.signals,
+                                                           suffix=archive_suffix)
+            else:
+                print("pyarrow não instalado: arquivo Parquet dos sinais desativado")
+        self._messages = deque(maxlen=terminal_size)
+        # DM1, VIN e identificação de software, de frame único ou remontados do
+        # TP.CM/TP.DT (o remontador usa o timestamp dos frames como relógio).
+        # Com change_only, amostras que repetem o último valor do sinal na mesma
+        # origem são descartadas antes do histórico, dos agregados e do arquivo
+        self.change_only = change_only
+        self.parser = J1939Parser(self.database, change_only=change_only, heartbeat=CHANGE_HEARTBEAT)
+        self._diagnostics = deque(maxlen=terminal_size)
+        self.status = None
+        # Último valor por (PGN, origem, sinal), lido pelos gauges
+        self.table = LatestTable(self.database.signals, self.database.spns)
+        # Trajeto GPS montado com a latitude e a longitude decodificadas (SPN 584/585)
+        self.track = TrackStore()
+        self._latitude = self.database.signal_ids(SPNS['latitude'])
+        self._longitude = self.database.signal_ids(SPNS['longitude'])
+        # Regras de alarme (padrão: signals/alarms.json) e eventos disparados/normalizados
+        self.alarms = AlarmEngine(load_rules() if alarm_rules is None else alarm_rules, self.database)
+        self.alarm_log = AlarmLog(os.path.join(log_dir, 'alarms.jsonl') if log_dir else None)
+        # Relógio do ESP32 -> UTC, estável entre lotes para o histórico não voltar no tempo
+        self.clock = ClockAnchor()
+        self.last_update = None
+        self.frames_total = 0
+        # Frames que saíram do buffer do ESP32 antes de serem lidos
+        self.frames_lost = 0
+
+    def ingest(self, data):
+        """Decodifica uma resposta do ESP32 (ou None, se a coleta falhou)"""
+        if data is None:
+            with self._lock:
+                self.status = None
+            return
+
+        # Dados do modo demonstração ficam só na memória: nada de log bruto, arquivo ou alarmes
+        persist = not data.get('simulated', False)
+        if 'frames' in data:
+            frames = self.clock(data['frames'])
+            df = process_can_frames(frames, self.database)
+            messages = frames_to_messages(frames[-self._messages.maxlen:])
+            count = len(frames)
+        else:
+            df = process_can_messages(data['can_messages'], self.database)
+            messages = data['can_messages']
+            count = len(messages)
+            # Também para o remontador do TP: mesmas mensagens, como registros binários
+            frames = messages_to_frames(messages, time.time_ns() // 1000)
+        metrics.count_frames(frames['can_id'])
+        if self.raw_log is not None and persist:
+            self.raw_log.append(frames)
+        status = {key: data[key] for key in ('wifi_ssid', 'wifi_ip', 'wifi_signal', 'simulated') if key in data}
+        self.record_lost(data.get('gap', 0))
+        self.ingest_decoded(df, status, count, messages, persist, self.decode_messages(frames))
+
+    def decode_messages(self, frames):
+        """Linhas de DM1/VIN/software dos frames (timestamps em us UTC), com o TP remontado"""
+        if not len(frames):
+            return []
+        return self.parser.parse_messages(frames['can_id'], frames['data'],
+                                          frames['timestamp'].astype(np.int64) * 1000, frames['dlc'])
+
+    def record_lost(self, count):
+        """Soma frames que o ESP32 descartou antes de serem lidos (lacunas do cursor ou do stream)"""
+        if count:
+            metrics.DROPPED.inc(count, "gap")
+            with self._lock:
+                self.frames_lost += count
+
+    def ingest_decoded(self, df, status, count, messages=(), persist=True, diagnostics=()):
+        """Grava amostras já decodificadas de `count` frames.
+
+        df tem as colunas timestamp, tipo e valor, mais pgn, origem e sinal
+        (id na base) para a tabela de últimos valores e os alarmes;
+        diagnostics são linhas de decode_messages(). Com persist=False nada
+        vai para o log de alarmes nem para o arquivo.
+        """
+        started = metrics.clock()
+        events = ()
+        received = not df.empty
+        if self.change_only and received:
+            df = self._changes(df)
+        with self._lock:
+            self.status = status
+            self.frames_total += count
+            self._messages.extend(messages)
+            self._diagnostics.extend(diagnostics)
+            if not df.empty:
+                timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+                if self.history:
+                    for signal, signal_ts, values in frame_groups(df):
+                        self.store.extend(signal, signal_ts, values)
+                        self.rollups.extend(signal, signal_ts, values)
+                    self.table.update(df['pgn'].to_numpy(), df['origem'].to_numpy(),
+                                      df['sinal'].to_numpy(), timestamps, df['valor'].to_numpy())
+                    self._update_track(timestamps, df['sinal'].to_numpy(), df['valor'].to_numpy())
+                events = self.alarms.evaluate(timestamps, df['sinal'].to_numpy(), df['valor'].to_numpy())
+            if received:
+                self.last_update = datetime.now()
+        # Log de alarmes e arquivo Parquet fora do lock; o arquivo só enfileira
+        if not persist:
+            events = ()
+        self.alarm_log.extend(events)
+        if self.archive is not None and persist and not df.empty:
+            self.archive.append(timestamps, df['sinal'].to_numpy(), df['valor'].to_numpy(),
+                                df['pgn'].to_numpy(), df['origem'].to_numpy())
+        if started:
+            metrics.STORE_SECONDS.observe_since(started)
+            metrics.HISTORY_SAMPLES.set(len(self.store), self.ip)
+
+    def _changes(self, df):
+        """Só as linhas que o change_only do parser emite"""
+        keep = self.parser.select_changes(
+            df['origem'].to_numpy().astype(np.int64), df['sinal'].to_numpy(),
+            df['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64), df['valor'].to_numpy())
+        return df[keep].reset_index(drop=True)
+
+    def _update_track(self, timestamps, signals, values):
+        """Latitude e longitude do mesmo frame (mesmo timestamp) viram um fix do trajeto"""
+        if not self._latitude or not self._longitude:
+            return
+        lat = np.isin(signals, self._latitude)
+        if not lat.any():
+            return
+        lon = np.isin(signals, self._longitude)
+        _, i, j = np.intersect1d(timestamps[lat], timestamps[lon], return_indices=True)
+        self.track.extend(values[lat][i], values[lon][j])
+
+    def track_view(self, zoom):
+        """Trajeto simplificado para o zoom: (trechos fechados, trechos, cauda, última posição)"""
+        with self._lock:
+            return (self.track.frozen_chunks, self.track.frozen(zoom), self.track.tail(zoom),
+                    self.track.last())
+
+    def snapshot(self):
+        """Cópia consistente do estado atual para renderização"""
+        with self._lock:
+            return {
+                'status': self.status,
+                'connected': self.status is not None,
+                'latest': self.table.values(),
+                'sources': self.table.sources(time.time_ns()),
+                'messages': list(self._messages),
+                'diagnostics': list(self._diagnostics),
+                'last_update': self.last_update,
+                'frames_total': self.frames_total,
+                'frames_lost': self.frames_lost,
+                'alarms': self.alarms.active_alarms(),
+                'alarm_events': [event.to_dict() for event in self.alarm_log.recent(20)],
+            }
+
+    def diagnostics(self):
+        """Últimas linhas de DM1/VIN/software recebidas"""
+        with self._lock:
+            return list(self._diagnostics)
+
+    def window(self, tipo, seconds, max_points=None, method='minmax'):
+        """Amostras (timestamps ns, valores) de um sinal nos últimos `seconds` segundos.
+
+        Com max_points, a série é reduzida para no máximo ~max_points pontos;
+        o resultado fica em cache até chegar uma nova amostra do sinal. Se o
+        histórico bruto não alcança a janela, a série vem dos agregados.
+        """
+        if max_points is None:
+            return self.store.window(tipo, seconds)
+        if not self.store.covers(tipo, seconds):
+            return self.downsample_cache.get(
+                ('rollup', tipo, seconds, max_points, method),
+                self.store.version(tipo),
+                lambda: self._rollup_window(tipo, seconds, max_points, method),
+            )
+        return self.downsample_cache.get(
+            (tipo, seconds, max_points, method),
+            self.store.version(tipo),
+            lambda: METHODS[method](*self.store.window(tipo, seconds), max_points),
+        )
+
+    def _rollup_window(self, tipo, seconds, max_points, method):
+        resolution, rows = self.rollups.window(tipo, seconds, max_points)
+        return rollup_series(rows, resolution, method)
+
+    def total(self, tipo, seconds):
+        """Integral de um sinal nos últimos `seconds` segundos, em valor x hora
+        (ex.: litros a partir do consumo em L/h)"""
+        return self.rollups.total(tipo, seconds) / 3600
+
+    def close(self):
+        if self.raw_log is not None:
+            self.raw_log.close()
+        if self.archive is not None:
+            self.archive.close()
+
+
+class IngestWorker(threading.Thread):
+    """Coleta e decodifica os frames de um ESP32 em segundo plano.
+
+    Uma instância por ESP32 é compartilhada por todas as sessões do
+    Streamlit; as sessões só leem snapshot() e nunca fazem I/O de rede.
+    """
+
+    def __init__(self, ip, transport="Streaming", interval=1.0, test_mode=False, **state_options):
+        super().__init__(daemon=True)
+        self.ip = ip
+        self.transport = transport
+        self.interval = interval
+        self.test_mode = test_mode
+        self.state = DeviceState(ip, **state_options)
+        self._stop_event = threading.Event()
+        self._stream = None
+        # Número de sequência do próximo frame a pedir ao ESP32 (None: ainda não conhecido)
+        self.cursor = None
+
+    def run(self):
+        if self.transport == "Streaming":
+            asyncio.run(self._run_stream())
+        else:
+            self._run_polling()
+
+    def _run_polling(self):
+        session = requests.Session()
+        fetch = get_can_frames if self.transport == "Binário" else get_can_data
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            # Só os frames novos; lote cheio quer dizer buffer do ESP32 com mais frames,
+            # então consulta de novo sem esperar e só dorme depois de um lote parcial
+            data = fetch(self.ip, self.test_mode, session, 0 if self.cursor is None else self.cursor)
+            self.cursor, more = advance_cursor(data, self.cursor)
+            self.state.ingest(data)
+            if not more:
+                self._stop_event.wait(max(0, self.interval - (time.monotonic() - started)))
+
+    async def _run_stream(self):
+        self._stream = FrameStream(self.ip)
+        dropped = 0
+        async for frames in self._stream.batches():
+            gap, dropped = self._stream.dropped - dropped, self._stream.dropped
+            self.state.ingest(dict(self._stream.status, frames=frames, gap=gap))
+            if self._stop_event.is_set():
+                self._stream.closed = True
+
+    def snapshot(self):
+        return self.state.snapshot()
+
+    def window(self, tipo, seconds, max_points=None, method='minmax'):
+        return self.state.window(tipo, seconds, max_points, method)
+
+    def total(self, tipo, seconds):
+        return self.state.total(tipo, seconds)
+
+    def track_view(self, zoom):
+        return self.state.track_view(zoom)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._stream is not None:
+            self._stream.closed = True
+        # Espera a coleta em andamento: o próximo worker deste ESP32 reabre o mesmo log
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout=10)
+        self.state.close()
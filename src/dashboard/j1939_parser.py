@@ -1,5 +1,50 @@
 from datetime import datetime
-import struct
+import time
+import numpy as np
+
+import metrics
+from j1939_transport import TransportReassembler
+from signal_db import load_database, pgn_of, pgns_of
+
+# Registro binário de um frame CAN: timestamp (us), ID de 29 bits, DLC e 8 bytes de dados
+FRAME_DTYPE = np.dtype([
+    ('timestamp', '<u8'),
+    ('can_id', '<u4'),
+    ('dlc', 'u1'),
+    ('data', 'u1', (8,)),
+])
+
+
+class SignalBatch:
+    """Resultado colunar de um lote decodificado"""
+
+    def __init__(self, timestamp, pgn, source, signal, value, messages=None, signals=()):
+        self.timestamp = timestamp  # int64, ns desde a época
+        self.pgn = pgn
+        self.source = source
+        self.signal = signal
+        self.value = value
+        # Linhas de mensagens multi-pacote (DM1, VIN...) remontadas neste lote
+        self.messages = messages or []
+        # (nome, unidade) de cada id de sinal
+        self.signals = signals
+
+    def __len__(self):
+        return len(self.value)
+
+    def to_dataframe(self):
+        """Converte para o formato de linhas usado pelo dashboard"""
+        import pandas as pd
+
+        names = np.array([name for name, _ in self.signals] or [""], dtype=object)
+        units = np.array([unit for _, unit in self.signals] or [""], dtype=object)
+        return pd.DataFrame({
+            "timestamp": pd.to_datetime(self.timestamp, unit="ns"),
+            "tipo": names[self.signal],
+            "valor": self.value,
+            "unidade": units[self.signal],
+        })
+
 
 class J1939Parser:
     """Parser para mensagens CAN no protocolo J1939"""
@@ -15,15 +60,39 @@ class J1939Parser:
         0xFEF6: "Intake/Exhaust Conditions",
         0xF000: "Retarder",
         0xFEF5: "Engine Hours/Revolutions",
-        0xFEE9: "Engine Fluid Level/Pressure"
+        0xFEE9: "Engine Fluid Level/Pressure",
+        0xFECA: "DM1 Active Diagnostic Trouble Codes",
+        0xFEEC: "Vehicle Identification",
+        0xFEDA: "Software Identification"
     }
 
-    def __init__(self):
+    # PGNs decodificados só como linhas (SignalBatch.messages) em parse_batch
+    MESSAGE_PGNS = (0xFECA, 0xFEEC, 0xFEDA)
+
+    def __init__(self, database=None, change_only=False, deadband=0.0, relative_deadband=0.0,
+                 deadbands=None, heartbeat=10.0):
+        """change_only: emite um sinal só quando ele sai do deadband em relação
+        ao último valor emitido pela mesma origem (SA), ou quando passa
+        `heartbeat` segundos sem emissão. deadband/relative_deadband valem
+        para todos os sinais; deadbands = {nome: (absoluto, relativo)}
+        sobrepõe por sinal. Com deadband zero, só repetições são descartadas.
+        """
+        # Sinais numéricos vêm da base de sinais (DBC/JSON); DM1/VIN/software são tratados aqui
+        self.database = database or load_database()
+        self.transport = TransportReassembler()
+
+        # Último valor emitido por (SA, id do sinal): (valor, timestamp em ns)
         self.last_values = {}
+        self.change_only = change_only
+        self.heartbeat_ns = int(heartbeat * 1e9) if heartbeat else None
+        limits = [(deadbands or {}).get(name, (deadband, relative_deadband))
+                  for name, _ in self.database.signals]
+        self._deadband = np.array([a for a, _ in limits] or [0.0], dtype=np.float64)
+        self._relative_deadband = np.array([r for _, r in limits] or [0.0], dtype=np.float64)
 
     def get_pgn(self, can_id):
-        """Extrai PGN do ID CAN"""
-        return (can_id >> 8) & 0x1FFFF
+        """Extrai PGN do ID CAN (sem o endereço de destino em PDU1)"""
+        return pgn_of(can_id)
 
     def parse_message(self, msg):
         """Processa uma mensagem CAN"""
@@ -34,108 +103,231 @@ class J1939Parser:
             
             can_id = int(id_hex, 16)
             can_data = bytes.fromhex(data_hex)
-            
-            pgn = self.get_pgn(can_id)
             timestamp = datetime.now()
             
-            # Processa baseado no PGN
-            if pgn == 0xF004:  # Electronic Engine Controller 1
-                return self._parse_engine_data(timestamp, can_data)
-            elif pgn == 0xFEF1:  # Vehicle Speed
-                return self._parse_vehicle_speed(timestamp, can_data)
-            elif pgn == 0xFEEE:  # Engine Temperature
-                return self._parse_temperature(timestamp, can_data)
-            elif pgn == 0xFEF2:  # Fuel Economy
-                return self._parse_fuel(timestamp, can_data)
-            elif pgn == 0xF003:  # Engine Load
-                return self._parse_load(timestamp, can_data)
+            if self.transport.is_transport(can_id):
+                # Mensagem multi-pacote: decodifica quando o último TP.DT chegar; o
+                # relógio do remontador é o mesmo do parse_batch (segundos desde a época)
+                message = self.transport.feed(can_id, can_data, timestamp.timestamp())
+                if message is None:
+                    return None
+                source, pgn, can_data = message
+                can_id = None
+            else:
+                pgn = self.get_pgn(can_id)
+                source = can_id & 0xFF
+            
+            return self.decode(pgn, timestamp, can_data, can_id, source)
             
         except Exception as e:
+            metrics.DROPPED.inc(1, "unparseable")
             print(f"Erro ao processar mensagem: {str(e)}")
             return None
 
-    def _parse_engine_data(self, timestamp, data):
-        """Processa dados do motor"""
+    def decode(self, pgn, timestamp, can_data, can_id=None, source=None):
+        """Decodifica o payload de um PGN, de frame único ou remontado"""
         try:
-            rpm = struct.unpack('>H', data[3:5])[0] * 0.125
-            throttle = data[1] * 0.4
-            
-            return [{
-                "timestamp": timestamp,
-                "tipo": "RPM",
-                "valor": rpm,
-                "unidade": "RPM"
-            }, {
-                "timestamp": timestamp,
-                "tipo": "Acelerador",
-                "valor": throttle,
-                "unidade": "%"
-            }]
-        except:
-            return None
+            if pgn == 0xFECA:  # DM1
+                return self._parse_dm1(timestamp, can_data)
+            elif pgn == 0xFEEC:  # VIN
+                return self._parse_identification(timestamp, can_data, "VIN")
+            elif pgn == 0xFEDA:  # Software ID
+                return self._parse_identification(timestamp, can_data[1:], "Software")
 
-    def _parse_vehicle_speed(self, timestamp, data):
-        """Processa velocidade do veículo"""
-        try:
-            speed = struct.unpack('>H', data[1:3])[0] * 0.00390625
+            values = self.database.decode(can_id, can_data, pgn)
+            if values is None:
+                return None
+            if self.change_only:
+                now = int(timestamp.timestamp() * 1e9)
+                values = [(signal_id, value) for signal_id, value in values
+                          if self._changed((source, signal_id), signal_id, value, now)]
+            signals = self.database.signals
             return [{
                 "timestamp": timestamp,
-                "tipo": "Velocidade",
-                "valor": speed,
-                "unidade": "km/h"
-            }]
-        except:
-            return None
-
-    def _parse_temperature(self, timestamp, data):
-        """Processa temperaturas"""
-        try:
-            engine_temp = data[0] - 40
-            oil_temp = data[1] - 40
+                "tipo": signals[signal_id][0],
+                "valor": value,
+                "unidade": signals[signal_id][1]
+            } for signal_id, value in values]
             
-            return [{
-                "timestamp": timestamp,
-                "tipo": "Temperatura Motor",
-                "valor": engine_temp,
-                "unidade": "°C"
-            }, {
-                "timestamp": timestamp,
-                "tipo": "Temperatura Óleo",
-                "valor": oil_temp,
-                "unidade": "°C"
-            }]
-        except:
+        except Exception as e:
+            metrics.DROPPED.inc(1, "unparseable")
+            print(f"Erro ao processar mensagem: {str(e)}")
             return None
 
-    def _parse_fuel(self, timestamp, data):
-        """Processa dados de combustível"""
+    def parse_batch(self, can_ids, data, timestamps=None, dlc=None):
+        """Decodifica N frames de uma vez e retorna um SignalBatch colunar.
+
+        can_ids: array (N,) de IDs CAN; data: array (N, 8) de payloads.
+        timestamps: ns desde a época (padrão: agora, igual para todo o lote).
+        dlc: tamanho válido de cada payload (padrão: 8). Frames curtos demais
+        para algum sinal do PGN são descartados, como no parse_message.
+        """
+        started = metrics.clock()
+        can_ids = np.asarray(can_ids, dtype=np.uint32)
+        data = np.asarray(data, dtype=np.uint8).reshape(-1, 8)
+        n = len(can_ids)
+        if timestamps is None:
+            timestamps = np.full(n, time.time_ns(), dtype=np.int64)
+        else:
+            timestamps = np.asarray(timestamps, dtype=np.int64)
+        if dlc is not None:
+            dlc = np.asarray(dlc, dtype=np.uint8)
+
+        pgns = pgns_of(can_ids)
+        frames, signals, values = self.database.decode_batch(can_ids, data, dlc)
+        if self.change_only and len(frames):
+            keep = self.select_changes((can_ids[frames] & 0xFF).astype(np.int64), signals,
+                                        timestamps[frames], values)
+            frames, signals, values = frames[keep], signals[keep], values[keep]
+
+        messages = self.parse_messages(can_ids, data, timestamps, dlc, pgns)
+        metrics.DECODE_SECONDS.observe_since(started, "parse_batch")
+
+        return SignalBatch(
+            timestamps[frames],
+            pgns[frames],
+            (can_ids[frames] & 0xFF).astype(np.uint8),
+            signals,
+            values,
+            messages,
+            self.database.signals,
+        )
+
+    def _changed(self, key, signal_id, value, now):
+        """Decide se um valor é emitido e, se for, o registra como o último"""
+        last = self.last_values.get(key)
+        if last is not None:
+            last_value, last_time = last
+            limit = max(self._deadband[signal_id], self._relative_deadband[signal_id] * abs(last_value))
+            if abs(value - last_value) <= limit and (
+                    self.heartbeat_ns is None or now - last_time < self.heartbeat_ns):
+                return False
+        self.last_values[key] = (value, now)
+        return True
+
+    def select_changes(self, sources, signals, timestamps, values):
+        """Máscara dos sinais emitidos no modo change_only, na ordem do lote.
+
+        A decisão depende do último valor emitido, então é sequencial por
+        (SA, sinal); mas repetições exatas da amostra anterior só podem sair
+        por heartbeat, e o laço em Python visita apenas as mudanças e os
+        vencimentos de heartbeat.
+        """
+        keep = np.zeros(len(values), dtype=bool)
+        keys = (sources << 16) | signals.astype(np.int64)
+        order = np.argsort(keys, kind='stable')
+        uniq, starts = np.unique(keys[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+
+        for key, start, end in zip(uniq.tolist(), starts, ends):
+            idx = order[start:end]
+            v = values[idx]
+            t = timestamps[idx]
+            source, signal_id = key >> 16, key & 0xFFFF
+            changes = np.flatnonzero(np.r_[True, v[1:] != v[:-1]]).tolist() + [len(v)]
+            last = self.last_values.get((source, signal_id))
+            pos = 0
+            c = 0
+            while True:
+                while changes[c] < pos:
+                    c += 1
+                nxt = changes[c]
+                if last is not None and self.heartbeat_ns is not None:
+                    nxt = min(nxt, pos + int(np.searchsorted(t[pos:], last[1] + self.heartbeat_ns)))
+                if nxt >= len(v):
+                    break
+                value, now = float(v[nxt]), int(t[nxt])
+                if self._changed((source, signal_id), signal_id, value, now):
+                    keep[idx[nxt]] = True
+                    last = (value, now)
+                pos = nxt + 1
+        return keep
+
+    def parse_messages(self, can_ids, data, timestamps, dlc=None, pgns=None):
+        """Linhas de DM1/VIN/software de um lote: frames únicos e mensagens
+        remontadas do TP.CM/TP.DT. timestamps em ns desde a época; cada linha
+        leva a origem (SA) em "origem".
+        """
+        can_ids = np.asarray(can_ids, dtype=np.uint32)
+        data = np.asarray(data, dtype=np.uint8).reshape(-1, 8)
+        if pgns is None:
+            pgns = pgns_of(can_ids)
+        messages = []
+        for pgn in self.MESSAGE_PGNS:
+            idx = np.flatnonzero(pgns == pgn)
+            if len(idx):
+                messages.extend(self._decode_rows(pgn, idx, can_ids, data, timestamps, dlc))
+        messages.extend(self._feed_transport(can_ids, data, timestamps, dlc))
+        return messages
+
+    def _decode_rows(self, pgn, idx, can_ids, data, timestamps, dlc):
+        """Decodifica frames únicos de PGNs sem sinais numéricos (DM1, VIN...)"""
+        rows = []
+        for i in idx.tolist():
+            size = 8 if dlc is None else int(dlc[i])
+            timestamp = datetime.fromtimestamp(timestamps[i] / 1e9)
+            for row in self.decode(pgn, timestamp, data[i, :size].tobytes()) or ():
+                row["origem"] = int(can_ids[i]) & 0xFF
+                rows.append(row)
+        return rows
+
+    def _feed_transport(self, can_ids, data, timestamps, dlc):
+        """Passa os frames TP.CM/TP.DT do lote, em ordem, pelo remontador"""
+        pf = (can_ids >> 16) & 0xFF
+        rows = []
+        for i in np.flatnonzero((pf == 0xEC) | (pf == 0xEB)).tolist():
+            size = 8 if dlc is None else int(dlc[i])
+            message = self.transport.feed(int(can_ids[i]), data[i, :size].tobytes(),
+                                          timestamps[i] / 1e9)
+            if message is not None:
+                source, pgn, payload = message
+                timestamp = datetime.fromtimestamp(timestamps[i] / 1e9)
+                for row in self.decode(pgn, timestamp, payload, source=source) or ():
+                    row["origem"] = source
+                    rows.append(row)
+        return rows
+
+    def parse_buffer(self, buf):
+        """Decodifica um buffer de registros FRAME_DTYPE sem copiar os bytes"""
+        frames = np.frombuffer(memoryview(buf), dtype=FRAME_DTYPE)
+        return self.parse_batch(
+            frames['can_id'],
+            frames['data'],
+            timestamps=frames['timestamp'].astype(np.int64) * 1000,
+            dlc=frames['dlc'],
+        )
+
+    def _parse_dm1(self, timestamp, data):
+        """Processa a lista de falhas ativas (DM1)"""
         try:
-            level = data[1] * 0.4
-            rate = struct.unpack('>H', data[2:4])[0] * 0.05
-            
-            return [{
-                "timestamp": timestamp,
-                "tipo": "Nível Combustível",
-                "valor": level,
-                "unidade": "%"
-            }, {
-                "timestamp": timestamp,
-                "tipo": "Consumo",
-                "valor": rate,
-                "unidade": "L/h"
-            }]
+            rows = []
+            # Bytes 0-1: lâmpadas; depois, DTCs de 4 bytes
+            for i in range(2, len(data) - 3, 4):
+                spn = data[i] | (data[i + 1] << 8) | ((data[i + 2] & 0xE0) << 11)
+                fmi = data[i + 2] & 0x1F
+                if spn == 0 and fmi == 0:
+                    continue
+                rows.append({
+                    "timestamp": timestamp,
+                    "tipo": "DTC",
+                    "valor": spn,
+                    "unidade": "SPN",
+                    "fmi": fmi,
+                    "ocorrencias": data[i + 3] & 0x7F
+                })
+            return rows
         except:
             return None
 
-    def _parse_load(self, timestamp, data):
-        """Processa carga do motor"""
+    def _parse_identification(self, timestamp, data, tipo):
+        """Processa campos texto terminados em '*' (VIN, software)"""
         try:
-            load = data[2] * 0.4
+            text = bytes(data).decode('ascii', errors='replace')
             return [{
                 "timestamp": timestamp,
-                "tipo": "Carga Motor",
-                "valor": load,
-                "unidade": "%"
+                "tipo": tipo,
+                "valor": text.split('*')[0].strip(),
+                "unidade": ""
             }]
         except:
-            return None 
\ No newline at end of file
+            return None
\ No newline at end of file
@@ -0,0 +1,146 @@
+import time
+
+# PGNs do protocolo de transporte (PDU1: o byte PS é o endereço de destino)
+TP_CM = 0xEC
+TP_DT = 0xEB
+
+# Bytes de controle do TP.CM
+CM_RTS = 16
+CM_CTS = 17
+CM_EOM_ACK = 19
+CM_BAM = 32
+CM_ABORT = 255
+
+# Maior mensagem possível: 255 pacotes de 7 bytes
+MAX_MESSAGE_SIZE = 255 * 7
+
+
+class _Session:
+    """Slot pré-alocado para uma mensagem em remontagem"""
+
+    __slots__ = ('key', 'pgn', 'size', 'packets', 'next_seq', 'last_seen', 'buf')
+
+    def __init__(self):
+        self.buf = bytearray(MAX_MESSAGE_SIZE)
+        self.key = None
+
+
+class TransportReassembler:
+    """Remonta mensagens multi-pacote J1939 (TP.CM/TP.DT, BAM e RTS/CTS).
+
+    Atua só como ouvinte do barramento. As sessões ficam em um pool de
+    tamanho fixo com buffers pré-alocados, indexadas por (origem, destino),
+    já que o TP.DT não carrega o PGN; cada sessão guarda o PGN anunciado no
+    TP.CM. O relógio é o timestamp dos frames, em segundos desde a época
+    (padrão: agora). Sessões paradas há mais de `timeout` segundos são
+    descartadas e, com o pool cheio, a sessão mais antiga é reaproveitada,
+    então um ECU que abre sessões sem terminá-las não aumenta o uso de
+    memória. Sem numpy: o firmware (parser ISOBUS) usa o mesmo módulo.
+    """
+
+    def __init__(self, max_sessions=16, timeout=1.25):
+        self.timeout = timeout
+        self._pool = [_Session() for _ in range(max_sessions)]
+        self._free = list(self._pool)
+        self._sessions = {}
+        self.completed = 0
+        self.timeouts = 0
+        self.aborted = 0
+        self.evicted = 0
+
+    @staticmethod
+    def is_transport(can_id):
+        return ((can_id >> 16) & 0xFF) in (TP_CM, TP_DT)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def feed(self, can_id, data, now=None):
+        """Processa um frame TP; retorna (origem, PGN, payload) ao completar uma mensagem"""
+        if now is None:
+            now = time.time()
+        pf = (can_id >> 16) & 0xFF
+        source = can_id & 0xFF
+        destination = (can_id >> 8) & 0xFF
+        if pf == TP_DT:
+            return self._data(source, destination, data, now)
+        if pf == TP_CM and len(data) >= 8:
+            self._control(source, destination, data, now)
+        return None
+
+    def _control(self, source, destination, data, now):
+        control = data[0]
+        if control in (CM_RTS, CM_BAM):
+            size = data[1] | (data[2] << 8)
+            packets = data[3]
+            if size < 9 or size > MAX_MESSAGE_SIZE or packets != (size + 6) // 7:
+                return
+            session = self._acquire((source, destination), now)
+            session.pgn = data[5] | (data[6] << 8) | (data[7] << 16)
+            session.size = size
+            session.packets = packets
+            session.next_seq = 1
+            session.last_seen = now
+        elif control == CM_ABORT:
+            # O abort pode vir do transmissor ou do receptor
+            for key in ((source, destination), (destination, source)):
+                if key in self._sessions:
+                    self._release(self._sessions[key])
+                    self.aborted += 1
+
+    def _data(self, source, destination, data, now):
+        session = self._sessions.get((source, destination))
+        if session is None or len(data) < 2:
+            return None
+        if now - session.last_seen > self.timeout:
+            self._release(session)
+            self.timeouts += 1
+            return None
+        seq = data[0]
+        if seq != session.next_seq:
+            # Pacote fora de ordem: a mensagem não pode mais ser completada
+            self._release(session)
+            self.aborted += 1
+            return None
+
+        offset = (seq - 1) * 7
+        chunk = data[1:8]
+        session.buf[offset:offset + len(chunk)] = chunk
+        session.next_seq = seq + 1
+        session.last_seen = now
+        if seq < session.packets:
+            return None
+
+        result = (source, session.pgn, bytes(session.buf[:session.size]))
+        self._release(session)
+        self.completed += 1
+        return result
+
+    def _acquire(self, key, now):
+        session = self._sessions.get(key)
+        if session is not None:
+            # Novo anúncio na mesma origem/destino substitui a sessão anterior
+            return session
+        if not self._free:
+            self.expire(now)
+        if not self._free:
+            self._release(min(self._sessions.values(), key=lambda s: s.last_seen))
+            self.evicted += 1
+        session = self._free.pop()
+        session.key = key
+        self._sessions[key] = session
+        return session
+
+    def _release(self, session):
+        del self._sessions[session.key]
+        session.key = None
+        self._free.append(session)
+
+    def expire(self, now=None):
+        """Descarta sessões sem TP.DT há mais de `timeout` segundos"""
+        if now is None:
+            now = time.time()
+        for session in list(self._sessions.values()):
+            if now - session.last_seen > self.timeout:
+                self._release(session)
+                self.timeouts += 1
@@ -0,0 +1,145 @@
+import threading
+
+import numpy as np
+
+
+class LatestTable:
+    """Estado atual por (PGN, origem, sinal): último valor, timestamp e contagem.
+
+    Cada chave ocupa uma linha fixa de arrays numpy, atualizada no lugar a
+    cada lote; o índice chave -> linha é um dict, então ler um valor é O(1).
+    Duas ECUs transmitindo o mesmo PGN ficam em linhas separadas. Para os
+    gauges, value(nome) devolve a leitura mais recente entre as origens.
+    """
+
+    def __init__(self, signals=(), spns=(), capacity=256):
+        # (nome, unidade) e SPN de cada id de sinal, como na SignalDatabase
+        self.signals = tuple(signals)
+        self.spns = tuple(spns)
+        self._names = {}
+        for signal_id, (name, _) in enumerate(self.signals):
+            self._names.setdefault(name, []).append(signal_id)
+        self._slots = {}
+        self._by_signal = {}
+        self._pgn = np.zeros(capacity, dtype=np.uint32)
+        self._source = np.zeros(capacity, dtype=np.uint8)
+        self._signal = np.zeros(capacity, dtype=np.uint16)
+        self._value = np.zeros(capacity, dtype=np.float64)
+        self._timestamp = np.zeros(capacity, dtype=np.int64)
+        self._count = np.zeros(capacity, dtype=np.int64)
+        # Frescor por endereço de origem: último timestamp (ns) e amostras
+        self.source_seen = np.zeros(256, dtype=np.int64)
+        self.source_count = np.zeros(256, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _slot(self, key):
+        row = self._slots.get(key)
+        if row is None:
+            row = len(self._slots)
+            if row == len(self._value):
+                self._grow()
+            self._slots[key] = row
+            self._pgn[row], self._source[row], self._signal[row] = key
+        return row
+
+    def _grow(self):
+        for name in ('_pgn', '_source', '_signal', '_value', '_timestamp', '_count'):
+            old = getattr(self, name)
+            new = np.zeros(2 * len(old), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def update(self, pgns, sources, signals, timestamps, values):
+        """Incorpora um lote de amostras em ordem crescente de timestamp"""
+        if not len(values):
+            return
+        pgns = np.asarray(pgns, dtype=np.int64)
+        sources = np.asarray(sources, dtype=np.int64)
+        signals = np.asarray(signals, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+
+        keys = (pgns << 24) | (sources << 16) | signals
+        # Última ocorrência de cada chave: primeira no lote invertido
+        uniq, last, counts = np.unique(keys[::-1], return_index=True, return_counts=True)
+        last = len(keys) - 1 - last
+        with self._lock:
+            rows = np.array([self._slot((key >> 24, (key >> 16) & 0xFF, key & 0xFFFF))
+                             for key in uniq.tolist()])
+            self._value[rows] = values[last]
+            self._timestamp[rows] = timestamps[last]
+            self._count[rows] += counts
+            np.maximum.at(self.source_seen, sources, timestamps)
+            np.add.at(self.source_count, sources, 1)
+            for row in rows.tolist():
+                signal = int(self._signal[row])
+                current = self._by_signal.get(signal)
+                if current is None or self._timestamp[row] >= self._timestamp[current]:
+                    self._by_signal[signal] = row
+
+    def get(self, pgn, source, signal):
+        """(valor, timestamp ns, atualizações) de uma chave, ou None"""
+        with self._lock:
+            row = self._slots.get((pgn, source, signal))
+            if row is None:
+                return None
+            return float(self._value[row]), int(self._timestamp[row]), int(self._count[row])
+
+    def value(self, name, default=None):
+        """Leitura mais recente de um sinal pelo nome, entre todas as origens"""
+        with self._lock:
+            return self._latest(name, default)
+
+    def _latest(self, name, default=None):
+        best = None
+        for signal_id in self._names.get(name, ()):
+            row = self._by_signal.get(signal_id)
+            if row is not None and (best is None or self._timestamp[row] > self._timestamp[best]):
+                best = row
+        return default if best is None else float(self._value[best])
+
+    def values(self):
+        """{nome: valor mais recente} de todos os sinais já recebidos"""
+        with self._lock:
+            names = {self.signals[signal][0] for signal in self._by_signal}
+            return {name: self._latest(name) for name in names}
+
+    def rows(self):
+        """Todas as chaves como registros (pgn, origem, spn, sinal, valor, timestamp, contagem)"""
+        with self._lock:
+            n = len(self._slots)
+            return [
+                {
+                    'pgn': pgn, 'source': source,
+                    'spn': self.spns[signal] if signal < len(self.spns) else None,
+                    'signal': self.signals[signal][0] if signal < len(self.signals) else signal,
+                    'value': value, 'timestamp': timestamp, 'count': count,
+                }
+                for pgn, source, signal, value, timestamp, count in zip(
+                    self._pgn[:n].tolist(), self._source[:n].tolist(), self._signal[:n].tolist(),
+                    self._value[:n].tolist(), self._timestamp[:n].tolist(), self._count[:n].tolist())
+            ]
+
+    def source_stats(self):
+        """Cópia de (source_seen, source_count)"""
+        with self._lock:
+            return self.source_seen.copy(), self.source_count.copy()
+
+    def sources(self, now_ns, stale_after=5.0):
+        """Frescor de cada origem já vista: idade da última amostra e se está parada"""
+        with self._lock:
+            return source_freshness(self.source_seen, self.source_count, now_ns, stale_after)
+
+
+def source_freshness(source_seen, source_count, now_ns, stale_after=5.0):
+    """Registros de LatestTable.sources() a partir dos arrays por origem (256 posições);
+    junta tabelas de vários processos com máximo de source_seen e soma de source_count"""
+    seen = np.flatnonzero(source_count)
+    ages = (now_ns - source_seen[seen]) / 1e9
+    return [
+        {'source': source, 'age': age, 'samples': count, 'stale': age > stale_after}
+        for source, age, count in zip(seen.tolist(), ages.tolist(), source_count[seen].tolist())
+    ]
@@ -0,0 +1,55 @@
+"""Mapa do trajeto GPS em folium (streamlit-folium).
+
+O mapa base, com os trechos fechados do trajeto, é montado uma vez e só é
+refeito quando um trecho fecha ou o zoom muda. A cada atualização o
+st_folium recebe o mesmo mapa base e, em feature_group_to_add, só a cauda
+e o marcador: o Leaflet do navegador mantém o mapa (tiles, zoom, arraste)
+e troca apenas essa camada. O script do mapa base ainda vai nos argumentos
+do componente a cada atualização, então um trajeto longo pesa no tráfego
+do websocket, mas não é redesenhado.
+"""
+import streamlit as st
+
+try:
+    import folium
+    from streamlit_folium import st_folium
+except ImportError:
+    folium = None
+
+
+def available():
+    return folium is not None
+
+
+def base_map(key, frozen_chunks, lines, last, zoom):
+    """Mapa com os trechos fechados, guardado na sessão até um trecho fechar ou o zoom mudar"""
+    cache_key = (frozen_chunks, zoom)
+    cached = st.session_state.get(key)
+    if cached is None or cached[0] != cache_key:
+        m = folium.Map(location=last, zoom_start=zoom)
+        for line in lines:
+            folium.PolyLine(line, color='green', weight=3).add_to(m)
+        cached = st.session_state[key] = (cache_key, m)
+    return cached[1]
+
+
+def track_map(view, zoom, key="mapa", width=None, height=400):
+    """Desenha track_view(zoom) = (trechos fechados, trechos, cauda, última posição).
+
+    Retorna o zoom escolhido pelo usuário no mapa (ou None).
+    """
+    frozen_chunks, lines, tail, last = view
+    recent = folium.FeatureGroup(name="Trajeto recente")
+    folium.PolyLine(tail, color='green', weight=3).add_to(recent)
+    folium.Marker(last, popup="Trator", icon=folium.Icon(color='green', icon='info-sign')).add_to(recent)
+    result = st_folium(
+        base_map(f"{key}_base", frozen_chunks, lines, last, zoom),
+        key=key,
+        feature_group_to_add=recent,
+        center=last,
+        zoom=zoom,
+        width=width,
+        height=height,
+        returned_objects=["zoom"],
+    )
+    return (result or {}).get('zoom')
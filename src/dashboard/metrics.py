@@ -0,0 +1,208 @@
+"""Métricas de coleta, decodificação e renderização no formato texto do Prometheus.
+
+Desligadas por padrão: enquanto enable() não for chamado, cada medição
+custa uma chamada que retorna na primeira linha. serve() expõe /metrics
+em HTTP; snapshot() alimenta o painel de debug do dashboard.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from signal_db import pgns_of
+
+# Limites dos histogramas de tempo (s), de 100 µs a 10 s
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = False
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def clock():
+    """Início de uma medição (0.0 com as métricas desligadas)"""
+    return time.perf_counter() if _enabled else 0.0
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def inc_many(self, keys, counts):
+        """Soma várias séries de uma vez (ex.: frames por PGN de um lote)"""
+        if not _enabled:
+            return
+        with self._lock:
+            for key, count in zip(keys, counts):
+                key = (key,)
+                self._values[key] = self._values.get(key, 0) + int(count)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Histograma com buckets fixos; cada série guarda (contagens, soma, total)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def observe_since(self, started, *labels):
+        """Tempo desde clock(); não faz nada se a medição começou desligada"""
+        if started:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: ([*counts], total, n) for key, (counts, total, n) in self._values.items()}
+
+    def quantile(self, q, *labels):
+        """Quantil estimado pelo limite superior do bucket (None sem amostras)"""
+        series = self.snapshot().get(labels)
+        if series is None or not series[2]:
+            return None
+        counts, _, n = series
+        i = int(np.searchsorted(np.cumsum(counts), q * n))
+        return self.buckets[i] if i < len(self.buckets) else float('inf')
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labels + ("le",)
+        for key, (counts, total, n) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self):
+        return "\n".join(line for metric in self.metrics for line in metric.expose()) + "\n"
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.register(Histogram(
+    "jd_fetch_seconds", "Latência das consultas HTTP ao ESP32", ("endpoint",)))
+FETCH_ERRORS = REGISTRY.register(Counter(
+    "jd_fetch_errors_total", "Consultas ao ESP32 que falharam", ("endpoint",)))
+DECODE_SECONDS = REGISTRY.register(Histogram(
+    "jd_decode_seconds", "Tempo de decodificação por lote", ("path",)))
+STORE_SECONDS = REGISTRY.register(Histogram(
+    "jd_store_seconds", "Tempo de gravação no histórico e nos agregados por lote"))
+RENDER_SECONDS = REGISTRY.register(Histogram(
+    "jd_render_seconds", "Tempo de renderização por painel do dashboard", ("panel",)))
+FRAMES = REGISTRY.register(Counter(
+    "jd_frames_total", "Frames CAN recebidos por PGN", ("pgn",)))
+DROPPED = REGISTRY.register(Counter(
+    "jd_frames_dropped_total", "Frames descartados ou ilegíveis", ("reason",)))
+HISTORY_SAMPLES = REGISTRY.register(Gauge(
+    "jd_history_samples", "Amostras no histórico em memória", ("device",)))
+
+
+def count_frames(can_ids):
+    """Soma os frames de um lote em jd_frames_total, por PGN"""
+    if not _enabled or not len(can_ids):
+        return
+    pgns, counts = np.unique(pgns_of(can_ids), return_counts=True)
+    FRAMES.inc_many([f"0x{pgn:04X}" for pgn in pgns.tolist()], counts.tolist())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Liga as métricas e expõe /metrics numa thread em segundo plano"""
+    enable()
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
@@ -0,0 +1,561 @@
+"""Pipeline de decodificação em vários processos.
+
+Um processo de aquisição lê os ESP32 (um por barramento) e distribui os
+frames, por PGN ou por endereço de origem, entre N processos decodificadores.
+Cada decodificador mantém o estado do seu shard (histórico, agregados,
+últimos valores, arquivo Parquet) e responde às consultas do dashboard por
+filas; frames e amostras passam por anéis em memória compartilhada
+(ShmRing), sem pickle. Para o processo do dashboard só vão as amostras dos
+sinais com regra de alarme, avaliadas em ordem de timestamp.
+"""
+import asyncio
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import requests
+
+import metrics
+from clock import ClockAnchor
+from downsample import METHODS
+from frames import advance_cursor, fetch_frames
+from ingest import DeviceState
+from j1939_parser import FRAME_DTYPE
+from j1939_transport import TP_CM, TP_DT
+from latest import source_freshness
+from rawlog import RawLogWriter
+from signal_db import SIMULATOR_DATABASE, load_database, pgns_of
+from stream_client import FrameStream
+
+# Frame na entrada dos decodificadores: registro do ESP32 + índice do barramento
+PIPELINE_FRAME_DTYPE = np.dtype(FRAME_DTYPE.descr + [('bus', 'u1')])
+
+# Amostra decodificada: timestamp (ns), valor, PGN, id do sinal, barramento e origem (SA)
+SAMPLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('value', '<f8'),
+    ('pgn', '<u4'),
+    ('signal', '<u2'),
+    ('bus', 'u1'),
+    ('source', 'u1'),
+])
+
+# Frames lidos por vez por decodificador
+DECODE_BATCH = 4096
+
+
+class ShmRing:
+    """Anel de registros numpy em memória compartilhada, um produtor e um consumidor.
+
+    O cabeçalho tem os contadores de escrita e de leitura (uint64, em linhas
+    de cache separadas); cada lado só avança o seu. Os contadores são lidos
+    e publicados com um multiprocessing.Lock, cujo acquire/release é uma
+    barreira de memória: em CPUs com ordenação fraca (ARM) o consumidor não
+    vê o contador novo antes dos registros, nem o produtor reaproveita um
+    slot que ainda está sendo lido. O lock só cobre os contadores, uma vez
+    por lote; as cópias ficam fora dele. Com o anel cheio, write() grava o
+    que couber e devolve a quantidade gravada.
+    """
+
+    _WRITE = 0
+    _READ = 64
+    _DATA = 128
+
+    def __init__(self, dtype, capacity, name=None, lock=None):
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        # Lock do contexto 'spawn', o dos processos do pipeline
+        self.lock = lock or mp.get_context('spawn').Lock()
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=self._DATA + capacity * self.dtype.itemsize)
+        else:
+            # Os processos 'spawn' compartilham o resource_tracker do pai, que
+            # remove o segmento se algum processo morrer sem close()
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._write = np.ndarray(1, np.uint64, self.shm.buf, self._WRITE)
+        self._read = np.ndarray(1, np.uint64, self.shm.buf, self._READ)
+        self._records = np.ndarray(capacity, self.dtype, self.shm.buf, self._DATA)
+        if self.owner:
+            self._write[0] = self._read[0] = 0
+
+    def __reduce__(self):
+        # Em outro processo, o anel é reaberto pelo nome; o lock só atravessa
+        # como argumento de um Process
+        return ShmRing, (self.dtype, self.capacity, self.shm.name, self.lock)
+
+    def _counters(self):
+        with self.lock:
+            return int(self._write[0]), int(self._read[0])
+
+    def __len__(self):
+        w, r = self._counters()
+        return w - r
+
+    def write(self, records):
+        w, r = self._counters()
+        n = min(len(records), self.capacity - (w - r))
+        start = w % self.capacity
+        first = min(n, self.capacity - start)
+        self._records[start:start + first] = records[:first]
+        self._records[:n - first] = records[first:n]
+        if n:
+            with self.lock:
+                self._write[0] = w + n
+        return n
+
+    def read(self, limit=None):
+        """Cópia dos registros pendentes (no máximo `limit`)"""
+        w, r = self._counters()
+        n = w - r
+        if limit is not None:
+            n = min(n, limit)
+        start = r % self.capacity
+        first = min(n, self.capacity - start)
+        out = np.empty(n, dtype=self.dtype)
+        out[:first] = self._records[start:start + first]
+        out[first:] = self._records[:n - first]
+        if n:
+            with self.lock:
+                self._read[0] = r + n
+        return out
+
+    def close(self):
+        self._write = self._read = self._records = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def shard_keys(frames, workers, shard='pgn'):
+    """Decodificador de cada frame: hash do PGN ou do endereço de origem.
+
+    TP.DT vai para o mesmo decodificador do TP.CM, que remonta a mensagem.
+    """
+    can_ids = frames['can_id']
+    if shard == 'source':
+        keys = (can_ids & 0xFF).astype(np.uint64)
+    else:
+        pgns = pgns_of(can_ids)
+        keys = np.where(pgns == TP_DT << 8, TP_CM << 8, pgns).astype(np.uint64)
+    return ((keys * np.uint64(0x9E3779B1)) >> np.uint64(16)) % np.uint64(workers)
+
+
+class Dispatcher:
+    """Distribui frames entre os anéis de entrada dos decodificadores"""
+
+    def __init__(self, rings, shard='pgn'):
+        self.rings = rings
+        self.shard = shard
+        self.dropped = 0
+
+    def feed(self, frames, bus=0):
+        records = np.empty(len(frames), dtype=PIPELINE_FRAME_DTYPE)
+        for name in FRAME_DTYPE.names:
+            records[name] = frames[name]
+        records['bus'] = bus
+        keys = shard_keys(records, len(self.rings), self.shard)
+        for worker, ring in enumerate(self.rings):
+            selected = records[keys == worker]
+            if len(selected):
+                # Anel cheio: o decodificador está atrasado e o excedente é descartado
+                self.dropped += len(selected) - ring.write(selected)
+
+
+def _acquire(ips, transport, rings, shard, stop, status_queue, log_dir, interval):
+    """Processo de aquisição: lê os ESP32 e alimenta os decodificadores"""
+    dispatcher = Dispatcher(rings, shard)
+
+    def open_log(ip):
+        try:
+            return RawLogWriter(os.path.join(log_dir, ip.replace(':', '_')))
+        except RuntimeError as e:
+            print(f"{e}: log bruto desativado para {ip}")
+
+    logs = [open_log(ip) if log_dir else None for ip in ips]
+    clocks = [ClockAnchor() for _ in ips]
+    counts = [0] * len(ips)
+
+    def deliver(bus, status, frames):
+        frames = clocks[bus](frames)
+        dispatcher.feed(frames, bus)
+        counts[bus] += len(frames)
+        if logs[bus] is not None:
+            logs[bus].append(frames)
+        try:
+            status_queue.put_nowait((bus, status, counts[bus], dispatcher.dropped))
+        except queue.Full:
+            pass
+
+    async def stream(bus, ip):
+        client = FrameStream(ip)
+        async for frames in client.batches():
+            deliver(bus, dict(client.status, lost=client.dropped), frames)
+            if stop.is_set():
+                client.closed = True
+
+    async def poll(bus, ip):
+        # Uma sessão HTTP (conexão keep-alive) por ESP32
+        session = requests.Session()
+        cursor, lost = None, 0
+        while not stop.is_set():
+            started = time.monotonic()
+            more = False
+            try:
+                # Só os frames novos; lote cheio quer dizer mais frames no buffer do ESP32
+                status, frames = await asyncio.to_thread(
+                    fetch_frames, ip, session=session, since=0 if cursor is None else cursor)
+                data = dict(status, frames=frames)
+                cursor, more = advance_cursor(data, cursor)
+                lost += data.get('gap', 0)
+                deliver(bus, dict(status, lost=lost), frames)
+            except Exception as e:
+                print(f"Erro ao consultar {ip}: {e}")
+                try:
+                    status_queue.put_nowait((bus, None, counts[bus], dispatcher.dropped))
+                except queue.Full:
+                    pass
+            # Só espera o intervalo depois de um lote parcial
+            if not more:
+                await asyncio.sleep(max(0, interval - (time.monotonic() - started)))
+
+    async def main():
+        tasks = [asyncio.create_task(stream(bus, ip) if transport == "Streaming" else poll(bus, ip))
+                 for bus, ip in enumerate(ips)]
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        for task in tasks:
+            task.cancel()
+
+    try:
+        asyncio.run(main())
+    finally:
+        for log in logs:
+            if log is not None:
+                log.close()
+
+
+def decode_samples(database, frames):
+    """Amostras (SAMPLE_DTYPE) de um lote de frames com timestamps em us UTC"""
+    index, signals, values = database.decode_batch(frames['can_id'], frames['data'], frames['dlc'])
+    samples = np.empty(len(index), dtype=SAMPLE_DTYPE)
+    samples['timestamp'] = frames['timestamp'][index].astype(np.int64) * 1000
+    samples['value'] = values
+    samples['pgn'] = pgns_of(frames['can_id'][index])
+    samples['signal'] = signals
+    samples['bus'] = frames['bus'][index] if 'bus' in frames.dtype.names else 0
+    samples['source'] = frames['can_id'][index] & 0xFF
+    return samples
+
+
+def samples_frame(samples, names):
+    """DataFrame de amostras no formato do DeviceState.ingest_decoded (ns UTC)"""
+    return pd.DataFrame({
+        "timestamp": samples['timestamp'].view('datetime64[ns]'),
+        "tipo": names[samples['signal']],
+        "valor": samples['value'],
+        "pgn": samples['pgn'],
+        "origem": samples['source'],
+        "sinal": samples['signal'],
+    })
+
+
+def _latest(state):
+    """Últimos valores, frescor das origens e diagnósticos de um shard, para juntar no dashboard"""
+    return (state.table.rows(), *state.table.source_stats(), state.last_update, state.diagnostics())
+
+
+# Consultas que o dashboard pode fazer ao estado de um decodificador
+SHARD_QUERIES = {
+    'window': DeviceState.window,
+    'total': DeviceState.total,
+    'latest': _latest,
+    'track': DeviceState.track_view,
+}
+
+
+def _decode(worker, ips, database_path, frames_ring, samples_ring, stop, queries, replies,
+            forward, state_options):
+    """Processo decodificador: frames do seu shard -> histórico, agregados,
+    últimos valores e arquivo do shard; só as amostras em `forward` (sinais
+    de alarme) seguem para o dashboard"""
+    # A base vem do cache em disco gravado pelo processo principal
+    database = load_database(database_path)
+    names = np.array([name for name, _ in database.signals] or [""], dtype=object)
+    forward = np.asarray(forward, dtype=np.int64)
+    states = {}
+
+    def state_of(bus):
+        if bus not in states:
+            options = dict(state_options[bus] if bus < len(state_options) else {})
+            options.setdefault('archive_suffix', f"-{worker}")
+            # Alarmes, log de alarmes e log bruto ficam com o dashboard e a aquisição
+            states[bus] = DeviceState(ips[bus] if bus < len(ips) else f"barramento {bus}",
+                                      database=database, alarm_rules=[], raw_log=False,
+                                      log_dir=None, **options)
+        return states[bus]
+
+    def answer():
+        while True:
+            try:
+                query_id, bus, method, args = queries.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = SHARD_QUERIES[method](state_of(bus), *args)
+            except Exception as e:
+                result = e
+            replies.put((query_id, result))
+
+    try:
+        while not stop.is_set():
+            answer()
+            frames = frames_ring.read(DECODE_BATCH)
+            if not len(frames):
+                time.sleep(0.002)
+                continue
+            samples = decode_samples(database, frames)
+            buses, counts = np.unique(frames['bus'], return_counts=True)
+            for bus, count in zip(buses.tolist(), counts.tolist()):
+                selected = samples[samples['bus'] == bus] if len(buses) > 1 else samples
+                state = state_of(bus)
+                # DM1/VIN: frames únicos e TP.CM/TP.DT, que o shard_keys mantém juntos
+                diagnostics = state.decode_messages(
+                    frames[frames['bus'] == bus] if len(buses) > 1 else frames)
+                state.ingest_decoded(samples_frame(selected, names), {}, count,
+                                     diagnostics=diagnostics)
+            samples = samples[np.isin(samples['signal'], forward)]
+            # Saída cheia: espera o dashboard, e a pressão volta para o anel de entrada
+            written = 0
+            while written < len(samples) and not stop.is_set():
+                written += samples_ring.write(samples[written:])
+                if written < len(samples):
+                    time.sleep(0.002)
+    finally:
+        for state in states.values():
+            state.close()
+
+
+class DecodePipeline:
+    """Aquisição + N decodificadores em processos separados.
+
+    Com ips vazio não há processo de aquisição e os frames entram por
+    feed() (replay de logs, benchmarks). `forward` são os ids de sinal cujas
+    amostras read() devolve; `state_options` são opções do DeviceState de
+    cada decodificador, uma por barramento.
+    """
+
+    def __init__(self, ips=(), transport="Streaming", workers=None, shard='pgn',
+                 database_path=SIMULATOR_DATABASE, log_dir=None, interval=1.0,
+                 ring_frames=1 << 16, ring_samples=1 << 18, forward=(), state_options=()):
+        self.ips = list(ips)
+        self.transport = transport
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.shard = shard
+        self.database_path = database_path
+        self.log_dir = log_dir
+        self.interval = interval
+        self.ring_frames = ring_frames
+        self.ring_samples = ring_samples
+        self.forward = list(forward)
+        self.state_options = list(state_options)
+        # Compila (ou valida o cache) antes de subir os processos
+        self.database = load_database(database_path)
+        self.status = [None] * len(self.ips)
+        self.frames_total = [0] * len(self.ips)
+        self.dropped = 0
+        self._processes = []
+        self._query_lock = threading.Lock()
+        self._query_id = 0
+
+    def start(self):
+        ctx = mp.get_context('spawn')
+        self._stop = ctx.Event()
+        self._status_queue = ctx.Queue(maxsize=256)
+        self.frame_rings = [ShmRing(PIPELINE_FRAME_DTYPE, self.ring_frames, lock=ctx.Lock())
+                            for _ in range(self.workers)]
+        self.sample_rings = [ShmRing(SAMPLE_DTYPE, self.ring_samples, lock=ctx.Lock())
+                             for _ in range(self.workers)]
+        self._queries = [ctx.Queue() for _ in range(self.workers)]
+        self._replies = [ctx.Queue() for _ in range(self.workers)]
+        self._dispatcher = Dispatcher(self.frame_rings, self.shard)
+        for worker in range(self.workers):
+            self._processes.append(ctx.Process(
+                target=_decode,
+                args=(worker, self.ips, self.database_path, self.frame_rings[worker],
+                      self.sample_rings[worker], self._stop, self._queries[worker],
+                      self._replies[worker], self.forward, self.state_options),
+                daemon=True))
+        if self.ips:
+            self._processes.append(ctx.Process(
+                target=_acquire,
+                args=(self.ips, self.transport, self.frame_rings, self.shard, self._stop,
+                      self._status_queue, self.log_dir, self.interval),
+                daemon=True))
+        for process in self._processes:
+            process.start()
+        return self
+
+    def feed(self, frames, bus=0):
+        """Entrega frames direto aos decodificadores (sem processo de aquisição)"""
+        self._dispatcher.feed(frames, bus)
+
+    def pending(self):
+        return sum(len(ring) for ring in self.frame_rings)
+
+    def read(self):
+        """Amostras novas (sinais em `forward`) de todos os decodificadores, em ordem de timestamp"""
+        while True:
+            try:
+                bus, status, count, dropped = self._status_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.status[bus] = status
+            self.frames_total[bus] = count
+            self.dropped = dropped
+        parts = [ring.read() for ring in self.sample_rings]
+        samples = np.concatenate(parts) if parts else np.empty(0, dtype=SAMPLE_DTYPE)
+        return samples[np.argsort(samples['timestamp'], kind='stable')]
+
+    def query(self, bus, method, *args, timeout=2.0):
+        """Resultado de SHARD_QUERIES[method] no estado de cada decodificador.
+
+        Decodificador que não responde no prazo fica de fora (None); uma
+        resposta atrasada é descartada na consulta seguinte.
+        """
+        with self._query_lock:
+            self._query_id += 1
+            query_id = self._query_id
+            for queries in self._queries:
+                queries.put((query_id, bus, method, args))
+            deadline = time.monotonic() + timeout
+            results = []
+            for replies in self._replies:
+                result = None
+                while True:
+                    try:
+                        reply_id, reply = replies.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if reply_id == query_id:
+                        result = reply
+                        break
+                if isinstance(result, Exception):
+                    raise result
+                results.append(result)
+            return results
+
+    def stop(self):
+        self._stop.set()
+        # Os decodificadores fecham o arquivo Parquet antes de sair
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        for ring in self.frame_rings + self.sample_rings:
+            ring.close()
+
+
+class PipelineIngest(threading.Thread):
+    """Mesma interface do IngestWorker, com a decodificação no DecodePipeline.
+
+    Histórico, agregados, últimos valores e arquivo ficam nos decodificadores
+    (state_options vão para eles); aqui ficam status, contadores e alarmes.
+    """
+
+    def __init__(self, ip, transport="Streaming", workers=None, shard='pgn',
+                 database_path=SIMULATOR_DATABASE, interval=0.05, log_dir=None,
+                 alarm_rules=None, **state_options):
+        super().__init__(daemon=True)
+        self.ip = ip
+        self.transport = transport
+        self.interval = interval
+        device_dir = os.path.join(log_dir, ip.replace(':', '_')) if log_dir else None
+        database = load_database(database_path)
+        # Log bruto na aquisição; aqui só o alarms.jsonl no diretório do ESP32
+        self.state = DeviceState(ip, database=database, alarm_rules=alarm_rules, log_dir=device_dir,
+                                 raw_log=False, history=False)
+        self.pipeline = DecodePipeline([ip], transport, workers, shard, database_path, log_dir,
+                                       forward=self.state.alarms.signal_ids,
+                                       state_options=[state_options])
+        self._names = np.array([name for name, _ in database.signals] or [""], dtype=object)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.pipeline.start()
+        frames_seen = dropped_seen = lost_seen = 0
+        while not self._stop_event.is_set():
+            samples = self.pipeline.read()
+            metrics.DROPPED.inc(self.pipeline.dropped - dropped_seen, "pipeline_full")
+            dropped_seen = self.pipeline.dropped
+            frames_total = self.pipeline.frames_total[0]
+            status = self.pipeline.status[0]
+            if status is None:
+                self.state.ingest(None)
+            else:
+                self.state.record_lost(status.get('lost', 0) - lost_seen)
+                lost_seen = status.get('lost', 0)
+                self.state.ingest_decoded(samples_frame(samples, self._names), status,
+                                          frames_total - frames_seen)
+                frames_seen = frames_total
+            self._stop_event.wait(self.interval)
+
+    def snapshot(self):
+        snapshot = self.state.snapshot()
+        latest, updates = {}, [snapshot['last_update']]
+        seen, count = np.zeros(256, dtype=np.int64), np.zeros(256, dtype=np.int64)
+        diagnostics = []
+        for shard in self.pipeline.query(0, 'latest'):
+            if shard is None:
+                continue
+            rows, shard_seen, shard_count, last_update, shard_diagnostics = shard
+            diagnostics.extend(shard_diagnostics)
+            # Leitura mais recente de cada sinal entre os shards e as origens
+            for row in rows:
+                if row['signal'] not in latest or row['timestamp'] >= latest[row['signal']][0]:
+                    latest[row['signal']] = (row['timestamp'], row['value'])
+            np.maximum(seen, shard_seen, out=seen)
+            count += shard_count
+            updates.append(last_update)
+        snapshot['latest'] = {name: value for name, (_, value) in latest.items()}
+        snapshot['sources'] = source_freshness(seen, count, time.time_ns())
+        snapshot['last_update'] = max((u for u in updates if u is not None), default=None)
+        # Últimas linhas de cada shard, em ordem de chegada
+        snapshot['diagnostics'] = sorted(diagnostics, key=lambda row: row['timestamp'])
+        return snapshot
+
+    def window(self, tipo, seconds, max_points=None, method='minmax'):
+        parts = [part for part in self.pipeline.query(0, 'window', tipo, seconds, max_points, method)
+                 if part is not None and len(part[0])]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        ts = np.concatenate([part[0] for part in parts])
+        values = np.concatenate([part[1] for part in parts])
+        order = np.argsort(ts, kind='stable')
+        ts, values = ts[order], values[order]
+        # Sinal espalhado em vários shards (divisão por origem): reduz de novo
+        if max_points is not None and len(parts) > 1 and len(ts) > max_points:
+            ts, values = METHODS[method](ts, values, max_points)
+        return ts, values
+
+    def total(self, tipo, seconds):
+        return sum(part for part in self.pipeline.query(0, 'total', tipo, seconds) if part is not None)
+
+    def track_view(self, zoom):
+        # A posição (PGN 0xFEF3) vem de um shard só; fica o que tem mais fixes recebidos
+        views = [view for view in self.pipeline.query(0, 'track', zoom) if view is not None]
+        return max(views, key=lambda view: (view[0], len(view[2])), default=(0, [], [], None))
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout=5)
+        self.pipeline.stop()
+        self.state.close()
@@ -0,0 +1,267 @@
+import mmap
+import os
+import queue
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from j1939_parser import FRAME_DTYPE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Entrada do índice esparso: timestamp (us) do primeiro registro do bloco e
+# posição do bloco no arquivo do segmento
+INDEX_DTYPE = np.dtype([('timestamp', '<u8'), ('offset', '<u8')])
+
+# Registros por bloco do índice (e por bloco comprimido)
+BLOCK_RECORDS = 1024
+
+RAW_SEGMENT = '.seg'
+RAW_INDEX = '.idx'
+COMPRESSED_SEGMENT = '.segz'
+COMPRESSED_INDEX = '.idxz'
+
+# Trava exclusiva do diretório enquanto um RawLogWriter estiver aberto
+LOCK_FILE = 'writer.lock'
+
+
+def _segment_name(start_us):
+    return f"can-{start_us:020d}"
+
+
+def _lock_directory(directory):
+    """Trava o diretório para um único escritor; RuntimeError se outro já o tiver"""
+    handle = open(os.path.join(directory, LOCK_FILE), 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        raise RuntimeError(f"log bruto em {directory} já está aberto por outro processo")
+    return handle
+
+
+class RawLogWriter:
+    """Log bruto de frames CAN, segmentado e somente de acréscimo.
+
+    append() só enfileira os frames; a escrita em disco, a rotação de
+    segmentos e a compressão rodam em threads próprias, então a ingestão
+    nunca espera pelo disco. Cada segmento tem um índice esparso com o
+    timestamp do primeiro registro de cada bloco de BLOCK_RECORDS registros.
+    O diretório fica travado (LOCK_FILE) até close(): um segundo escritor
+    comprimiria e apagaria o segmento que o primeiro ainda está gravando.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, segment_seconds=3600,
+                 compress=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+        self._lock = _lock_directory(directory)
+
+        self._queue = queue.SimpleQueue()
+        self._compress_queue = queue.SimpleQueue()
+        self._segment = None
+        self._index = None
+        self._name = None
+        self._records = 0
+        self._opened_at = 0
+        self._last_ts = 0
+        self.frames_written = 0
+        self.segments_compressed = 0
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        if compress:
+            self._compressor = threading.Thread(target=self._compress_loop, daemon=True)
+            self._compressor.start()
+            # Segmentos que ficaram sem comprimir de uma execução anterior
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(RAW_SEGMENT):
+                    self._compress_queue.put(name[:-len(RAW_SEGMENT)])
+
+    def append(self, frames):
+        """Enfileira um array FRAME_DTYPE com timestamps de relógio de parede (us)"""
+        if len(frames):
+            self._queue.put(frames)
+
+    def close(self):
+        """Grava o que estiver na fila, fecha o segmento atual e libera o diretório"""
+        self._queue.put(None)
+        self._writer.join()
+        if self.compress:
+            # Termina as compressões pendentes antes de outro escritor assumir o diretório
+            self._compress_queue.put(None)
+            self._compressor.join()
+        self._lock.close()
+
+    def _write_loop(self):
+        while True:
+            frames = self._queue.get()
+            if frames is None:
+                self._rotate()
+                return
+            try:
+                self._write(frames)
+            except OSError as e:
+                print(f"Erro ao gravar log bruto: {e}")
+
+    def _write(self, frames):
+        frames = np.array(frames, dtype=FRAME_DTYPE)
+        # Timestamps não decrescentes mantêm a busca binária do índice válida
+        ts = np.maximum.accumulate(frames['timestamp'])
+        frames['timestamp'] = np.maximum(ts, self._last_ts)
+        self._last_ts = int(frames['timestamp'][-1])
+
+        if (self._segment is None
+                or self._records * FRAME_DTYPE.itemsize >= self.segment_bytes
+                or time.monotonic() - self._opened_at >= self.segment_seconds):
+            self._rotate(int(frames['timestamp'][0]))
+
+        first = 0
+        while first < len(frames):
+            # Quebra o lote nos limites de bloco para registrar cada entrada do índice
+            if self._records % BLOCK_RECORDS == 0:
+                entry = np.array([(frames['timestamp'][first], self._records * FRAME_DTYPE.itemsize)],
+                                 dtype=INDEX_DTYPE)
+                self._index.write(entry.tobytes())
+            count = min(len(frames) - first, BLOCK_RECORDS - self._records % BLOCK_RECORDS)
+            self._segment.write(frames[first:first + count].tobytes())
+            self._records += count
+            first += count
+
+        self._segment.flush()
+        self._index.flush()
+        self.frames_written += len(frames)
+
+    def _rotate(self, start_us=None):
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            if self.compress:
+                self._compress_queue.put(self._name)
+            self._segment = None
+        if start_us is None:
+            return
+
+        self._name = _segment_name(start_us)
+        base = os.path.join(self.directory, self._name)
+        self._segment = open(base + RAW_SEGMENT, 'ab')
+        self._index = open(base + RAW_INDEX, 'ab')
+        self._records = 0
+        self._opened_at = time.monotonic()
+
+    def _compress_loop(self):
+        while True:
+            name = self._compress_queue.get()
+            if name is None:
+                return
+            try:
+                compress_segment(self.directory, name)
+                self.segments_compressed += 1
+            except OSError as e:
+                print(f"Erro ao comprimir segmento {name}: {e}")
+
+
+def compress_segment(directory, name):
+    """Comprime um segmento fechado bloco a bloco, preservando o acesso aleatório"""
+    base = os.path.join(directory, name)
+    index = np.fromfile(base + RAW_INDEX, dtype=INDEX_DTYPE)
+    with open(base + RAW_SEGMENT, 'rb') as f:
+        raw = f.read()
+
+    compressed_index = np.empty(len(index), dtype=INDEX_DTYPE)
+    ends = list(index['offset'][1:]) + [len(raw)]
+    offset = 0
+    with open(base + COMPRESSED_SEGMENT + '.tmp', 'wb') as out:
+        for i, (entry, end) in enumerate(zip(index, ends)):
+            block = zlib.compress(raw[int(entry['offset']):int(end)], 6)
+            out.write(block)
+            compressed_index[i] = (entry['timestamp'], offset)
+            offset += len(block)
+    compressed_index.tofile(base + COMPRESSED_INDEX + '.tmp')
+
+    os.replace(base + COMPRESSED_INDEX + '.tmp', base + COMPRESSED_INDEX)
+    os.replace(base + COMPRESSED_SEGMENT + '.tmp', base + COMPRESSED_SEGMENT)
+    for suffix in (RAW_SEGMENT, RAW_INDEX):
+        try:
+            os.remove(base + suffix)
+        except OSError:
+            # Arquivo ainda mapeado por um leitor (Windows): o leitor prefere o .segz
+            pass
+
+
+class RawLogReader:
+    """Consulta por intervalo de tempo nos segmentos de um RawLogWriter"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        """[(início em us, nome, comprimido)] em ordem cronológica"""
+        found = {}
+        for name in os.listdir(self.directory):
+            for suffix, compressed in ((COMPRESSED_SEGMENT, True), (RAW_SEGMENT, False)):
+                if name.endswith(suffix):
+                    base = name[:-len(suffix)]
+                    found[base] = found.get(base, False) or compressed
+        return sorted((int(base.split('-')[1]), base, compressed)
+                      for base, compressed in found.items())
+
+    def read(self, start_ns, end_ns):
+        """Frames com start_ns <= timestamp < end_ns, como array FRAME_DTYPE"""
+        start_us, end_us = start_ns // 1000, end_ns // 1000
+        segments = self.segments()
+        parts = []
+        for i, (seg_start, base, compressed) in enumerate(segments):
+            seg_end = segments[i + 1][0] if i + 1 < len(segments) else None
+            if seg_start >= end_us or (seg_end is not None and seg_end <= start_us):
+                continue
+            try:
+                parts.append(self._read_segment(base, compressed, start_us, end_us))
+            except FileNotFoundError:
+                # Segmento comprimido entre a listagem e a leitura
+                parts.append(self._read_segment(base, True, start_us, end_us))
+        if not parts:
+            return np.empty(0, dtype=FRAME_DTYPE)
+        return np.concatenate(parts)
+
+    def _read_segment(self, base, compressed, start_us, end_us):
+        path = os.path.join(self.directory, base)
+        index = np.fromfile(path + (COMPRESSED_INDEX if compressed else RAW_INDEX), dtype=INDEX_DTYPE)
+        if not len(index):
+            return np.empty(0, dtype=FRAME_DTYPE)
+
+        # Blocos que podem conter o intervalo: o anterior ao primeiro timestamp >= início
+        first = max(np.searchsorted(index['timestamp'], start_us, side='right') - 1, 0)
+        last = np.searchsorted(index['timestamp'], end_us, side='left')
+
+        with open(path + (COMPRESSED_SEGMENT if compressed else RAW_SEGMENT), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return np.empty(0, dtype=FRAME_DTYPE)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                begin = int(index['offset'][first])
+                end = int(index['offset'][last]) if last < len(index) else size
+                if compressed:
+                    offsets = list(index['offset'][first:last + 1]) + [size]
+                    raw = b''.join(zlib.decompress(mm[int(a):int(b)])
+                                   for a, b in zip(offsets[:-1], offsets[1:last - first + 1]))
+                    frames = np.frombuffer(raw, dtype=FRAME_DTYPE)
+                else:
+                    count = (end - begin) // FRAME_DTYPE.itemsize
+                    frames = np.frombuffer(mm, dtype=FRAME_DTYPE, count=count, offset=begin)
+                ts = frames['timestamp']
+                selected = frames[(ts >= start_us) & (ts < end_us)].copy()
+                del frames, ts
+                return selected
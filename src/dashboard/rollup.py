@@ -0,0 +1,224 @@
+import threading
+
+import numpy as np
+
+# Agregado de um intervalo: início (ns), contagem, mínimo, máximo, soma, último
+# valor e integral no tempo (valor x segundos, ex.: L/h x s / 3600 = litros)
+BUCKET_DTYPE = np.dtype([
+    ('start', '<i8'),
+    ('count', '<i8'),
+    ('min', '<f8'),
+    ('max', '<f8'),
+    ('sum', '<f8'),
+    ('last', '<f8'),
+    ('integral', '<f8'),
+])
+
+# Níveis de agregação: (resolução em s, buckets guardados) = 1 dia, 14 dias e 1 ano
+TIERS = ((1, 86_400), (60, 20_160), (3600, 8_760))
+
+# Unidades aceitas em parse_tiers
+UNITS = {'s': 1, 'min': 60, 'h': 3600, 'd': 86_400}
+
+
+def parse_duration(text):
+    """Segundos de uma duração como '30s', '1min', '12h' ou '14d' (sem unidade: segundos)"""
+    text = text.strip()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return float(text[:-len(unit)]) * UNITS[unit]
+    return float(text)
+
+
+def parse_tiers(text):
+    """Níveis no formato TIERS a partir de 'resolução:retenção,...' (ex.: '1s:1d,1min:14d,1h:365d')"""
+    tiers = []
+    for item in text.split(','):
+        resolution, retention = (parse_duration(part) for part in item.split(':'))
+        if resolution <= 0 or retention < resolution:
+            raise ValueError(f"nível de agregação inválido: {item!r}")
+        tiers.append((resolution, int(retention // resolution)))
+    return tuple(sorted(tiers))
+
+
+class BucketRing:
+    """Buckets de uma resolução em anel, com a mesma gravação dupla do RingBuffer.
+
+    O último bucket continua aberto: amostras do mesmo intervalo que chegam
+    no lote seguinte são incorporadas a ele em vez de criar outro. Como no
+    RingBuffer, o armazenamento cresce com os buckets até `capacity`.
+    """
+
+    def __init__(self, resolution_s, capacity, initial=64):
+        self.resolution_ns = int(resolution_s * 1e9)
+        self.capacity = capacity
+        self._size = min(capacity, initial)
+        self._rows = np.zeros(2 * self._size, dtype=BUCKET_DTYPE)
+        self._written = 0
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    @property
+    def span_ns(self):
+        return self.resolution_ns * self.capacity
+
+    def update(self, timestamps, values, integral, summary):
+        """Incorpora amostras em ordem crescente de timestamp.
+
+        summary: (contagem, mínimo, máximo, soma, último, integral) do lote
+        inteiro, reaproveitado quando o lote cai num único bucket.
+        """
+        first_start = timestamps[0] - timestamps[0] % self.resolution_ns
+        if timestamps[-1] - first_start < self.resolution_ns:
+            rows = [(first_start,) + summary]
+        else:
+            starts = timestamps - timestamps % self.resolution_ns
+            first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+            rows = np.empty(len(first), dtype=BUCKET_DTYPE)
+            rows['start'] = starts[first]
+            rows['count'] = np.diff(np.r_[first, len(starts)])
+            rows['min'] = np.minimum.reduceat(values, first)
+            rows['max'] = np.maximum.reduceat(values, first)
+            rows['sum'] = np.add.reduceat(values, first)
+            rows['last'] = values[np.r_[first[1:], len(values)] - 1]
+            rows['integral'] = np.add.reduceat(integral, first)
+            rows = rows.tolist()
+
+        if self._written:
+            i = (self._written - 1) % self._size
+            start, count, low, high, total, last, area = self._rows[i].tolist()
+            if start == rows[0][0]:
+                _, n, lo, hi, sm, new_last, ar = rows[0]
+                merged = (start, count + n, min(low, lo), max(high, hi), total + sm, new_last, area + ar)
+                self._rows[i] = self._rows[i + self._size] = merged
+                rows = rows[1:]
+        if rows:
+            self._extend(np.array(rows, dtype=BUCKET_DTYPE))
+
+    def _reserve(self, n):
+        """Cresce (dobrando, até capacity) para mais n buckets antes da primeira volta"""
+        needed = self._written + n
+        if needed <= self._size or self._size == self.capacity:
+            return
+        size = min(self.capacity, max(2 * self._size, needed))
+        rows = np.zeros(2 * size, dtype=BUCKET_DTYPE)
+        rows[:self._written] = rows[size:size + self._written] = self._rows[:self._written]
+        self._rows = rows
+        self._size = size
+
+    def _extend(self, rows):
+        self._reserve(len(rows))
+        if len(rows) > self.capacity:
+            self._written += len(rows) - self.capacity
+            rows = rows[-self.capacity:]
+        n = len(rows)
+        start = self._written % self._size
+        first = min(n, self._size - start)
+        for offset in (0, self._size):
+            self._rows[start + offset:start + offset + first] = rows[:first]
+            self._rows[offset:offset + n - first] = rows[first:]
+        self._written += n
+
+    def since(self, start_ns):
+        """View dos buckets que terminam depois de start_ns"""
+        end = self._written % self._size + self._size
+        rows = self._rows[end - len(self):end]
+        i = np.searchsorted(rows['start'], start_ns - self.resolution_ns, side='right')
+        return rows[i:]
+
+
+class SignalRollup:
+    """Os níveis de agregação de um sinal, atualizados a cada lote"""
+
+    def __init__(self, tiers, max_gap_ns):
+        self.tiers = [BucketRing(resolution, capacity) for resolution, capacity in tiers]
+        self.max_gap_ns = max_gap_ns
+        self.last = None
+
+    def extend(self, timestamps, values):
+        # Fora de ordem entra no bucket aberto, como no log bruto
+        floor = self.last[0] if self.last is not None else timestamps[0]
+        timestamps = np.maximum(np.maximum.accumulate(timestamps), floor)
+
+        # Integral por retenção do valor anterior até a amostra seguinte;
+        # intervalos maiores que max_gap (ESP32 offline) não contam
+        prev_ts = np.r_[floor, timestamps[:-1]]
+        prev_values = np.r_[self.last[1] if self.last is not None else values[0], values[:-1]]
+        dt = timestamps - prev_ts
+        integral = np.where(dt <= self.max_gap_ns, prev_values * (dt / 1e9), 0.0)
+
+        summary = (len(values), float(values.min()), float(values.max()), float(values.sum()),
+                   float(values[-1]), float(integral.sum()))
+        for tier in self.tiers:
+            tier.update(timestamps, values, integral, summary)
+        self.last = (int(timestamps[-1]), float(values[-1]))
+
+
+class RollupStore:
+    """Agregados de 1 s, 1 min e 1 h por sinal, seguros para um escritor e vários leitores"""
+
+    def __init__(self, tiers=TIERS, max_gap=10.0):
+        self.tiers = tiers
+        self.max_gap_ns = int(max_gap * 1e9)
+        self._signals = {}
+        self._lock = threading.Lock()
+
+    def extend(self, signal, timestamps, values):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if not len(timestamps):
+            return
+        with self._lock:
+            rollup = self._signals.get(signal)
+            if rollup is None:
+                rollup = self._signals[signal] = SignalRollup(self.tiers, self.max_gap_ns)
+            rollup.extend(timestamps, values)
+
+    def window(self, signal, seconds, max_buckets=None, now_ns=None):
+        """(resolução em s, cópia dos buckets) dos últimos `seconds` segundos.
+
+        Usa o nível mais fino que cobre a janela com no máximo max_buckets
+        buckets; se nenhum couber, o mais grosso.
+        """
+        with self._lock:
+            rollup = self._signals.get(signal)
+            if rollup is None:
+                return None, np.empty(0, dtype=BUCKET_DTYPE)
+            window_ns = int(seconds * 1e9)
+            tier = rollup.tiers[-1]
+            for candidate in rollup.tiers:
+                fits = max_buckets is None or window_ns // candidate.resolution_ns <= max_buckets
+                if fits and candidate.span_ns >= window_ns:
+                    tier = candidate
+                    break
+            if now_ns is None:
+                now_ns = rollup.last[0]
+            return tier.resolution_ns / 1e9, tier.since(now_ns - window_ns).copy()
+
+    def total(self, signal, seconds, now_ns=None):
+        """Integral (valor x segundos) dos últimos `seconds` segundos"""
+        _, rows = self.window(signal, seconds, now_ns=now_ns)
+        return float(rows['integral'].sum())
+
+    def signals(self):
+        with self._lock:
+            return list(self._signals)
+
+
+def rollup_series(rows, resolution_s, method='minmax'):
+    """Série para o gráfico a partir dos buckets.
+
+    'minmax' devolve o envelope (mínimo no início e máximo no meio de cada
+    bucket), como o downsampling minmax; os demais métodos, a média.
+    """
+    half = int(resolution_s * 1e9) // 2
+    if method == 'minmax':
+        ts = np.empty(2 * len(rows), dtype=np.int64)
+        values = np.empty(2 * len(rows), dtype=np.float64)
+        ts[0::2] = rows['start']
+        ts[1::2] = rows['start'] + half
+        values[0::2] = rows['min']
+        values[1::2] = rows['max']
+        return ts, values
+    return rows['start'] + half, rows['sum'] / np.maximum(rows['count'], 1)
@@ -0,0 +1,416 @@
+"""Base de sinais CAN carregada de um DBC ou de um esquema JSON.
+
+Esquema JSON (mesma semântica de bits do DBC):
+
+    {"messages": [
+        {"pgn": 61444, "name": "EEC1", "signals": [
+            {"name": "RPM", "spn": 190, "start_bit": 24, "length": 16,
+             "byte_order": "little_endian", "scale": 0.125, "offset": 0, "unit": "RPM"}
+        ]},
+        {"id": 217056256, "name": "Simulador RPM", "signals": [...]}
+    ]}
+
+Mensagens com "pgn" valem para qualquer prioridade/endereço de origem;
+com "id", só para o ID CAN exato (e têm precedência). Em "little_endian"
+(padrão J1939) start_bit é o bit menos significativo; em "big_endian" é o
+bit mais significativo, como no DBC (Motorola).
+
+load_database() compila a base e guarda o resultado em disco, com o hash
+do arquivo como chave: só a primeira carga de um DBC grande paga o parse.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+
+import numpy as np
+
+SIGNALS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'signals')
+# Sinais J1939 decodificados pelo J1939Parser
+J1939_DATABASE = os.path.join(SIGNALS_DIR, 'j1939.json')
+# IDs e payloads de 2 bytes do firmware/simulador do JD Monitor
+SIMULATOR_DATABASE = os.path.join(SIGNALS_DIR, 'jd_monitor.json')
+
+CACHE_DIR = os.environ.get(
+    "JD_MONITOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "jd-monitor"))
+
+# SPN J1939 das grandezas com painel próprio no dashboard; o nome de exibição
+# muda de uma base para outra ("Temperatura" no simulador, "Temperatura Motor"
+# no J1939), o SPN não
+SPNS = {
+    'rpm': 190,          # Engine Speed
+    'velocidade': 84,    # Wheel-Based Vehicle Speed
+    'temperatura': 110,  # Engine Coolant Temperature
+    'combustivel': 96,   # Fuel Level 1
+    'carga': 92,         # Engine Percent Load At Current Speed
+    'consumo': 183,      # Engine Fuel Rate
+    'latitude': 584,
+    'longitude': 585,
+}
+
+# Muda quando o formato compilado muda, invalidando os caches antigos
+CACHE_VERSION = 2
+
+# Chaves de mensagens com ID exato ficam acima do espaço de PGNs (17 bits)
+_ID_KEY = 1 << 32
+
+
+def pgn_of(can_id):
+    """PGN de um ID J1939 de 29 bits.
+
+    Em PDU1 (PF < 240) o byte PS é o endereço de destino e não faz parte
+    do PGN; em PDU2 ele é a extensão do grupo.
+    """
+    pgn = (can_id >> 8) & 0x1FFFF
+    return pgn & 0x1FF00 if (pgn >> 8) & 0xFF < 240 else pgn
+
+
+def pgns_of(can_ids):
+    """pgn_of vetorizado para um array de IDs"""
+    pgns = (np.asarray(can_ids, dtype=np.uint32) >> 8) & 0x1FFFF
+    return np.where((pgns >> 8) & 0xFF < 240, pgns & 0x1FF00, pgns)
+
+
+class Signal:
+    """Definição de um sinal dentro do payload de até 8 bytes"""
+
+    __slots__ = ('name', 'start_bit', 'length', 'little_endian', 'signed', 'scale', 'offset',
+                 'unit', 'spn')
+
+    def __init__(self, name, start_bit, length, little_endian=True, signed=False, scale=1.0,
+                 offset=0.0, unit="", spn=None):
+        self.name = name
+        self.start_bit = start_bit
+        self.length = length
+        self.little_endian = little_endian
+        self.signed = signed
+        self.scale = scale
+        self.offset = offset
+        self.unit = unit
+        self.spn = spn
+
+    def shift(self):
+        """Deslocamento do bit menos significativo no payload lido como inteiro de 64 bits"""
+        if self.little_endian:
+            return self.start_bit
+        msb = (7 - self.start_bit // 8) * 8 + self.start_bit % 8
+        return msb - self.length + 1
+
+    def bytes_needed(self):
+        if self.little_endian:
+            return (self.start_bit + self.length + 7) // 8
+        return 8 - self.shift() // 8
+
+
+class SignalDatabase:
+    """Registro único de decodificadores: sinais por PGN ou por ID CAN exato.
+
+    Cada sinal distinto (pelo nome) recebe um id; `signals` lista (nome,
+    unidade) nessa ordem, como em SignalBatch.
+    """
+
+    def __init__(self, messages=(), source=None):
+        self.source = source
+        self.signals = []
+        self.spns = []
+        self.names = {}
+        self._plans = {}
+        self._keys = np.empty(0, dtype=np.int64)
+        self.ids = ()
+        self.pgns = ()
+        for key, name, signals in messages:
+            self._add(key, name, signals)
+        self._index()
+
+    def _add(self, key, name, signals):
+        kind, number = key
+        key = number | _ID_KEY if kind == 'id' else number
+        signals = [s for s in signals if 0 < s.length <= 64 and 0 <= s.shift() and s.bytes_needed() <= 8]
+        if not signals:
+            return
+        ids = []
+        for s in signals:
+            if s.name not in self.names:
+                self.names[s.name] = len(self.signals)
+                self.signals.append((s.name, s.unit))
+                self.spns.append(s.spn)
+            ids.append(self.names[s.name])
+        self._plans[key] = (
+            name,
+            max(s.bytes_needed() for s in signals),
+            np.array(ids, dtype=np.uint16),
+            np.array([s.shift() for s in signals], dtype=np.uint64),
+            np.array([(1 << s.length) - 1 for s in signals], dtype=np.uint64),
+            np.array([s.little_endian for s in signals]),
+            np.array([s.length if s.signed else 0 for s in signals], dtype=np.int64),
+            np.array([s.scale for s in signals], dtype=np.float64),
+            np.array([s.offset for s in signals], dtype=np.float64),
+            tuple((ids[i], s.shift(), (1 << s.length) - 1, s.little_endian, s.signed, s.length,
+                   s.scale, s.offset) for i, s in enumerate(signals)),
+        )
+
+    def _index(self):
+        self.signals = tuple(self.signals)
+        self.spns = tuple(self.spns)
+        self._keys = np.array(sorted(self._plans), dtype=np.int64)
+        self.ids = tuple(k & 0xFFFFFFFF for k in self._keys.tolist() if k & _ID_KEY)
+        self.pgns = tuple(k for k in self._keys.tolist() if not k & _ID_KEY)
+
+    def __len__(self):
+        return len(self.signals)
+
+    def signal_ids(self, spn):
+        """Ids dos sinais com esse SPN nesta base"""
+        return [signal_id for signal_id, value in enumerate(self.spns) if value == spn]
+
+    def spn_name(self, spn, default=None):
+        """Nome de exibição do sinal com esse SPN (o primeiro, se houver vários)"""
+        ids = self.signal_ids(spn)
+        return self.signals[ids[0]][0] if ids else default
+
+    def message_name(self, can_id=None, pgn=None):
+        plan = self._plan(can_id, pgn)
+        return plan[0] if plan else None
+
+    def _plan(self, can_id=None, pgn=None):
+        if can_id is not None:
+            plan = self._plans.get(can_id | _ID_KEY)
+            if plan is not None:
+                return plan
+            pgn = pgn_of(can_id)
+        return self._plans.get(pgn)
+
+    def decode(self, can_id=None, data=b"", pgn=None):
+        """[(id do sinal, valor)] de um frame (ou payload remontado de um PGN).
+
+        Retorna None se a mensagem não é conhecida ou é curta demais.
+        """
+        plan = self._plan(can_id, pgn)
+        if plan is None or len(data) < plan[1]:
+            return None
+        data = bytes(data[:8]).ljust(8, b'\0')
+        little = int.from_bytes(data, 'little')
+        big = int.from_bytes(data, 'big')
+        values = []
+        for signal_id, shift, mask, little_endian, signed, length, scale, offset in plan[9]:
+            raw = ((little if little_endian else big) >> shift) & mask
+            if signed and raw >> (length - 1):
+                raw -= 1 << length
+            values.append((signal_id, raw * scale + offset))
+        return values
+
+    def decode_batch(self, can_ids, data, dlc=None):
+        """Decodifica N frames de uma vez.
+
+        Retorna (índice do frame, id do sinal, valor), ordenados pelo frame.
+        Frames curtos demais para a mensagem são descartados.
+        """
+        can_ids = np.asarray(can_ids, dtype=np.uint32)
+        data = np.ascontiguousarray(data, dtype=np.uint8).reshape(-1, 8)
+        keys = pgns_of(can_ids).astype(np.int64)
+        if self.ids:
+            exact = np.isin(can_ids, self.ids)
+            keys[exact] = can_ids[exact].astype(np.int64) | _ID_KEY
+
+        known = np.flatnonzero(np.isin(keys, self._keys))
+        order = known[np.argsort(keys[known], kind='stable')]
+        uniq, starts = np.unique(keys[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        little = data.view('<u8').ravel()
+        big = data.view('>u8').ravel()
+
+        frames, signals, values = [], [], []
+        for key, start, end in zip(uniq.tolist(), starts, ends):
+            _, needed, ids, shifts, masks, little_endian, signed, scale, offset, _ = self._plans[key]
+            idx = order[start:end]
+            if dlc is not None:
+                idx = idx[np.asarray(dlc)[idx] >= needed]
+                if not len(idx):
+                    continue
+            # (frames, sinais): uma coluna por sinal da mensagem
+            raw = np.where(little_endian, little[idx, None], big[idx, None])
+            raw = (raw >> shifts) & masks
+            value = raw.astype(np.float64)
+            if signed.any():
+                # Complemento de dois nos sinais com sinal (signed guarda o tamanho em bits)
+                bits = signed.astype(np.float64)
+                value = np.where((signed > 0) & (value >= np.exp2(bits - 1)), value - np.exp2(bits), value)
+            frames.append(np.repeat(idx, len(ids)))
+            signals.append(np.tile(ids, len(idx)))
+            values.append((value * scale + offset).ravel())
+
+        if not frames:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint16),
+                    np.empty(0, dtype=np.float64))
+        frames = np.concatenate(frames)
+        order = np.argsort(frames, kind='stable')
+        return frames[order], np.concatenate(signals)[order], np.concatenate(values)[order]
+
+    def encode_batch(self, values, count, can_id=None, pgn=None):
+        """Payloads (count, 8) de uma mensagem a partir de {nome do sinal: valores}.
+
+        Inverso de decode_batch: os valores são arredondados para a escala e
+        saturados no tamanho do sinal. Bits sem sinal informado ficam em 1
+        ("não disponível" no J1939).
+        """
+        plan = self._plan(can_id, pgn)
+        if plan is None:
+            raise KeyError(f"mensagem desconhecida: id={can_id} pgn={pgn}")
+        little_bits = np.zeros(count, dtype='<u8')
+        little_mask = np.zeros(count, dtype='<u8')
+        big_bits = np.zeros(count, dtype='>u8')
+        big_mask = np.zeros(count, dtype='>u8')
+        for signal_id, shift, mask, little_endian, signed, length, scale, offset in plan[9]:
+            name = self.signals[signal_id][0]
+            if name not in values:
+                continue
+            raw = np.rint((np.asarray(values[name], dtype=np.float64) - offset) / scale)
+            if signed:
+                raw = np.clip(raw, -(1 << (length - 1)), (1 << (length - 1)) - 1)
+            else:
+                raw = np.clip(raw, 0, mask)
+            raw = np.broadcast_to(raw.astype(np.int64).view(np.uint64) & np.uint64(mask), (count,))
+            if little_endian:
+                little_bits |= raw << np.uint64(shift)
+                little_mask |= np.uint64(mask << shift)
+            else:
+                big_bits |= raw << np.uint64(shift)
+                big_mask |= np.uint64(mask << shift)
+        # Combina os dois domínios byte a byte, independente da ordem de bytes da máquina
+        as_bytes = [array.view(np.uint8).reshape(count, 8)
+                    for array in (little_bits, little_mask, big_bits, big_mask)]
+        return ~(as_bytes[1] | as_bytes[3]) | as_bytes[0] | as_bytes[2]
+
+
+_DBC_MESSAGE = re.compile(r'^BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)')
+_DBC_SIGNAL = re.compile(
+    r'^SG_\s+(\w+)\s*(M|m\d+)?\s*:\s*(\d+)\|(\d+)@([01])([+-])\s*'
+    r'\(([^,]+),([^)]+)\)\s*\[[^\]]*\]\s*"([^"]*)"')
+_DBC_SPN = re.compile(r'^BA_\s+"SPN"\s+SG_\s+(\d+)\s+(\w+)\s+(\d+)\s*;')
+
+
+def parse_dbc(text, match='pgn'):
+    """Mensagens de um DBC como [(chave, nome, [Signal])].
+
+    IDs estendidos (bit 31 no BO_) viram chaves por PGN, como no J1939;
+    com match='id', ou para IDs de 11 bits, a chave é o ID exato. Sinais
+    multiplexados (mN) são ignorados; o multiplexador é decodificado.
+    """
+    messages = []
+    by_id = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('BO_ '):
+            m = _DBC_MESSAGE.match(line)
+            if not m:
+                current = None
+                continue
+            raw_id = int(m.group(1))
+            can_id = raw_id & 0x1FFFFFFF
+            if raw_id & 0x80000000 and match == 'pgn':
+                key = ('pgn', pgn_of(can_id))
+            else:
+                key = ('id', can_id)
+            current = []
+            by_id[raw_id] = current
+            messages.append((key, m.group(2), current))
+        elif line.startswith('SG_ ') and current is not None:
+            m = _DBC_SIGNAL.match(line)
+            if not m or (m.group(2) or '').startswith('m'):
+                continue
+            current.append(Signal(
+                m.group(1), int(m.group(3)), int(m.group(4)),
+                little_endian=m.group(5) == '1', signed=m.group(6) == '-',
+                scale=float(m.group(7)), offset=float(m.group(8)), unit=m.group(9)))
+        elif line.startswith('BA_ "SPN"'):
+            m = _DBC_SPN.match(line)
+            if m:
+                for signal in by_id.get(int(m.group(1)), ()):
+                    if signal.name == m.group(2):
+                        signal.spn = int(m.group(3))
+        elif not line.startswith('SG_'):
+            current = None
+    return messages
+
+
+def parse_schema(schema):
+    """Mensagens do esquema JSON como [(chave, nome, [Signal])]"""
+    messages = []
+    for message in schema.get('messages', ()):
+        key = ('id', int(message['id'])) if 'id' in message else ('pgn', int(message['pgn']))
+        signals = [
+            Signal(
+                s['name'], int(s['start_bit']), int(s['length']),
+                little_endian=s.get('byte_order', 'little_endian') == 'little_endian',
+                signed=bool(s.get('signed', False)),
+                scale=float(s.get('scale', 1)), offset=float(s.get('offset', 0)),
+                unit=s.get('unit', ""), spn=s.get('spn'),
+            )
+            for s in message.get('signals', ())
+        ]
+        messages.append((key, message.get('name', ""), signals))
+    return messages
+
+
+def compile_database(path, match='pgn'):
+    """Lê e compila um .dbc ou .json, sem cache"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    if path.lower().endswith('.dbc'):
+        messages = parse_dbc(text, match)
+    else:
+        messages = parse_schema(json.loads(text))
+    return SignalDatabase(messages, source=path)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_database(path=J1939_DATABASE, match='pgn', cache_dir=CACHE_DIR):
+    """Base compilada de `path`, reaproveitando o cache em disco e em memória.
+
+    A chave do cache é o hash do conteúdo do arquivo, então editar o DBC
+    invalida a entrada; cache_dir=None desativa o cache em disco.
+    """
+    digest = _file_hash(path)
+    key = (digest, match)
+    with _loaded_lock:
+        if key in _loaded:
+            return _loaded[key]
+
+    cache_path = None
+    database = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"signals-{digest}-{match}-v{CACHE_VERSION}.pickle")
+        try:
+            with open(cache_path, 'rb') as f:
+                database = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            database = None
+
+    if database is None:
+        database = compile_database(path, match)
+        if cache_path is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as f:
+                    pickle.dump(database, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, cache_path)
+            except OSError as e:
+                print(f"Erro ao gravar cache da base de sinais: {e}")
+
+    with _loaded_lock:
+        return _loaded.setdefault(key, database)
@@ -0,0 +1,93 @@
+import asyncio
+
+import numpy as np
+
+from j1939_parser import FRAME_DTYPE
+
+# ID reservado pelo ESP32 para registros de perda/heartbeat (ver web_server.py)
+GAP_ID = 0xFFFFFFFF
+
+
+class FrameStream:
+    """Cliente assíncrono de /api/stream com reconexão automática.
+
+    batches() só lê o socket quando o consumidor pede o próximo lote; se o
+    consumidor atrasar, o TCP segura o envio e o ESP32 sinaliza a perda.
+    """
+
+    def __init__(self, ip, timeout=5, read_frames=256, max_backoff=10):
+        host, _, port = ip.partition(':')
+        self.host = host
+        self.port = int(port or 80)
+        self.timeout = timeout
+        self.read_size = read_frames * FRAME_DTYPE.itemsize
+        self.max_backoff = max_backoff
+        self.status = {'wifi_ssid': '', 'wifi_ip': ip, 'wifi_signal': 0}
+        self.connected = False
+        self.reconnects = 0
+        self.dropped = 0
+        self.closed = False
+
+    async def _connect(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        writer.write(f"GET /api/stream HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode())
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if b" 200 " not in status_line:
+            writer.close()
+            raise ConnectionError(f"Resposta inesperada: {status_line!r}")
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        self.status = {
+            'wifi_ssid': headers.get('x-wifi-ssid', ''),
+            'wifi_ip': headers.get('x-wifi-ip') or self.status['wifi_ip'],
+            'wifi_signal': int(headers.get('x-wifi-signal', 0)),
+        }
+        return reader, writer
+
+    async def batches(self):
+        """Gera arrays FRAME_DTYPE conforme chegam, reconectando com backoff"""
+        backoff = 0.5
+        itemsize = FRAME_DTYPE.itemsize
+        while not self.closed:
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                self.connected = True
+                backoff = 0.5
+                pending = b""
+                while not self.closed:
+                    chunk = await asyncio.wait_for(reader.read(self.read_size), self.timeout)
+                    if not chunk:
+                        raise ConnectionError("Stream encerrado pelo ESP32")
+                    pending += chunk
+                    usable = len(pending) - len(pending) % itemsize
+                    if not usable:
+                        continue
+                    frames = np.frombuffer(pending[:usable], dtype=FRAME_DTYPE)
+                    pending = pending[usable:]
+
+                    gaps = frames['can_id'] == GAP_ID
+                    if gaps.any():
+                        self.dropped += int(frames['timestamp'][gaps].sum())
+                        frames = frames[~gaps]
+                    if len(frames):
+                        yield frames
+            except (OSError, asyncio.TimeoutError, ConnectionError, ValueError) as e:
+                print(f"Erro no stream do ESP32: {e}")
+            finally:
+                self.connected = False
+                if writer is not None:
+                    writer.close()
+            if not self.closed:
+                self.reconnects += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
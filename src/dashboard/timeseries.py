@@ -0,0 +1,164 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """Série temporal de capacidade fixa (timestamp int64 ns, valor float64).
+
+    Cada amostra é gravada duas vezes (posições i e i + capacity), de modo que
+    as últimas N amostras sempre formam um trecho contíguo e podem ser lidas
+    como views, sem cópia. Timestamps devem chegar em ordem crescente.
+
+    O armazenamento começa com `initial` posições e dobra conforme as
+    amostras chegam, até `capacity`: um sinal raro não ocupa a capacidade
+    inteira.
+    """
+
+    def __init__(self, capacity, initial=1024):
+        self.capacity = capacity
+        self._size = min(capacity, initial)
+        self._ts = np.zeros(2 * self._size, dtype=np.int64)
+        self._values = np.zeros(2 * self._size, dtype=np.float64)
+        self._written = 0
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    @property
+    def version(self):
+        """Total de amostras já gravadas; muda a cada escrita"""
+        return self._written
+
+    def _reserve(self, n):
+        """Cresce (dobrando, até capacity) para mais n amostras antes da primeira volta"""
+        needed = self._written + n
+        if needed <= self._size or self._size == self.capacity:
+            return
+        size = min(self.capacity, max(2 * self._size, needed))
+        for name in ('_ts', '_values'):
+            old = getattr(self, name)
+            new = np.zeros(2 * size, dtype=old.dtype)
+            new[:self._written] = new[size:size + self._written] = old[:self._written]
+            setattr(self, name, new)
+        self._size = size
+
+    def append(self, timestamp, value):
+        """Adiciona uma amostra em O(1) amortizado"""
+        self._reserve(1)
+        i = self._written % self._size
+        self._ts[i] = self._ts[i + self._size] = timestamp
+        self._values[i] = self._values[i + self._size] = value
+        self._written += 1
+
+    def extend(self, timestamps, values):
+        """Adiciona um lote de amostras"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        self._reserve(len(timestamps))
+        if len(timestamps) > self.capacity:
+            self._written += len(timestamps) - self.capacity
+            timestamps = timestamps[-self.capacity:]
+            values = values[-self.capacity:]
+
+        n = len(timestamps)
+        start = self._written % self._size
+        first = min(n, self._size - start)
+        for offset in (0, self._size):
+            self._ts[start + offset:start + offset + first] = timestamps[:first]
+            self._values[start + offset:start + offset + first] = values[:first]
+            self._ts[offset:offset + n - first] = timestamps[first:]
+            self._values[offset:offset + n - first] = values[first:]
+        self._written += n
+
+    def last(self, n=None):
+        """Views somente leitura das últimas n amostras (todas, se n for None)"""
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self._written % self._size + self._size
+        ts = self._ts[end - n:end]
+        values = self._values[end - n:end]
+        ts.flags.writeable = False
+        values.flags.writeable = False
+        return ts, values
+
+    def since(self, start_ns):
+        """Views das amostras com timestamp >= start_ns (busca binária)"""
+        ts, values = self.last()
+        i = np.searchsorted(ts, start_ns, side='left')
+        return ts[i:], values[i:]
+
+    def latest(self):
+        """Última amostra (timestamp, valor) ou None"""
+        if not self._written:
+            return None
+        i = (self._written - 1) % self._size
+        return int(self._ts[i]), float(self._values[i])
+
+
+def frame_groups(df):
+    """(sinal, timestamps ns, valores) de um DataFrame no formato (timestamp, tipo, valor)"""
+    for signal, group in df.groupby('tipo', sort=False):
+        yield (signal, group['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+               group['valor'].to_numpy(dtype=np.float64))
+
+
+class SignalStore:
+    """Um RingBuffer por sinal, seguro para um escritor e vários leitores"""
+
+    def __init__(self, capacity=200_000):
+        self.capacity = capacity
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def signals(self):
+        with self._lock:
+            return list(self._buffers)
+
+    def extend(self, signal, timestamps, values):
+        with self._lock:
+            buffer = self._buffers.get(signal)
+            if buffer is None:
+                buffer = self._buffers[signal] = RingBuffer(self.capacity)
+            buffer.extend(timestamps, values)
+
+    def extend_frame(self, df):
+        """Grava um DataFrame no formato (timestamp, tipo, valor)"""
+        for signal, timestamps, values in frame_groups(df):
+            self.extend(signal, timestamps, values)
+
+    def window(self, signal, seconds, now_ns=None):
+        """Cópia das amostras dos últimos `seconds` segundos (relativos à mais recente)"""
+        with self._lock:
+            buffer = self._buffers.get(signal)
+            if buffer is None or not len(buffer):
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+            if now_ns is None:
+                now_ns = buffer.latest()[0]
+            ts, values = buffer.since(now_ns - int(seconds * 1e9))
+            return ts.copy(), values.copy()
+
+    def covers(self, signal, seconds):
+        """Se as amostras guardadas alcançam `seconds` segundos antes da mais recente"""
+        with self._lock:
+            buffer = self._buffers.get(signal)
+            if buffer is None or len(buffer) < buffer.capacity:
+                # Nada foi descartado ainda: o buffer tem todo o histórico existente
+                return True
+            ts, _ = buffer.last()
+            return ts[0] <= ts[-1] - int(seconds * 1e9)
+
+    def version(self, signal):
+        with self._lock:
+            buffer = self._buffers.get(signal)
+            return buffer.version if buffer is not None else 0
+
+    def latest(self, signal):
+        with self._lock:
+            buffer = self._buffers.get(signal)
+            return buffer.latest() if buffer is not None else None
+
+    def __len__(self):
+        """Total de amostras armazenadas"""
+        with self._lock:
+            return sum(len(buffer) for buffer in self._buffers.values())
@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+
+# Metros por pixel no zoom 0 do Web Mercator (tiles de 256 px), no equador
+METERS_PER_PIXEL_Z0 = 156543.03392
+EARTH_RADIUS = 6_378_137.0
+
+
+def meters_per_pixel(lat, zoom):
+    return METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def douglas_peucker(x, y, tolerance):
+    """Índices dos vértices mantidos pelo Douglas-Peucker (sempre o primeiro e o último)"""
+    n = len(x)
+    if n <= 2:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        px = x[a + 1:b] - x[a]
+        py = y[a + 1:b] - y[a]
+        dx = x[b] - x[a]
+        dy = y[b] - y[a]
+        length = dx * dx + dy * dy
+        if length > 0:
+            # Distância ao segmento (projeção limitada às pontas)
+            t = np.clip((px * dx + py * dy) / length, 0.0, 1.0)
+            px = px - t * dx
+            py = py - t * dy
+        distance = px * px + py * py
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance * tolerance:
+            k = a + 1 + i
+            keep[k] = True
+            stack.append((a, k))
+            stack.append((k, b))
+    return np.flatnonzero(keep)
+
+
+class TrackStore:
+    """Trajeto GPS acumulado em trechos, simplificado conforme o zoom.
+
+    As posições entram na cauda; a cada `chunk_size` fixes a cauda vira um
+    trecho fechado, cuja simplificação por zoom é calculada uma vez e
+    guardada. Só a cauda (no máximo chunk_size pontos) é simplificada de
+    novo a cada atualização. A tolerância é `pixel_tolerance` pixels
+    convertidos para metros no zoom pedido.
+    """
+
+    def __init__(self, chunk_size=512, pixel_tolerance=1.0):
+        self.chunk_size = chunk_size
+        self.pixel_tolerance = pixel_tolerance
+        self._chunks = []
+        self._simplified = []
+        self._tail = []
+        self._ref_lat = None
+        self.fixes = 0
+
+    def __len__(self):
+        return self.fixes
+
+    @property
+    def frozen_chunks(self):
+        """Número de trechos fechados; muda só quando a cauda é fechada"""
+        return len(self._chunks)
+
+    def append(self, lat, lon):
+        """Adiciona um fix; ignora posições inválidas e fixes parados no mesmo ponto"""
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+            return False
+        if self._tail and self._tail[-1] == (lat, lon):
+            return False
+        if self._ref_lat is None:
+            self._ref_lat = lat
+        self._tail.append((lat, lon))
+        self.fixes += 1
+        if len(self._tail) >= self.chunk_size:
+            self._chunks.append(np.array(self._tail, dtype=np.float64))
+            self._simplified.append({})
+            # O próximo trecho começa no último ponto deste, sem buraco na linha
+            self._tail = [self._tail[-1]]
+        return True
+
+    def extend(self, lats, lons):
+        for lat, lon in zip(lats, lons):
+            self.append(float(lat), float(lon))
+
+    def last(self):
+        return list(self._tail[-1]) if self._tail else None
+
+    def _simplify(self, points, zoom):
+        if len(points) <= 2:
+            return points.tolist()
+        scale = math.radians(1) * EARTH_RADIUS
+        x = points[:, 1] * scale * math.cos(math.radians(self._ref_lat))
+        y = points[:, 0] * scale
+        tolerance = self.pixel_tolerance * meters_per_pixel(self._ref_lat, zoom)
+        return points[douglas_peucker(x, y, tolerance)].tolist()
+
+    def frozen(self, zoom):
+        """Trechos fechados simplificados para o zoom, como listas [[lat, lon], ...]"""
+        result = []
+        for chunk, cache in zip(self._chunks, self._simplified):
+            if zoom not in cache:
+                cache[zoom] = self._simplify(chunk, zoom)
+            result.append(cache[zoom])
+        return result
+
+    def tail(self, zoom):
+        """Cauda aberta simplificada para o zoom"""
+        if not self._tail:
+            return []
+        return self._simplify(np.array(self._tail, dtype=np.float64), zoom)
+
+    def vertices(self, zoom):
+        """Total de vértices desenhados no zoom"""
+        return sum(len(chunk) for chunk in self.frozen(zoom)) + len(self.tail(zoom))
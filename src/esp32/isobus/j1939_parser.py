@@ -0,0 +1,193 @@
+import struct
+
+# Formatos struct (little-endian) para campos alinhados em byte
+_ALIGNED_FORMATS = {8: 'B', 16: 'H', 32: 'I'}
+
+# Esquema de sinais compartilhado com o dashboard (src/dashboard/signals); no
+# ESP32 o tools/upload_esp32.py grava uma cópia ao lado deste módulo
+SCHEMA = 'j1939.json'
+
+# Mensagens decodificadas aqui, de frame único ou remontadas do TP
+DM1_PGN = 0xFECA
+VIN_PGN = 0xFEEC
+
+
+def _here():
+    here = __file__.replace('\\', '/')
+    return here.rsplit('/', 1)[0] if '/' in here else '.'
+
+
+try:
+    from j1939_transport import TP_CM, TP_DT, TransportReassembler
+except ImportError:
+    # No repositório o remontador fica em src/dashboard; no ESP32, na raiz
+    # do sistema de arquivos (tools/upload_esp32.py)
+    import sys
+    sys.path.append(_here() + '/../../dashboard')
+    from j1939_transport import TP_CM, TP_DT, TransportReassembler
+
+
+def schema_path():
+    """Cópia ao lado do módulo (ESP32) ou o esquema do dashboard (repositório)"""
+    here = _here()
+    for path in (here + '/' + SCHEMA, here + '/../../dashboard/signals/' + SCHEMA):
+        try:
+            open(path).close()
+            return path
+        except OSError:
+            pass
+    raise OSError('esquema de sinais não encontrado: ' + SCHEMA)
+
+
+def load_schema(path):
+    """pgn_config a partir de um esquema JSON da base de sinais do dashboard.
+
+    Só entram sinais little-endian (padrão J1939) de mensagens por PGN;
+    mensagens por ID exato e sinais big-endian são ignorados.
+    """
+    import json
+
+    with open(path) as f:
+        schema = json.load(f)
+    pgn_config = {}
+    for message in schema.get('messages', ()):
+        if 'pgn' not in message:
+            continue
+        spns = {}
+        for i, signal in enumerate(message.get('signals', ())):
+            if signal.get('byte_order', 'little_endian') != 'little_endian':
+                continue
+            spns[signal.get('spn', -1 - i)] = {
+                'start_bit': signal['start_bit'],
+                'length': signal['length'],
+                'resolution': signal.get('scale', 1),
+                'offset': signal.get('offset', 0),
+                'name': signal['name'],
+            }
+        if spns:
+            pgn_config[int(message['pgn'])] = {'spns': spns}
+    return pgn_config
+
+
+def parse_dm1(data):
+    """DTCs ativos de um DM1: [(SPN, FMI, ocorrências)]"""
+    dtcs = []
+    # Bytes 0-1: lâmpadas; depois, DTCs de 4 bytes
+    for i in range(2, len(data) - 3, 4):
+        spn = data[i] | (data[i + 1] << 8) | ((data[i + 2] & 0xE0) << 11)
+        fmi = data[i + 2] & 0x1F
+        if spn or fmi:
+            dtcs.append((spn, fmi, data[i + 3] & 0x7F))
+    return dtcs
+
+
+class J1939Parser:
+    def __init__(self, schema=None, max_sessions=4):
+        # Mesmos layouts da base de sinais do dashboard, para os dois lados
+        # decodificarem um frame igual
+        self.pgn_config = load_schema(schema or schema_path())
+        # Poucas sessões TP simultâneas: cada uma reserva 1785 bytes
+        self.transport = TransportReassembler(max_sessions)
+        self.compile()
+
+    @classmethod
+    def from_schema(cls, path):
+        """Parser com os PGNs de outro esquema JSON"""
+        return cls(path)
+
+    def compile(self):
+        """Compila pgn_config em planos de decodificação por PGN.
+
+        Deve ser chamado novamente sempre que pgn_config for alterado.
+        """
+        self._plans = {}
+        for pgn, pgn_def in self.pgn_config.items():
+            self._plans[pgn] = self._compile_pgn(pgn_def['spns'])
+
+    def _compile_pgn(self, spns):
+        # Campos alinhados em byte com 8/16/32 bits viram um único formato struct;
+        # os demais usam constantes de deslocamento/máscara pré-calculadas
+        aligned = []
+        fields = []
+        size = 0
+        for spn, config in spns.items():
+            start_byte = config['start_bit'] // 8
+            bit_offset = config['start_bit'] % 8
+            byte_length = (config['length'] + 7) // 8
+            resolution = config.get('resolution')
+            offset = config.get('offset', 0)
+            size = max(size, start_byte + byte_length)
+            if bit_offset == 0 and config['length'] in _ALIGNED_FORMATS:
+                aligned.append((start_byte, byte_length, config['name'], resolution, offset))
+            else:
+                fields.append((config['name'], start_byte, start_byte + byte_length,
+                               bit_offset, (1 << config['length']) - 1, resolution, offset))
+
+        aligned.sort()
+        fmt = '<'
+        names = []
+        pos = aligned[0][0] if aligned else 0
+        first = pos
+        for start_byte, byte_length, name, resolution, offset in aligned:
+            if start_byte < pos:
+                # Campos sobrepostos não cabem em um único formato
+                fields.append((name, start_byte, start_byte + byte_length, 0,
+                               (1 << (byte_length * 8)) - 1, resolution, offset))
+                continue
+            if start_byte > pos:
+                fmt += '%ds' % (start_byte - pos)
+                names.append(None)
+            fmt += _ALIGNED_FORMATS[byte_length * 8]
+            names.append((name, resolution, offset))
+            pos = start_byte + byte_length
+
+        return (size, fmt if len(fmt) > 1 else None, first, tuple(names), tuple(fields))
+
+    def parse_message(self, msg_id, data, now=None):
+        """Valores de um frame. TP.CM/TP.DT passam pelo remontador e a mensagem
+        sai no último pacote; now é o timestamp do frame em segundos desde a
+        época (padrão: agora). DM1 vem em 'dtcs' e o VIN em 'vin'.
+        """
+        if (msg_id >> 16) & 0xFF in (TP_CM, TP_DT):
+            message = self.transport.feed(msg_id, data, now)
+            if message is None:
+                return None
+            _, pgn, data = message
+        else:
+            pgn = (msg_id >> 8) & 0x1FFFF
+            if (pgn >> 8) & 0xFF < 240:
+                # PDU1: o byte PS é o destino, não parte do PGN
+                pgn &= 0x1FF00
+        if pgn == DM1_PGN:
+            return {'pgn': pgn, 'dtcs': parse_dm1(data)}
+        if pgn == VIN_PGN:
+            return {'pgn': pgn, 'vin': bytes(data).decode().split('*')[0].strip()}
+        plan = self._plans.get(pgn)
+        if plan is None:
+            return None
+
+        size, fmt, first, names, fields = plan
+        if len(data) < size:
+            # Bytes ausentes valem zero, como na leitura byte a byte
+            data = bytes(data) + bytes(size - len(data))
+
+        spn_vals = {}
+        if fmt is not None:
+            for name, value in zip(names, struct.unpack_from(fmt, data, first)):
+                if name is None:
+                    continue
+                if name[1] is not None:
+                    value = value * name[1]
+                if name[2]:
+                    value = value + name[2]
+                spn_vals[name[0]] = value
+
+        for name, start, end, shift, mask, resolution, offset in fields:
+            value = (int.from_bytes(data[start:end], 'little') >> shift) & mask
+            if resolution is not None:
+                value = value * resolution
+            if offset:
+                value = value + offset
+            spn_vals[name] = value
+
+        return {'pgn': pgn, 'spn_vals': spn_vals}
@@ -0,0 +1,111 @@
+"""Ponto de entrada do firmware: WiFi, leitura do CAN e servidor web.
+
+O MicroPython executa este arquivo no boot. Os frames lidos do controlador
+CAN (TWAI) vão para o FrameBuffer, que o WebServer serve em /api/data,
+/api/frames.bin e /api/stream.
+"""
+import json
+import time
+import uasyncio as asyncio
+
+from web_server import FrameBuffer, WebServer, MAX_FRAMES
+
+# Barramento ISOBUS/J1939: 250 kbit/s, IDs de 29 bits
+CAN_BITRATE = 250_000
+CAN_TX = 5
+CAN_RX = 4
+
+# Frames lidos por vez antes de devolver o controle ao servidor web
+CAN_BATCH = 32
+CAN_IDLE_MS = 5
+
+# Rede própria quando não há wifi.json ({"ssid": ..., "password": ...})
+AP_SSID = 'JD_Monitor'
+AP_PASSWORD = '12345678'
+WIFI_CONFIG = 'wifi.json'
+WIFI_TIMEOUT_MS = 15000
+
+
+def load_wifi_config(path=WIFI_CONFIG):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def start_wifi(config):
+    """Conecta na rede de config; sem config ou sem conexão, abre o AP"""
+    import network
+
+    if config:
+        wlan = network.WLAN(network.STA_IF)
+        wlan.active(True)
+        wlan.connect(config['ssid'], config.get('password', ''))
+        started = time.ticks_ms()
+        while not wlan.isconnected() and time.ticks_diff(time.ticks_ms(), started) < WIFI_TIMEOUT_MS:
+            time.sleep_ms(200)
+        if wlan.isconnected():
+            print("WiFi conectado:", wlan.ifconfig()[0])
+            try:
+                # Relógio em UTC para os timestamps dos frames
+                import ntptime
+                ntptime.settime()
+            except Exception as e:
+                print("NTP indisponível:", e)
+            return wlan
+        print("Sem conexão com", config['ssid'], "- abrindo o AP")
+        wlan.active(False)
+    ap = network.WLAN(network.AP_IF)
+    ap.active(True)
+    ap.config(essid=AP_SSID, password=AP_PASSWORD, authmode=network.AUTH_WPA_WPA2_PSK)
+    print("AP", AP_SSID, "em", ap.ifconfig()[0])
+    # WebServer.wifi_info só reporta a rede da estação
+    return None
+
+
+def open_can():
+    """Controlador CAN nativo (TWAI) ou None se o port do MicroPython não tiver"""
+    try:
+        from machine import CAN
+    except ImportError:
+        print("machine.CAN indisponível: servidor sem leitura do barramento")
+        return None
+    return CAN(0, tx=CAN_TX, rx=CAN_RX, baudrate=CAN_BITRATE, mode=CAN.NORMAL, extframe=True)
+
+
+async def read_can(can, frames):
+    """Copia os frames recebidos para o buffer, CAN_BATCH por vez.
+
+    recv() devolve uma tupla com o ID primeiro e os dados por último (o
+    meio varia entre ports). Um erro do controlador (bus-off, overrun) é
+    registrado e a leitura continua.
+    """
+    while True:
+        count = 0
+        try:
+            while count < CAN_BATCH and can.any(0):
+                message = can.recv(0)
+                frames.add(message[0], message[-1])
+                count += 1
+        except OSError as e:
+            print("Erro no CAN:", e)
+        if count < CAN_BATCH:
+            await asyncio.sleep(CAN_IDLE_MS / 1000)
+        else:
+            await asyncio.sleep(0)
+
+
+async def main():
+    wlan = start_wifi(load_wifi_config())
+    frames = FrameBuffer(MAX_FRAMES)
+    server = WebServer(frames, wlan=wlan)
+    can = open_can()
+    if can is None:
+        await server.serve()
+    else:
+        await asyncio.gather(server.serve(), read_can(can, frames))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,251 @@
+import binascii
+import json
+import struct
+import time
+import uasyncio as asyncio
+
+# Registro binário de um frame: timestamp (us), ID de 29 bits, DLC e 8 bytes de dados
+FRAME_FORMAT = '<QIB8s'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+MAX_FRAMES = 256
+
+# Streaming: intervalo de envio e ID reservado (> 29 bits) para o registro de perda,
+# cujo campo timestamp carrega a quantidade de frames perdidos (0 = heartbeat)
+STREAM_INTERVAL_MS = 20
+STREAM_BATCH = 64
+STREAM_HEARTBEAT_MS = 1000
+GAP_ID = 0xFFFFFFFF
+
+# Frames por resposta de /api/data e /api/frames.bin com ?since=
+API_BATCH = 128
+
+
+class FrameBuffer:
+    """Buffer circular pré-alocado com os últimos frames CAN recebidos.
+
+    Cada frame recebe um número de sequência crescente (seq); o frame k fica
+    na posição k % size do buffer.
+    """
+
+    def __init__(self, size=MAX_FRAMES):
+        self.size = size
+        self.seq = 0
+        self._buf = bytearray(size * FRAME_SIZE)
+        self._count = 0
+
+    def add(self, can_id, data, timestamp_us=None):
+        """Grava um frame no buffer, sobrescrevendo o mais antigo"""
+        if timestamp_us is None:
+            timestamp_us = time.time_ns() // 1000
+        struct.pack_into(FRAME_FORMAT, self._buf, (self.seq % self.size) * FRAME_SIZE,
+                         timestamp_us, can_id & 0x1FFFFFFF, len(data), bytes(data))
+        self.seq += 1
+        if self._count < self.size:
+            self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def since(self, seq, limit=None):
+        """Frames com sequência >= seq: (registros, próximo seq, frames perdidos)"""
+        oldest = self.seq - self._count
+        if seq > self.seq:
+            # Cursor de antes de um reboot: recomeça do frame mais antigo
+            seq = oldest
+        lost = 0
+        if seq < oldest:
+            lost = oldest - seq
+            seq = oldest
+        count = max(self.seq - seq, 0)
+        if limit is not None and count > limit:
+            count = limit
+        start = seq % self.size
+        end = start + count
+        if end <= self.size:
+            raw = bytes(self._buf[start * FRAME_SIZE:end * FRAME_SIZE])
+        else:
+            raw = (bytes(self._buf[start * FRAME_SIZE:])
+                   + bytes(self._buf[:(end - self.size) * FRAME_SIZE]))
+        return raw, seq + count, lost
+
+    def to_bytes(self):
+        """Registros em ordem cronológica"""
+        return self.since(self.seq - self._count)[0]
+
+    def messages(self, raw=None):
+        """Frames no formato texto "ID: 0x... Data: ..." (depuração)"""
+        if raw is None:
+            raw = self.to_bytes()
+        result = []
+        for offset in range(0, len(raw), FRAME_SIZE):
+            _, can_id, dlc, data = struct.unpack_from(FRAME_FORMAT, raw, offset)
+            result.append("ID: 0x%X Data: %s" % (can_id, binascii.hexlify(data[:dlc]).decode()))
+        return result
+
+
+def parse_query(query):
+    """Parâmetros de uma query string simples (sem escapes)"""
+    params = {}
+    for pair in query.split('&'):
+        name, _, value = pair.partition('=')
+        if name:
+            params[name] = value
+    return params
+
+
+def cursor_params(query):
+    """(since, limit) de ?since=<seq>&limit=<n>; since None se ausente ou inválido"""
+    params = parse_query(query)
+    try:
+        since = int(params['since'])
+    except (KeyError, ValueError):
+        return None, API_BATCH
+    try:
+        limit = max(1, min(int(params.get('limit', API_BATCH)), MAX_FRAMES))
+    except ValueError:
+        limit = API_BATCH
+    return since, limit
+
+
+class WebServer:
+    """Servidor HTTP do monitor: status WiFi e frames CAN"""
+
+    def __init__(self, frames, wlan=None, port=80):
+        self.frames = frames
+        self.wlan = wlan
+        self.port = port
+        self.routes = {
+            '/': self.index,
+            '/api/data': self.api_data,
+            '/api/frames.bin': self.api_frames_bin,
+            '/api/stream': self.api_stream,
+        }
+
+    def wifi_info(self):
+        if self.wlan is None or not self.wlan.isconnected():
+            return {'wifi_ssid': '', 'wifi_ip': '', 'wifi_signal': 0}
+        return {
+            'wifi_ssid': self.wlan.config('essid'),
+            'wifi_ip': self.wlan.ifconfig()[0],
+            'wifi_signal': self.wlan.status('rssi'),
+        }
+
+    async def index(self, writer, query):
+        with open('index.html', 'rb') as f:
+            body = f.read()
+        await self.send(writer, body, 'text/html')
+
+    async def api_data(self, writer, query):
+        """Frames em texto no JSON, mantido como fallback de depuração.
+
+        Sem parâmetros, devolve o buffer inteiro. Com ?since=<seq>, só os
+        frames a partir de seq (no máximo limit), o cursor da próxima
+        consulta em "seq" e, em "gap", quantos frames o cliente perdeu por
+        ficar para trás.
+        """
+        data = self.wifi_info()
+        since, limit = cursor_params(query)
+        if since is None:
+            data['can_messages'] = self.frames.messages()
+        else:
+            raw, data['seq'], data['gap'] = self.frames.since(since, limit)
+            data['can_messages'] = self.frames.messages(raw)
+        await self.send(writer, json.dumps(data), 'application/json')
+
+    def binary_headers(self):
+        info = self.wifi_info()
+        return {
+            'X-Frame-Size': FRAME_SIZE,
+            'X-WiFi-SSID': info['wifi_ssid'],
+            'X-WiFi-IP': info['wifi_ip'],
+            'X-WiFi-Signal': info['wifi_signal'],
+        }
+
+    async def api_frames_bin(self, writer, query):
+        """Registros binários de tamanho fixo; status WiFi vai nos headers.
+
+        Aceita ?since=<seq>&limit=<n> como /api/data, com o cursor e a
+        perda nos headers X-Seq e X-Gap.
+        """
+        headers = self.binary_headers()
+        since, limit = cursor_params(query)
+        if since is None:
+            body = self.frames.to_bytes()
+        else:
+            body, headers['X-Seq'], headers['X-Gap'] = self.frames.since(since, limit)
+        await self.send(writer, body, 'application/octet-stream', headers)
+
+    async def api_stream(self, writer, query):
+        """Envia registros binários continuamente enquanto o cliente estiver conectado.
+
+        Se o cliente não acompanhar, drain() segura o envio e os frames
+        sobrescritos no buffer são sinalizados com um registro GAP_ID. Sem
+        tráfego, um registro GAP_ID com zero perdas serve de heartbeat.
+        """
+        head = 'HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nCache-Control: no-cache\r\n'
+        for name, value in self.binary_headers().items():
+            head += '%s: %s\r\n' % (name, value)
+        writer.write(head.encode() + b'Connection: close\r\n\r\n')
+        seq = self.frames.seq
+        idle = 0
+        try:
+            await writer.drain()
+            while True:
+                raw, seq, lost = self.frames.since(seq, STREAM_BATCH)
+                if lost or (not raw and idle >= STREAM_HEARTBEAT_MS):
+                    writer.write(struct.pack(FRAME_FORMAT, lost, GAP_ID, 0, b''))
+                    idle = 0
+                if raw:
+                    writer.write(raw)
+                    idle = 0
+                await writer.drain()
+                if seq == self.frames.seq:
+                    await asyncio.sleep(STREAM_INTERVAL_MS / 1000)
+                    idle += STREAM_INTERVAL_MS
+        except OSError:
+            # Cliente desconectou
+            pass
+
+    async def send(self, writer, body, content_type, headers=None, status='200 OK'):
+        if isinstance(body, str):
+            body = body.encode()
+        head = 'HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n' % (
+            status, content_type, len(body))
+        for name, value in (headers or {}).items():
+            head += '%s: %s\r\n' % (name, value)
+        writer.write(head.encode() + b'Connection: close\r\n\r\n')
+        writer.write(body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            # Descarta os headers da requisição
+            while True:
+                line = await reader.readline()
+                if not line or line == b'\r\n':
+                    break
+
+            parts = request.decode().split(' ')
+            if len(parts) < 2:
+                return
+            path, _, query = parts[1].partition('?')
+            route = self.routes.get(path)
+            if route is None:
+                await self.send(writer, '{"error": "not found"}', 'application/json',
+                                status='404 Not Found')
+            else:
+                await route(writer, query)
+        except Exception as e:
+            print("Erro no servidor web:", e)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def serve(self):
+        await asyncio.start_server(self.handle, '0.0.0.0', self.port)
+        while True:
+            await asyncio.sleep(3600)
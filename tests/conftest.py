@@ -0,0 +1,20 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'dashboard'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'esp32'))
+
+# O firmware usa uasyncio; no CPython a API equivalente é asyncio
+sys.modules.setdefault('uasyncio', asyncio)
+
+from signal_db import J1939_DATABASE, load_database
+
+
+@pytest.fixture(scope='session')
+def database():
+    """Base J1939 compilada sem o cache em disco"""
+    return load_database(J1939_DATABASE, cache_dir=None)
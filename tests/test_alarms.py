@@ -0,0 +1,63 @@
+import numpy as np
+
+from alarms import CLEARED, FIRED, AlarmEngine
+
+S = 1_000_000_000
+
+COOLANT = {"name": "Temperatura alta", "severity": "crítico",
+           "all": [{"spn": 110, "op": ">", "value": 105, "hysteresis": 5}]}
+
+
+def evaluate(engine, database, name, values, step=S, start=0):
+    signal = [n for n, _ in database.signals].index(name)
+    timestamps = start + np.arange(len(values), dtype=np.int64) * step
+    return [(e.timestamp, e.state) for e in
+            engine.evaluate(timestamps, np.full(len(values), signal), np.asarray(values, float))]
+
+
+def test_hysteresis(database):
+    engine = AlarmEngine([COOLANT], database)
+    events = evaluate(engine, database, "Temperatura Motor", [100, 105, 106, 103, 101, 100, 99, 106])
+    # 105 não passa de "> 105"; normaliza quando deixa de passar de 105 - 5
+    assert events == [(2 * S, FIRED), (5 * S, CLEARED), (7 * S, FIRED)]
+    assert engine.active_alarms() == [("Temperatura alta", "crítico")]
+
+
+def test_inclusive_operator_boundary(database):
+    rule = {"name": "Combustível baixo", "all": [{"spn": 96, "op": "<=", "value": 10}]}
+    engine = AlarmEngine([rule], database)
+    assert evaluate(engine, database, "Nível Combustível", [12, 10, 11]) == [(S, FIRED), (2 * S, CLEARED)]
+
+
+def test_duration_across_batches(database):
+    engine = AlarmEngine([dict(COOLANT, **{"for": 10})], database)
+    assert evaluate(engine, database, "Temperatura Motor", [110] * 6) == []
+    assert evaluate(engine, database, "Temperatura Motor", [110] * 6, start=6 * S) == [(10 * S, FIRED)]
+
+
+def test_batching_does_not_change_events(database):
+    rules = [COOLANT, {"name": "Muito quente", "all": [{"spn": 110, "op": ">=", "value": 115,
+                                                       "hysteresis": 2}]}]
+    values = 100 + 20 * np.sin(np.arange(3000) / 37) + np.random.default_rng(0).normal(0, 2, 3000)
+    whole = evaluate(AlarmEngine(rules, database), database, "Temperatura Motor", values)
+    engine = AlarmEngine(rules, database)
+    split = []
+    for i in range(0, len(values), 97):
+        split += evaluate(engine, database, "Temperatura Motor", values[i:i + 97], start=i * S)
+    assert whole == split and whole
+
+
+def test_multi_signal_rule(database):
+    rule = {"name": "Carga alta em rotação alta",
+            "all": [{"spn": 92, "op": ">", "value": 90}, {"spn": 190, "op": ">", "value": 1200}]}
+    engine = AlarmEngine([rule], database)
+    load, rpm = database.signal_ids(92)[0], database.signal_ids(190)[0]
+    events = engine.evaluate(np.arange(4) * S, np.array([load, rpm, rpm, load]),
+                             np.array([95.0, 1000.0, 1500.0, 50.0]))
+    assert [(e.timestamp, e.state) for e in events] == [(2 * S, FIRED), (3 * S, CLEARED)]
+    assert sorted(engine.signal_ids) == sorted([load, rpm])
+
+
+def test_rule_with_unknown_signal_is_skipped(database):
+    engine = AlarmEngine([{"name": "x", "all": [{"spn": 999999, "op": ">", "value": 0}]}], database)
+    assert len(engine) == 0
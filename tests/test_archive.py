@@ -0,0 +1,58 @@
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import archive
+from archive import SignalArchive, SignalArchiveWriter
+
+SIGNALS = [('RPM', 'rpm'), ('Velocidade', 'km/h')]
+
+
+def batch(start, n=100):
+    timestamps = 1_714_561_200_000_000_000 + np.arange(start, start + n, dtype=np.int64) * 1_000_000
+    return timestamps, np.arange(n) % 2, np.arange(start, start + n, dtype=np.float64)
+
+
+def test_write_error_drops_batch_and_keeps_thread(tmp_path, monkeypatch):
+    write_table = archive.pq.write_table
+    calls = []
+
+    def failing_once(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("falha simulada do Arrow")
+        return write_table(*args, **kwargs)
+
+    monkeypatch.setattr(archive.pq, 'write_table', failing_once)
+    writer = SignalArchiveWriter(str(tmp_path), SIGNALS, flush_rows=100)
+    writer.append(*batch(0))
+    writer.append(*batch(100))
+    writer.close()
+    assert writer.errors == 1 and writer.files_written == 1
+    values = SignalArchive(str(tmp_path)).query()['value'].to_pylist()
+    assert sorted(values) == list(range(100, 200))
+
+
+def test_full_queue_drops_instead_of_growing(tmp_path):
+    writer = SignalArchiveWriter(str(tmp_path), SIGNALS, flush_rows=10_000, max_batches=2)
+    entered, release = threading.Event(), threading.Event()
+    add = writer._add
+
+    def stalled(item):
+        entered.set()
+        release.wait(5)
+        add(item)
+
+    writer._add = stalled
+    writer.append(*batch(0))
+    assert entered.wait(5)
+    # Escrita travada no primeiro lote: dois cabem na fila, os outros dois são descartados
+    for i in range(1, 5):
+        writer.append(*batch(i * 100))
+    assert writer.rows_dropped == 200
+    release.set()
+    writer.close()
+    assert writer.rows_written == 300 and writer.errors == 0
@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+import pytest
+
+from ingest import DeviceState, process_can_frames
+from j1939_parser import FRAME_DTYPE, J1939Parser
+
+
+def scalar_changes(parser, sources, signals, timestamps, values):
+    """Referência: a regra do change_only aplicada amostra a amostra"""
+    return np.array([
+        parser._changed((int(s), int(g)), int(g), float(v), int(t))
+        for s, g, t, v in zip(sources, signals, timestamps, values)
+    ], dtype=bool)
+
+
+@pytest.mark.parametrize('deadband, relative, heartbeat', [
+    (0.0, 0.0, 10.0),
+    (2.0, 0.0, 10.0),
+    (0.0, 0.05, 0.5),
+    (1.0, 0.0, None),
+])
+def test_change_only_selection_matches_scalar_rule(database, deadband, relative, heartbeat):
+    rng = np.random.default_rng(2)
+    n = 5000
+    sources = rng.choice([0, 3], n).astype(np.int64)
+    signals = rng.choice([0, 2, 3], n).astype(np.int64)
+    timestamps = np.cumsum(rng.integers(1, 50_000_000, n)).astype(np.int64)
+    # Valores com muitas repetições exatas e passos pequenos
+    values = np.round(np.cumsum(rng.choice([0, 0, 0, 0.5, -0.5, 3.0], n)), 1) + 100
+
+    options = dict(change_only=True, deadband=deadband, relative_deadband=relative, heartbeat=heartbeat)
+    vectorized = J1939Parser(database, **options)
+    reference = J1939Parser(database, **options)
+    # Em lotes, para o estado passar de um lote para o outro
+    keep = np.concatenate([
+        vectorized.select_changes(sources[i:i + 700], signals[i:i + 700],
+                                  timestamps[i:i + 700], values[i:i + 700])
+        for i in range(0, n, 700)
+    ])
+    expected = scalar_changes(reference, sources, signals, timestamps, values)
+    np.testing.assert_array_equal(keep, expected)
+    assert vectorized.last_values == reference.last_values
+
+
+def test_change_only_drops_repeats(database):
+    parser = J1939Parser(database, change_only=True, heartbeat=None)
+    rpm = np.array([0, 0, 0, 0x40, 0x1F, 0, 0, 0], dtype=np.uint8)
+    can_ids = np.full(3, 0x0CF00400, dtype=np.uint32)
+    batch = parser.parse_batch(can_ids, np.tile(rpm, (3, 1)), timestamps=np.arange(3) * 10**8)
+    assert batch.to_dataframe()['tipo'].tolist() == ["RPM"]
+
+
+def rpm_frames(rpm, start_us, step_us=10_000):
+    """EEC1 da ECU 0x00 a cada step_us com os valores de RPM dados"""
+    frames = np.zeros(len(rpm), dtype=FRAME_DTYPE)
+    frames['timestamp'] = start_us + np.arange(len(rpm)) * step_us
+    frames['can_id'] = 0x0CF00400
+    frames['dlc'] = 8
+    frames['data'] = 0xFF
+    raw = (np.asarray(rpm) / 0.125).astype(np.uint16)
+    frames['data'][:, 3] = raw & 0xFF
+    frames['data'][:, 4] = raw >> 8
+    return frames
+
+
+@pytest.mark.parametrize('change_only', [False, True])
+def test_device_state_change_only_drops_repeats_before_ring_buffer(database, change_only):
+    # 10 s a 100 Hz: 1000 rpm por 4 s, 1500 rpm por 6 s
+    rpm = np.r_[np.full(400, 1000.0), np.full(600, 1500.0)]
+    frames = rpm_frames(rpm, time.time_ns() // 1000)
+    state = DeviceState("10.0.0.1", database=database, alarm_rules=[], change_only=change_only)
+    # Direto no ingest_decoded: o ClockAnchor do ingest() comprimiria os 10 s
+    for i in range(0, len(frames), 250):
+        state.ingest_decoded(process_can_frames(frames[i:i + 250], database), {}, 250)
+    ts, values = state.window("RPM", 60)
+    if change_only:
+        # As duas mudanças e um heartbeat a cada 2 s
+        assert values.tolist() == [1000.0, 1000.0, 1500.0, 1500.0, 1500.0]
+        assert ((ts - ts[0]) // 10**9).tolist() == [0, 2, 4, 6, 8]
+    else:
+        assert len(values) == len(rpm)
+    assert state.snapshot()['latest']["RPM"] == 1500.0
+    # Retenção do valor anterior: até a última amostra guardada, a integral não muda
+    # com as repetições descartadas (com change_only ela fica até um heartbeat atrás)
+    end = ts[-1] / 1e9 - ts[0] / 1e9
+    assert state.total("RPM", 60) * 3600 == pytest.approx(1000 * 4 + 1500 * (end - 4), rel=1e-3)
+    state.close()
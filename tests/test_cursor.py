@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from frames import CURSOR_BATCH, advance_cursor, decode_frames
+from ingest import DeviceState
+from web_server import FrameBuffer
+
+
+def fetch(buffer, since, limit=CURSOR_BATCH):
+    """Resposta de /api/frames.bin com cursor, como devolvida por fetch_frames"""
+    raw, seq, gap = buffer.since(since, limit)
+    return {'frames': decode_frames(raw), 'seq': seq, 'gap': gap}
+
+
+def test_first_response_does_not_count_as_loss():
+    buffer = FrameBuffer(size=64)
+    for i in range(200):
+        buffer.add(0x0CF00400, bytes(8), i)
+    data = fetch(buffer, 0)
+    cursor, more = advance_cursor(data, None)
+    assert data['gap'] == 0 and cursor == 200 and not more
+    assert data['frames']['timestamp'].tolist() == list(range(136, 200))
+
+
+def test_full_batches_request_more_without_loss():
+    buffer = FrameBuffer(size=4 * CURSOR_BATCH)
+    cursor, received = None, []
+    cursor, _ = advance_cursor(fetch(buffer, 0), cursor)
+    for i in range(3 * CURSOR_BATCH + 10):
+        buffer.add(0x0CF00400, bytes(8), i)
+    more = True
+    while more:
+        data = fetch(buffer, cursor)
+        cursor, more = advance_cursor(data, cursor)
+        received += data['frames']['timestamp'].tolist()
+        assert data['gap'] == 0
+    assert received == list(range(3 * CURSOR_BATCH + 10))
+
+
+@pytest.mark.parametrize('produced_per_poll', [10, 300, 1000])
+def test_received_plus_lost_equals_produced(produced_per_poll):
+    buffer = FrameBuffer(size=512)
+    state = DeviceState("test", alarm_rules=[])
+    cursor, produced = None, 0
+    cursor, _ = advance_cursor(fetch(buffer, 0), cursor)
+    for _ in range(20):
+        for _ in range(produced_per_poll):
+            buffer.add(0x0CF00400, bytes(8), produced)
+            produced += 1
+        # Uma consulta por ciclo, mais as repetidas enquanto o lote vier cheio
+        more = True
+        while more:
+            data = fetch(buffer, cursor)
+            cursor, more = advance_cursor(data, cursor)
+            state.ingest(data)
+    assert state.frames_total + state.frames_lost == produced
+    assert (state.frames_lost > 0) == (produced_per_poll > 512)
+
+
+def test_cursor_after_reboot_restarts_from_oldest():
+    buffer = FrameBuffer(size=16)
+    for i in range(5):
+        buffer.add(0x0CF00400, bytes(8), i)
+    data = fetch(buffer, 1000)
+    assert data['gap'] == 0 and data['seq'] == 5 and len(data['frames']) == 5
+
+
+def test_response_without_seq_resets_cursor():
+    assert advance_cursor({'frames': np.empty(0)}, 42) == (None, False)
+    assert advance_cursor(None, 42) == (None, False)
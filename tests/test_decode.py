@@ -0,0 +1,42 @@
+import numpy as np
+
+from j1939_parser import J1939Parser
+
+# PGNs da base J1939 (EEC1, velocidade, temperaturas, consumo, carga, posição, nível) e um desconhecido
+PGNS = (0xF004, 0xFEF1, 0xFEEE, 0xFEF2, 0xF003, 0xFEF3, 0xFEFC, 0xFE00)
+
+
+def random_frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    pgns = rng.choice(PGNS, n)
+    sources = rng.choice([0x00, 0x03, 0x1C], n)
+    can_ids = ((6 << 26) | (pgns << 8) | sources).astype(np.uint32)
+    data = rng.integers(0, 256, (n, 8), dtype=np.uint8)
+    dlc = np.where(rng.random(n) < 0.1, rng.integers(0, 8, n), 8).astype(np.uint8)
+    return can_ids, data, dlc
+
+
+def test_decode_batch_matches_scalar_decode(database):
+    can_ids, data, dlc = random_frames(2000)
+    frames, signals, values = database.decode_batch(can_ids, data, dlc)
+    assert np.all(np.diff(frames) >= 0)
+
+    expected = []
+    for i in range(len(can_ids)):
+        for signal_id, value in database.decode(int(can_ids[i]), data[i, :dlc[i]].tobytes()) or ():
+            expected.append((i, signal_id, value))
+    assert [(f, s) for f, s, _ in expected] == list(zip(frames.tolist(), signals.tolist()))
+    np.testing.assert_allclose(values, [v for _, _, v in expected])
+
+
+def test_parse_batch_matches_parse_message(database):
+    can_ids, data, _ = random_frames(300, seed=1)
+    batch = J1939Parser(database).parse_batch(can_ids, data)
+
+    parser = J1939Parser(database)
+    rows = []
+    for can_id, payload in zip(can_ids.tolist(), data):
+        rows.extend(parser.parse_message(f"ID: {can_id:08X} Data: {payload.tobytes().hex()}") or [])
+    names = [database.signals[s][0] for s in batch.signal.tolist()]
+    assert names == [row['tipo'] for row in rows]
+    np.testing.assert_allclose(batch.value, [row['valor'] for row in rows])
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+import main
+from web_server import FrameBuffer
+
+
+class FakeCAN:
+    """Fila de mensagens no formato de recv() do machine.CAN: (id, ..., dados)"""
+
+    def __init__(self, messages, error_at=None):
+        self.messages = list(messages)
+        self.error_at = error_at
+        self.reads = 0
+
+    def any(self, fifo):
+        return bool(self.messages)
+
+    def recv(self, fifo):
+        self.reads += 1
+        message = self.messages.pop(0)
+        if self.reads == self.error_at:
+            raise OSError("bus-off")
+        return message
+
+
+async def read_for(can, frames, seconds):
+    task = asyncio.ensure_future(main.read_can(can, frames))
+    await asyncio.sleep(seconds)
+    task.cancel()
+
+
+def test_read_can_fills_buffer_in_order():
+    messages = [(0x0CF00400 + i, True, False, 0, bytes([i % 256] * 8)) for i in range(3 * main.CAN_BATCH + 5)]
+    frames = FrameBuffer(size=256)
+    asyncio.run(read_for(FakeCAN(messages), frames, 0.05))
+    assert frames.seq == len(messages)
+    records = frames.messages()
+    assert records[0] == "ID: 0xCF00400 Data: 0000000000000000"
+    assert records[-1] == "ID: 0x%X Data: %s" % (0x0CF00400 + len(messages) - 1,
+                                                 ('%02x' % (len(messages) - 1)) * 8)
+
+
+def test_read_can_survives_controller_error():
+    messages = [(0x18FEF100, bytes(8))] * 10
+    frames = FrameBuffer(size=64)
+    asyncio.run(read_for(FakeCAN(messages, error_at=4), frames, 0.05))
+    # A mensagem do erro se perde; o resto continua chegando
+    assert frames.seq == 9
+
+
+def test_firmware_manifest_has_entry_point():
+    upload = pytest.importorskip('upload_esp32', reason='pyserial ausente')
+    remotes = [remote for _, remote in upload.firmware_files(upload.FIRMWARE_DIR)]
+    assert 'main.py' in remotes and 'web_server.py' in remotes and 'index.html' in remotes
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from isobus.j1939_parser import J1939Parser as IsobusParser
+
+# PGNs da base J1939, um desconhecido e um PDU1 endereçado
+PGNS = (0xF004, 0xF003, 0xFEF1, 0xFEEE, 0xFEF2, 0xFEFC, 0xFEF3, 0xFE00, 0xEA00)
+
+
+def decode_both(database, parser, can_id, data):
+    signals = {database.signals[s][0]: v for s, v in database.decode(can_id, data) or ()}
+    message = parser.parse_message(can_id, data)
+    return signals, message['spn_vals'] if message else {}
+
+
+@pytest.mark.parametrize('can_id, data, name, value', [
+    # SPN 190: bytes 4-5, little-endian, 0,125 rpm/bit
+    (0x0CF00400, 'ff6dff31acffffff', 'RPM', 0xAC31 * 0.125),
+    # SPN 84: bytes 2-3, 1/256 km/h/bit
+    (0x18FEF100, 'ff0009ffffffffff', 'Velocidade', 9.0),
+    # SPN 175: bytes 3-4, 0,03125 °C/bit, -273 °C
+    (0x18FEEE00, '80ff402effffffff', 'Temperatura Óleo', 0x2E40 * 0.03125 - 273),
+    # SPN 110: byte 1, -40 °C
+    (0x18FEEE00, '80ff402effffffff', 'Temperatura Motor', 88.0),
+    # SPN 183: bytes 1-2, 0,05 L/h/bit
+    (0x18FEF200, '6801ffffffffffff', 'Consumo', 18.0),
+    # SPN 96: byte 2 do Dash Display, 0,4 %/bit
+    (0x18FEFC00, 'ffe1ffffffffffff', 'Nível Combustível', 90.0),
+    # SPN 584/585: 1e-7 °/bit, -210°
+    (0x0CFEF31C, (int((-21.2 + 210) * 1e7).to_bytes(4, 'little')
+                  + int((-47.8 + 210) * 1e7).to_bytes(4, 'little')).hex(), 'Latitude', -21.2),
+])
+def test_standard_layouts(database, can_id, data, name, value):
+    signals, spn_vals = decode_both(database, IsobusParser(), can_id, bytes.fromhex(data))
+    assert signals[name] == pytest.approx(value, abs=1e-6)
+    assert spn_vals[name] == pytest.approx(value, abs=1e-6)
+
+
+def test_isobus_parser_matches_signal_database(database):
+    rng = np.random.default_rng(2)
+    n = 3000
+    can_ids = ((6 << 26) | (rng.choice(PGNS, n) << 8) | rng.choice([0x00, 0x1C, 0x80], n)).tolist()
+    payloads = rng.integers(0, 256, (n, 8), dtype=np.uint8)
+    parser = IsobusParser()
+    decoded = 0
+    for can_id, payload in zip(can_ids, payloads):
+        signals, spn_vals = decode_both(database, parser, can_id, payload.tobytes())
+        assert spn_vals.keys() == signals.keys()
+        for name, value in signals.items():
+            assert spn_vals[name] == pytest.approx(value, rel=1e-12, abs=1e-9)
+        decoded += bool(signals)
+    assert decoded > n // 2
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from rollup import RollupStore, parse_tiers, rollup_series
+from timeseries import RingBuffer
+
+S = 1_000_000_000
+
+
+def test_integral_holds_previous_value():
+    store = RollupStore()
+    # 10 L/h por 1 h em amostras de 1 s: a primeira amostra não tem intervalo antes dela
+    store.extend('consumo', np.arange(3601) * S, np.full(3601, 10.0))
+    assert store.total('consumo', 7200) == pytest.approx(10.0 * 3600)
+
+
+def test_integral_skips_gaps_longer_than_max_gap():
+    store = RollupStore(max_gap=10.0)
+    store.extend('consumo', np.arange(0, 100) * S, np.full(100, 36.0))
+    # ESP32 fora do ar por 5 min: o intervalo não conta
+    store.extend('consumo', (400 + np.arange(0, 100)) * S, np.full(100, 36.0))
+    assert store.total('consumo', 3600) == pytest.approx(36.0 * 198)
+
+
+def test_integral_independent_of_batching():
+    rng = np.random.default_rng(0)
+    ts = np.cumsum(rng.integers(S // 20, S, 20_000))
+    values = rng.uniform(0, 50, len(ts))
+    whole = RollupStore()
+    whole.extend('x', ts, values)
+    split = RollupStore()
+    for i in range(0, len(ts), 333):
+        split.extend('x', ts[i:i + 333], values[i:i + 333])
+    dt = np.diff(ts) / 1e9
+    expected = float(np.sum(values[:-1] * np.where(dt <= 10, dt, 0)))
+    for seconds in (60, 3600, 86_400):
+        assert split.total('x', seconds) == pytest.approx(whole.total('x', seconds))
+    assert whole.total('x', 86_400) == pytest.approx(expected)
+
+
+def test_coarser_tiers_keep_totals():
+    store = RollupStore(tiers=parse_tiers("1s:10min,1min:1d,1h:30d"))
+    ts = np.arange(0, 6 * 3600, 2) * S
+    store.extend('x', ts, np.full(len(ts), 3.0))
+    # A janela de 1 h não cabe mais no nível de 1 s: vem do de 1 min, e o bucket
+    # em que a janela começa entra inteiro
+    resolution, rows = store.window('x', 3600)
+    assert resolution == 60 and len(rows) == 61
+    assert rows['integral'].tolist() == [3.0 * 60] * 61
+    assert rows['count'].tolist() == [30] * 61
+
+
+def test_rollup_series_envelope():
+    store = RollupStore()
+    store.extend('x', np.arange(0, 120, 0.5) * 1e9, np.tile([1.0, 5.0], 120))
+    resolution, rows = store.window('x', 120, max_buckets=10)
+    ts, values = rollup_series(rows, resolution, 'minmax')
+    assert resolution == 60 and len(ts) == 2 * len(rows)
+    assert values[0::2].tolist() == [1.0] * len(rows) and values[1::2].tolist() == [5.0] * len(rows)
+
+
+def test_parse_tiers():
+    assert parse_tiers("1s:1d,1min:14d,1h:365d") == ((1, 86_400), (60, 20_160), (3600, 8_760))
+    with pytest.raises(ValueError):
+        parse_tiers("1h:1min")
+
+
+def test_ring_buffer_growth_matches_preallocated():
+    rng = np.random.default_rng(1)
+    grown, full = RingBuffer(5000, initial=4), RingBuffer(5000, initial=5000)
+    t = 0
+    for n in rng.integers(0, 700, 60).tolist():
+        ts = np.arange(t, t + n)
+        t += n
+        grown.extend(ts, ts * 0.5)
+        full.extend(ts, ts * 0.5)
+        for a, b in zip(grown.last(), full.last()):
+            np.testing.assert_array_equal(a, b)
+    assert len(grown) == 5000 and grown._size == 5000
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from signal_db import pgn_of, pgns_of
+
+
+@pytest.mark.parametrize('can_id, pgn', [
+    (0x0CF00400, 0xF004),   # PDU2: PS é extensão do grupo
+    (0x18FEF100, 0xFEF1),
+    (0x18EAFF00, 0xEA00),   # PDU1 global: sem o destino
+    (0x18EA1700, 0xEA00),   # PDU1 para 0x17: mesmo PGN
+    (0x1CEC2A31, 0xEC00),   # TP.CM
+    (0x19EF1200, 0x1EF00),  # data page 1, PDU1
+    (0x19F00100, 0x1F001),  # data page 1, PDU2
+])
+def test_pgn_of_masks_pdu1_destination(can_id, pgn):
+    assert pgn_of(can_id) == pgn
+
+
+def test_pgns_of_matches_pgn_of():
+    can_ids = np.random.default_rng(0).integers(0, 1 << 29, 10_000, dtype=np.uint32)
+    assert pgns_of(can_ids).tolist() == [pgn_of(can_id) for can_id in can_ids.tolist()]
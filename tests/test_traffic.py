@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+from j1939_traffic import ENGINE, FIELD_ORIGIN, NAVIGATION, TrafficGenerator
+
+# Layouts do J1939-71 escritos à mão, independentes de signals/j1939.json:
+# PGN -> [(sinal, primeiro byte (0-based), bytes, escala, offset)], little-endian
+REFERENCE = {
+    0xF004: [('RPM', 3, 2, 0.125, 0)],
+    0xF003: [('Acelerador', 1, 1, 0.4, 0), ('Carga Motor', 2, 1, 1, 0)],
+    0xFEF1: [('Velocidade', 1, 2, 1 / 256, 0)],
+    0xFEEE: [('Temperatura Motor', 0, 1, 1, -40), ('Temperatura Óleo', 2, 2, 0.03125, -273)],
+    0xFEF2: [('Consumo', 0, 2, 0.05, 0)],
+    0xFEFC: [('Nível Combustível', 1, 1, 0.4, 0)],
+    0xFEF3: [('Latitude', 0, 4, 1e-7, -210), ('Longitude', 4, 4, 1e-7, -210)],
+}
+
+# Faixas dos ciclos de engine_values, com folga para o ruído
+RANGES = {
+    'RPM': (1080, 2120), 'Acelerador': (8, 82), 'Carga Motor': (18, 92),
+    'Velocidade': (5.8, 12.2), 'Temperatura Motor': (80, 96), 'Temperatura Óleo': (90, 106),
+    'Nível Combustível': (9.5, 90.5), 'Consumo': (7.5, 28.5),
+}
+
+
+def reference_decode(frames):
+    """{(origem, sinal): valores} pelos layouts de REFERENCE"""
+    values = {}
+    for frame in frames:
+        can_id = int(frame['can_id'])
+        pgn = (can_id >> 8) & 0x1FFFF
+        data = frame['data'].tobytes()
+        for name, start, size, scale, offset in REFERENCE.get(pgn, ()):
+            raw = int.from_bytes(data[start:start + size], 'little')
+            values.setdefault((can_id & 0xFF, name), []).append(raw * scale + offset)
+    return values
+
+
+@pytest.fixture(scope='module')
+def decoded(database):
+    traffic = TrafficGenerator(seed=3, ecus=2, database=database)
+    return reference_decode(traffic.frames(0, 60_000_000))
+
+
+def test_engine_signals_in_reference_layout(decoded):
+    for source in (ENGINE, 0x80):
+        for name, (low, high) in RANGES.items():
+            values = np.array(decoded[(source, name)])
+            assert len(values) and low <= values.min() and values.max() <= high, (source, name)
+    # O ciclo de 40 s passa perto dos extremos em 60 s
+    rpm = np.array(decoded[(ENGINE, 'RPM')])
+    assert rpm.max() - rpm.min() > 900
+
+
+def test_position_in_reference_layout(decoded):
+    lat = np.array(decoded[(NAVIGATION, 'Latitude')])
+    lon = np.array(decoded[(NAVIGATION, 'Longitude')])
+    assert len(lat) == 60 * 5
+    # Trajeto de 150 m na primeira faixa, a partir da origem do campo
+    assert np.abs(lat - FIELD_ORIGIN[0]).max() < 1e-4
+    assert 0 <= (lon - FIELD_ORIGIN[1]).min() + 1e-5 and (lon - FIELD_ORIGIN[1]).max() < 2e-3
@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+
+from ingest import DeviceState
+from isobus.j1939_parser import J1939Parser as IsobusParser
+from j1939_parser import FRAME_DTYPE, J1939Parser
+from j1939_transport import TransportReassembler
+from pipeline import shard_keys
+
+SOURCE = 0x00
+GLOBAL = 0xFF
+
+
+def bam_frames(payload, pgn, source=SOURCE):
+    """(can_id, data) do anúncio BAM e dos TP.DT de um payload"""
+    packets = (len(payload) + 6) // 7
+    cm = bytes([32, len(payload) & 0xFF, len(payload) >> 8, packets, 0xFF,
+                pgn & 0xFF, (pgn >> 8) & 0xFF, pgn >> 16])
+    frames = [((7 << 26) | (0xEC << 16) | (GLOBAL << 8) | source, cm)]
+    for seq in range(1, packets + 1):
+        chunk = payload[(seq - 1) * 7:seq * 7].ljust(7, b'\xff')
+        frames.append(((7 << 26) | (0xEB << 16) | (GLOBAL << 8) | source, bytes([seq]) + chunk))
+    return frames
+
+
+# DM1 com lâmpada âmbar e dois DTCs: SPN 110 FMI 0 e SPN 100 FMI 1, 3 ocorrências
+DM1 = b'\x04\xff' + bytes((110, 0, 0, 3, 100, 0, 1, 3))
+
+
+def records(frames, start_us, step_us=50_000):
+    """Frames (can_id, data) como registros do ESP32, a cada step_us"""
+    out = np.zeros(len(frames), dtype=FRAME_DTYPE)
+    for i, (can_id, data) in enumerate(frames):
+        out[i]['timestamp'] = start_us + i * step_us
+        out[i]['can_id'] = can_id
+        out[i]['dlc'] = len(data)
+        out[i]['data'][:len(data)] = np.frombuffer(data, dtype=np.uint8)
+    return out
+
+
+def test_bam_reassembly():
+    payload = bytes(range(20))
+    reassembler = TransportReassembler()
+    results = [reassembler.feed(can_id, data, now=i * 0.05)
+               for i, (can_id, data) in enumerate(bam_frames(payload, 0xFECA))]
+    assert results[:-1] == [None] * (len(results) - 1)
+    assert results[-1] == (SOURCE, 0xFECA, payload)
+    assert len(reassembler) == 0 and reassembler.completed == 1
+
+
+def test_out_of_order_packet_aborts():
+    frames = bam_frames(bytes(range(30)), 0xFECA)
+    frames[2], frames[3] = frames[3], frames[2]
+    reassembler = TransportReassembler()
+    assert all(reassembler.feed(can_id, data, now=0) is None for can_id, data in frames)
+    assert reassembler.aborted == 1 and len(reassembler) == 0
+
+
+def test_stale_session_times_out():
+    frames = bam_frames(bytes(range(20)), 0xFECA)
+    reassembler = TransportReassembler(timeout=1.0)
+    reassembler.feed(*frames[0], now=0)
+    reassembler.feed(*frames[1], now=0.5)
+    assert reassembler.feed(*frames[2], now=2.0) is None
+    assert reassembler.timeouts == 1 and len(reassembler) == 0
+
+
+def test_unfinished_sessions_stay_bounded():
+    reassembler = TransportReassembler(max_sessions=4)
+    for source in range(50):
+        can_id, data = bam_frames(bytes(range(20)), 0xFECA, source)[0]
+        reassembler.feed(can_id, data, now=source * 0.01)
+    assert len(reassembler) == 4
+    assert reassembler.evicted == 46
+    # O pool continua utilizável para uma mensagem completa
+    results = [reassembler.feed(c, d, now=1.0) for c, d in bam_frames(b"VIN123456789ABCDE*", 0xFEEC, 0x80)]
+    assert results[-1] == (0x80, 0xFEEC, b"VIN123456789ABCDE*")
+
+
+def test_parse_batch_decodes_reassembled_vin(database):
+    frames = bam_frames(b"1JD0123456789ABCD*", 0xFEEC)
+    can_ids = np.array([can_id for can_id, _ in frames], dtype=np.uint32)
+    data = np.array([list(d) for _, d in frames], dtype=np.uint8)
+    batch = J1939Parser(database).parse_batch(can_ids, data, timestamps=np.arange(len(frames)) * 10**7)
+    assert len(batch) == 0
+    assert [row['valor'] for row in batch.messages if row['tipo'] == "VIN"] == ["1JD0123456789ABCD"]
+
+
+def test_device_state_ingest_reassembles_dm1_across_batches(database):
+    frames = records(bam_frames(DM1, 0xFECA, 0x03), time.time_ns() // 1000)
+    state = DeviceState("10.0.0.1", database=database, alarm_rules=[])
+    # O anúncio e o primeiro TP.DT chegam numa consulta, o último na seguinte
+    state.ingest({'frames': frames[:2]})
+    assert state.snapshot()['diagnostics'] == []
+    state.ingest({'frames': frames[2:]})
+    rows = state.snapshot()['diagnostics']
+    assert [(row['valor'], row['fmi'], row['ocorrencias'], row['origem']) for row in rows] == [
+        (110, 0, 3, 0x03), (100, 1, 3, 0x03)]
+    state.close()
+
+
+def test_text_and_batch_paths_share_the_transport_clock(database):
+    """Sessão aberta por parse_message (texto) e terminada por parse_batch (frames)"""
+    frames = bam_frames(b"1JD0123456789ABCD*", 0xFEEC)
+    parser = J1939Parser(database)
+    for can_id, data in frames[:2]:
+        assert parser.parse_message(f"ID: {can_id:08X} Data: {data.hex()}") is None
+    rest = records(frames[2:], time.time_ns() // 1000)
+    rows = parser.parse_messages(rest['can_id'], rest['data'], rest['timestamp'].astype(np.int64) * 1000)
+    assert [row['valor'] for row in rows] == ["1JD0123456789ABCD"]
+    assert parser.transport.timeouts == 0
+
+
+def test_pipeline_keeps_transport_frames_in_one_shard():
+    frames = records(bam_frames(DM1, 0xFECA, 0x03) + bam_frames(b"1JD0123456789ABCD*", 0xFEEC), 0)
+    for workers in (2, 3, 4, 7):
+        assert len(set(shard_keys(frames, workers).tolist())) == 1
+
+
+def test_isobus_parser_reassembles_dm1_and_vin():
+    parser = IsobusParser()
+    now = time.time()
+    frames = bam_frames(DM1, 0xFECA) + bam_frames(b"1JD0123456789ABCD*", 0xFEEC)
+    results = [parser.parse_message(can_id, data, now + i * 0.05) for i, (can_id, data) in enumerate(frames)]
+    assert [r for r in results if r is not None] == [
+        {'pgn': 0xFECA, 'dtcs': [(110, 0, 3), (100, 1, 3)]},
+        {'pgn': 0xFEEC, 'vin': "1JD0123456789ABCD"},
+    ]
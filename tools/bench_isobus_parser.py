@@ -0,0 +1,106 @@
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.esp32.isobus.j1939_parser import J1939Parser
+
+
+def legacy_parse_message(pgn_config, msg_id, data):
+    """Implementação original: percorre pgn_config a cada mensagem"""
+    pgn = (msg_id >> 8) & 0x1FFFF
+    if pgn not in pgn_config:
+        return None
+
+    result = {'pgn': pgn, 'spn_vals': {}}
+
+    for spn, config in pgn_config[pgn]['spns'].items():
+        try:
+            start_byte = config['start_bit'] // 8
+            bit_offset = config['start_bit'] % 8
+            byte_length = (config['length'] + 7) // 8
+
+            value = 0
+            for i in range(byte_length):
+                if start_byte + i < len(data):
+                    value |= data[start_byte + i] << (i * 8)
+
+            value = (value >> bit_offset) & ((1 << config['length']) - 1)
+
+            if 'resolution' in config:
+                value = value * config['resolution']
+            # Offset: ausente na tabela original, usado pelo esquema de sinais
+            if config.get('offset'):
+                value = value + config['offset']
+
+            result['spn_vals'][config['name']] = value
+
+        except Exception as e:
+            print(f"Erro ao processar SPN {spn}: {e}")
+
+    return result
+
+
+def add_synthetic_pgns(parser, count):
+    """Simula uma tabela J1939-71 completa com PGNs que não aparecem no barramento"""
+    for n in range(count):
+        pgn = 0x1F000 + n
+        parser.pgn_config[pgn] = {
+            'spns': {
+                10000 + n * 4 + i: {
+                    'start_bit': i * 16 + (i % 2) * 4,
+                    'length': 12 if i % 2 else 16,
+                    'resolution': 0.5,
+                    'name': f'Synthetic_{n}_{i}',
+                }
+                for i in range(4)
+            }
+        }
+    parser.compile()
+
+
+def make_frames(parser, count, seed=1):
+    rng = random.Random(seed)
+    pgns = [pgn for pgn in parser.pgn_config if pgn < 0x1F000]
+    frames = []
+    for _ in range(count):
+        msg_id = (6 << 26) | (rng.choice(pgns) << 8) | rng.randrange(256)
+        frames.append((msg_id, bytes(rng.randrange(256) for _ in range(8))))
+    return frames
+
+
+def bench(label, parser, frames, repeat):
+    config = parser.pgn_config
+
+    for msg_id, data in frames:
+        assert parser.parse_message(msg_id, data) == legacy_parse_message(config, msg_id, data)
+
+    legacy = min(timeit.repeat(
+        lambda: [legacy_parse_message(config, m, d) for m, d in frames],
+        number=1, repeat=repeat))
+    compiled = min(timeit.repeat(
+        lambda: [parser.parse_message(m, d) for m, d in frames],
+        number=1, repeat=repeat))
+
+    n = len(frames)
+    print(f"{label}: {len(config)} PGNs")
+    print(f"  original:  {legacy / n * 1e6:7.2f} us/frame  {n / legacy:10.0f} frames/s")
+    print(f"  compilado: {compiled / n * 1e6:7.2f} us/frame  {n / compiled:10.0f} frames/s")
+    print(f"  ganho:     {legacy / compiled:7.2f}x")
+
+
+def main():
+    frames_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    parser = J1939Parser()
+    frames = make_frames(parser, frames_count)
+    bench("Configuração padrão", parser, frames, repeat=5)
+
+    add_synthetic_pgns(parser, 500)
+    bench("Com 500 PGNs extras", parser, frames, repeat=5)
+
+
+if __name__ == "__main__":
+    main()
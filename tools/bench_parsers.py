@@ -0,0 +1,230 @@
+"""Benchmark dos decodificadores CAN com replay de logs ou fixtures geradas.
+
+Uso:
+    python tools/bench_parsers.py                         # fixture sintética
+    python tools/bench_parsers.py captura.log trator.asc  # logs candump -l / Vector ASC
+    python tools/bench_parsers.py --json > resultado.json # saída para comparar commits
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'dashboard'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from can_logs import read_log
+from j1939_parser import FRAME_DTYPE, J1939Parser
+from ingest import process_can_frames, process_can_messages
+from signal_db import SIMULATOR_DATABASE, load_database, pgn_of
+from src.esp32.isobus.j1939_parser import J1939Parser as IsobusParser
+
+# PGNs da fixture: decodificados pelos parsers e alguns desconhecidos
+FIXTURE_PGNS = [0xF004, 0xFEF1, 0xFEEE, 0xFEF2, 0xF003, 0xFEF5, 0xFEF6, 0xFEE9, 0xFEF8]
+
+
+def make_fixture(count, seed=1):
+    """Frames sintéticos: PGNs J1939 comuns e os IDs do simulador de app.py"""
+    rng = random.Random(seed)
+    ids = [(6 << 26) | (pgn << 8) | sa for pgn in FIXTURE_PGNS for sa in (0x00, 0x03)]
+    app_ids = load_database(SIMULATOR_DATABASE).ids
+    ids += list(app_ids)
+    frames = []
+    for i in range(count):
+        can_id = rng.choice(ids)
+        size = 2 if can_id in app_ids else 8
+        frames.append((i * 0.0005, can_id, bytes(rng.randrange(256) for _ in range(size))))
+    return frames
+
+
+def to_text(frames):
+    return [f"ID: 0x{can_id:X} Data: {data.hex()}" for _, can_id, data in frames]
+
+
+def to_records(frames):
+    records = np.zeros(len(frames), dtype=FRAME_DTYPE)
+    for i, (timestamp, can_id, data) in enumerate(frames):
+        records[i]['timestamp'] = int(timestamp * 1e6)
+        records[i]['can_id'] = can_id
+        records[i]['dlc'] = len(data[:8])
+        records[i]['data'][:len(data[:8])] = np.frombuffer(data[:8], dtype=np.uint8)
+    return records
+
+
+def dashboard_batch(frames):
+    parser = J1939Parser()
+    records = to_records(frames)
+    timestamps = records['timestamp'].astype(np.int64) * 1000
+    return lambda: parser.parse_batch(records['can_id'], records['data'], timestamps, records['dlc'])
+
+
+def dashboard_changes(frames):
+    parser = J1939Parser(change_only=True)
+    records = to_records(frames)
+    timestamps = records['timestamp'].astype(np.int64) * 1000
+
+    def run():
+        # Cada repetição começa sem histórico, como a primeira
+        parser.last_values.clear()
+        return parser.parse_batch(records['can_id'], records['data'], timestamps, records['dlc'])
+    return run
+
+
+def dashboard_message(frames):
+    parser = J1939Parser()
+    messages = to_text(frames)
+    return lambda: [parser.parse_message(msg) for msg in messages]
+
+
+def isobus_message(frames):
+    parser = IsobusParser()
+    return lambda: [parser.parse_message(can_id, data) for _, can_id, data in frames]
+
+
+def app_messages(frames):
+    messages = to_text(frames)
+    return lambda: process_can_messages(messages)
+
+
+def app_frames(frames):
+    records = to_records(frames)
+    return lambda: process_can_frames(records)
+
+
+# Nome -> função que prepara a entrada (fora da medição) e devolve o decodificador
+DECODERS = {
+    'J1939Parser.parse_message': dashboard_message,
+    'J1939Parser.parse_batch': dashboard_batch,
+    'J1939Parser.parse_batch change_only': dashboard_changes,
+    'isobus J1939Parser.parse_message': isobus_message,
+    'process_can_messages': app_messages,
+    'process_can_frames': app_frames,
+}
+
+
+def measure(run, repeat):
+    """Melhor tempo de `repeat` execuções"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure_memory(run, frames_count):
+    """Blocos/bytes retidos por frame (inclui o resultado) e pico de memória"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = run()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del result
+    return blocks / frames_count, size / frames_count, peak
+
+
+def bench_decoder(name, factory, frames, repeat, per_pgn):
+    run = factory(frames)
+    run()  # aquecimento
+    elapsed = measure(run, repeat)
+    blocks, size, peak = measure_memory(run, len(frames))
+    result = {
+        'decoder': name,
+        'frames': len(frames),
+        'seconds': elapsed,
+        'frames_per_second': len(frames) / elapsed,
+        'us_per_frame': elapsed / len(frames) * 1e6,
+        'blocks_per_frame': blocks,
+        'bytes_per_frame': size,
+        'peak_bytes': peak,
+        'per_pgn': {},
+    }
+
+    if per_pgn:
+        groups = {}
+        for frame in frames:
+            groups.setdefault(pgn_of(frame[1]), []).append(frame)
+        for pgn, group in sorted(groups.items()):
+            group_run = factory(group)
+            group_run()
+            group_elapsed = measure(group_run, repeat)
+            result['per_pgn'][f"0x{pgn:05X}"] = {
+                'frames': len(group),
+                'us_per_frame': group_elapsed / len(group) * 1e6,
+            }
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f"Fonte: {report['source']} ({report['frames']} frames), commit {report['commit']}")
+    print(f"{'decodificador':38} {'frames/s':>12} {'us/frame':>9} {'blocos/fr':>9} "
+          f"{'bytes/fr':>9} {'pico (KiB)':>10}")
+    for r in report['results']:
+        print(f"{r['decoder']:38} {r['frames_per_second']:12.0f} {r['us_per_frame']:9.2f} "
+              f"{r['blocks_per_frame']:9.2f} {r['bytes_per_frame']:9.1f} {r['peak_bytes'] / 1024:10.1f}")
+        for pgn, stats in r['per_pgn'].items():
+            print(f"    PGN {pgn}: {stats['us_per_frame']:8.2f} us/frame ({stats['frames']} frames)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('logs', nargs='*', help='logs candump -l (.log) ou Vector (.asc)')
+    parser.add_argument('--frames', type=int, default=20000, help='tamanho da fixture sintética')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--decoder', action='append', choices=sorted(DECODERS),
+                        help='limita aos decodificadores indicados')
+    parser.add_argument('--no-per-pgn', action='store_true', help='não mede o custo por PGN')
+    parser.add_argument('--json', action='store_true', help='saída JSON')
+    args = parser.parse_args()
+
+    if args.logs:
+        frames = [frame for path in args.logs for frame in read_log(path)]
+        source = ', '.join(args.logs)
+    else:
+        frames = make_fixture(args.frames)
+        source = 'fixture'
+    if not frames:
+        sys.exit("Nenhum frame encontrado")
+
+    results = [
+        bench_decoder(name, DECODERS[name], frames, args.repeat, not args.no_per_pgn)
+        for name in (args.decoder or DECODERS)
+    ]
+    report = {
+        'commit': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'source': source,
+        'frames': len(frames),
+        'results': results,
+    }
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark do pipeline de decodificação em vários processos.
+
+Alimenta o DecodePipeline com frames sintéticos (ou de logs) e mede a
+vazão com 1, 2, 4... decodificadores, comparando com o caminho do
+IngestWorker no próprio processo. Os dois lados incluem a gravação no
+DeviceState (histórico, agregados, últimos valores); no pipeline ela roda
+nos decodificadores.
+
+Uso:
+    python tools/bench_pipeline.py --workers 1 2 4
+    python tools/bench_pipeline.py --dbc j1939.dbc --frames 500000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'dashboard'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_parsers import make_fixture, to_records
+from alarms import AlarmEngine, load_rules
+from can_logs import read_log
+from ingest import DeviceState
+from pipeline import DecodePipeline, decode_samples, samples_frame
+from signal_db import J1939_DATABASE, load_database
+
+# Frames entregues por chamada de feed(), como um lote do stream
+FEED_BATCH = 2048
+
+
+def bench_inline(records, database):
+    state = DeviceState("bench", database=database)
+    names = np.array([name for name, _ in database.signals] or [""], dtype=object)
+    start = time.perf_counter()
+    for i in range(0, len(records), FEED_BATCH):
+        batch = records[i:i + FEED_BATCH]
+        samples = decode_samples(database, batch)
+        state.ingest_decoded(samples_frame(samples, names), {}, len(batch))
+    return time.perf_counter() - start
+
+
+def bench_pipeline(records, workers, database_path, shard):
+    # Como no dashboard: só as amostras dos sinais com alarme voltam dos decodificadores
+    database = load_database(database_path)
+    forward = AlarmEngine(load_rules(), database).signal_ids
+    pipeline = DecodePipeline(workers=workers, shard=shard, database_path=database_path,
+                              forward=forward).start()
+    try:
+        # Aquecimento: processos no ar e base carregada
+        pipeline.feed(records[:FEED_BATCH])
+        while pipeline.pending():
+            time.sleep(0.01)
+        time.sleep(0.2)
+        pipeline.read()
+
+        start = time.perf_counter()
+        samples = 0
+        for i in range(0, len(records), FEED_BATCH):
+            batch = records[i:i + FEED_BATCH]
+            # Espera espaço nos anéis em vez de descartar
+            while pipeline.pending() > pipeline.ring_frames // 2:
+                samples += len(pipeline.read())
+                time.sleep(0.001)
+            pipeline.feed(batch)
+        while pipeline.pending():
+            samples += len(pipeline.read())
+            time.sleep(0.001)
+        # Consultas só são atendidas entre lotes: a resposta marca o fim do último
+        pipeline.query(0, 'latest', timeout=30)
+        samples += len(pipeline.read())
+        return time.perf_counter() - start, samples, pipeline.dropped
+    finally:
+        pipeline.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('logs', nargs='*', help='logs candump -l (.log) ou Vector (.asc)')
+    parser.add_argument('--frames', type=int, default=200000, help='tamanho da fixture sintética')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--dbc', default=J1939_DATABASE, help='base de sinais (.dbc ou .json)')
+    parser.add_argument('--shard', choices=('pgn', 'source'), default='pgn')
+    args = parser.parse_args()
+
+    if args.logs:
+        frames = [frame for path in args.logs for frame in read_log(path)]
+    else:
+        frames = make_fixture(args.frames)
+    records = to_records(frames)
+    database = load_database(args.dbc)
+
+    print(f"{len(records)} frames, base {os.path.basename(args.dbc)} ({len(database)} sinais), "
+          f"{os.cpu_count()} CPUs")
+    elapsed = bench_inline(records, database)
+    print(f"{'no processo':16} {len(records) / elapsed:12.0f} frames/s")
+    for workers in args.workers:
+        elapsed, samples, dropped = bench_pipeline(records, workers, args.dbc, args.shard)
+        print(f"{f'{workers} processo(s)':16} {len(records) / elapsed:12.0f} frames/s "
+              f"({samples} amostras de alarme, {dropped} descartados)")
+
+
+if __name__ == "__main__":
+    main()
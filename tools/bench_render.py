@@ -0,0 +1,120 @@
+"""Benchmark da montagem das figuras de um refresh do dashboard.
+
+Compara o caminho antigo (go.Figure/px.line novos a cada refresh) com o
+FigureCache (figuras reaproveitadas, só valores trocados). Cada refresh
+inclui o que o st.plotly_chart faz com qualquer figura: cópia para dict,
+JSON da especificação inteira e hash MD5. O FigureCache só economiza a
+montagem; a especificação continua completa. "KiB enviados" conta o
+ForwardMsgCache do Streamlit: uma mensagem de mais de 10 kB idêntica à do
+refresh anterior vai só como referência, as outras vão inteiras.
+
+Uso:
+    python tools/bench_render.py
+    python tools/bench_render.py --refreshes 200 --points 1600
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'dashboard'))
+
+from charts import FigureCache, create_gauge
+
+GAUGES = [
+    ('RPM', "RPM do Motor", 0, 3000, " RPM"),
+    ('Velocidade', "Velocidade", 0, 40, " km/h"),
+    ('Temperatura', "Temperatura", 0, 120, " °C"),
+]
+HISTORY = [('Combustível', 'Nível de Combustível'), ('Carga', 'Carga do Motor')]
+
+# global.minCachedMessageSize do Streamlit
+MIN_CACHED_MESSAGE = 10_000
+
+
+def plotly_chart_spec(fig):
+    """Serialização do st.plotly_chart: to_dict, to_json e o hash do id do elemento"""
+    spec = pio.to_json(fig.to_dict(), validate=False)
+    hashlib.md5(spec.encode()).hexdigest()
+    return spec
+
+
+def make_refreshes(count, points, new_sample_every=1):
+    """Valores de cada refresh; a série muda a cada `new_sample_every` refreshes"""
+    rng = np.random.default_rng(1)
+    now = time.time_ns()
+    refreshes = []
+    series = None
+    for i in range(count):
+        if series is None or i % new_sample_every == 0:
+            ts = now + np.arange(points, dtype=np.int64) * 100_000_000 + i * 1_000_000_000
+            series = {signal: (ts, rng.uniform(0, 100, points)) for signal, _ in HISTORY}
+        latest = {signal: float(rng.uniform(lo, hi)) for signal, _, lo, hi, _ in GAUGES}
+        refreshes.append((latest, series))
+    return refreshes
+
+
+def render_rebuild(latest, series):
+    """Caminho anterior ao FigureCache (app.py até a troca)"""
+    figures = [create_gauge(latest[s], title, lo, hi, suffix) for s, title, lo, hi, suffix in GAUGES]
+    for signal, title in HISTORY:
+        ts, values = series[signal]
+        df = pd.DataFrame({'timestamp': pd.to_datetime(ts), 'valor': values})
+        fig = px.line(df, x='timestamp', y='valor', title=title,
+                      labels={'valor': '%', 'timestamp': 'Tempo'})
+        fig.update_layout(height=300)
+        figures.append(fig)
+    return [plotly_chart_spec(fig) for fig in figures]
+
+
+def render_cached(cache):
+    def render(latest, series):
+        figures = [cache.gauge(latest[s], title, lo, hi, suffix) for s, title, lo, hi, suffix in GAUGES]
+        for signal, title in HISTORY:
+            ts, values = series[signal]
+            figures.append(cache.history(ts, values, title, '%'))
+        return [plotly_chart_spec(fig) for fig in figures]
+    return render
+
+
+def bench(render, refreshes):
+    previous = render(*refreshes[0])  # aquecimento
+    times = []
+    sent = 0
+    for latest, series in refreshes:
+        start = time.perf_counter()
+        specs = render(latest, series)
+        times.append(time.perf_counter() - start)
+        sent += sum(len(spec) for spec, last in zip(specs, previous)
+                    if len(spec) < MIN_CACHED_MESSAGE or spec != last)
+        previous = specs
+    times = np.array(times) * 1000
+    return np.median(times), np.percentile(times, 95), sent / len(refreshes) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--refreshes', type=int, default=100)
+    parser.add_argument('--points', type=int, default=1600, help='pontos por gráfico de histórico')
+    parser.add_argument('--new-sample-every', type=int, default=1,
+                        help='refreshes entre amostras novas no histórico')
+    args = parser.parse_args()
+
+    refreshes = make_refreshes(args.refreshes, args.points, args.new_sample_every)
+    print(f"{args.refreshes} refreshes, 3 gauges + 2 históricos de {args.points} pontos")
+    print(f"{'caminho':24} {'mediana (ms)':>13} {'p95 (ms)':>10} {'KiB enviados':>13}")
+    for name, render in (('figuras novas', render_rebuild),
+                         ('FigureCache', render_cached(FigureCache()))):
+        median, p95, sent = bench(render, refreshes)
+        print(f"{name:24} {median:13.2f} {p95:10.2f} {sent:13.1f}")
+
+
+if __name__ == "__main__":
+    main()
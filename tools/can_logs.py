@@ -0,0 +1,50 @@
+def read_candump(path):
+    """Lê um log "candump -l": gera (timestamp em s, ID CAN, dados)
+
+    Formato de cada linha: (1436509052.249713) can0 18FEF100#0011223344556677
+    """
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 3 or '#' not in parts[2]:
+                continue
+            can_id, _, data = parts[2].partition('#')
+            if data.startswith('R'):
+                # Remote frame: sem dados
+                data = ''
+            yield float(parts[0].strip('()')), int(can_id, 16), bytes.fromhex(data)
+
+
+def read_asc(path):
+    """Lê um log Vector ASC: gera (timestamp em s, ID CAN, dados)
+
+    Formato das linhas de frame: 0.001234 1 18FEF100x Rx d 8 00 11 22 33 44 55 66 77
+    """
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 6 or parts[4].lower() != 'd':
+                continue
+            try:
+                timestamp = float(parts[0])
+                can_id = int(parts[2].rstrip('xX'), 16)
+                dlc = int(parts[5], 16)
+                data = bytes(int(b, 16) for b in parts[6:6 + dlc])
+            except ValueError:
+                continue
+            yield timestamp, can_id, data
+
+
+def write_candump(path, frames, interface='can0'):
+    """Grava registros FRAME_DTYPE (timestamp em us) no formato de "candump -l" """
+    with open(path, 'w') as f:
+        for timestamp, can_id, dlc, data in zip(frames['timestamp'].tolist(), frames['can_id'].tolist(),
+                                                frames['dlc'].tolist(), frames['data']):
+            f.write(f"({timestamp / 1e6:.6f}) {interface} {can_id:08X}#{data[:dlc].tobytes().hex().upper()}\n")
+
+
+def read_log(path):
+    """Lê um log candump (.log) ou Vector (.asc) conforme a extensão"""
+    if path.lower().endswith('.asc'):
+        return read_asc(path)
+    return read_candump(path)
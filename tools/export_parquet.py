@@ -0,0 +1,96 @@
+"""Exporta e consulta o arquivo Parquet de sinais decodificados.
+
+Uso:
+    # decodifica o log bruto de um ESP32 para o arquivo Parquet
+    python tools/export_parquet.py export logs/192.168.4.1 arquivo/192.168.4.1
+    python tools/export_parquet.py export captura.log arquivo/trator --dbc j1939.dbc
+
+    # resumo de um turno para alguns sinais
+    python tools/export_parquet.py query arquivo/192.168.4.1 --signals RPM "Temperatura Motor" \
+        --start 2024-05-01T06:00 --end 2024-05-01T14:00
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'dashboard'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from archive import SignalArchive, SignalArchiveWriter
+from can_logs import read_log
+from clock import utc_from_local
+from j1939_parser import FRAME_DTYPE
+from rawlog import RawLogReader
+from signal_db import SIMULATOR_DATABASE, load_database, pgns_of
+
+# Frames decodificados por vez na exportação
+EXPORT_CHUNK = 1_000_000
+
+
+def raw_frames(source):
+    """Frames de um diretório do RawLogWriter (timestamps us UTC) ou de um log .log/.asc"""
+    if os.path.isdir(source):
+        return RawLogReader(source).read(0, 2 ** 62)
+    records = [(int(timestamp * 1e6), can_id, len(data), data.ljust(8, b'\0'))
+               for timestamp, can_id, data in read_log(source)]
+    frames = np.zeros(len(records), dtype=FRAME_DTYPE)
+    if records:
+        timestamp, can_id, dlc, data = zip(*records)
+        frames['timestamp'] = timestamp
+        frames['can_id'] = can_id
+        frames['dlc'] = dlc
+        frames['data'] = np.frombuffer(b''.join(data), dtype=np.uint8).reshape(-1, 8)
+    return frames
+
+
+def export(source, directory, database):
+    frames = raw_frames(source)
+    writer = SignalArchiveWriter(directory, database.signals)
+    for start in range(0, len(frames), EXPORT_CHUNK):
+        chunk = frames[start:start + EXPORT_CHUNK]
+        index, signals, values = database.decode_batch(chunk['can_id'], chunk['data'], chunk['dlc'])
+        can_ids = chunk['can_id'][index]
+        writer.append(chunk['timestamp'][index].astype(np.int64) * 1000,
+                      signals, values, pgns_of(can_ids), can_ids & 0xFF, block=True)
+    writer.close()
+    print(f"{len(frames)} frames -> {writer.rows_written} amostras em {writer.files_written} arquivo(s)")
+
+
+def query(directory, signals, start, end):
+    started = time.perf_counter()
+    table = SignalArchive(directory).query(signals, start, end)
+    elapsed = time.perf_counter() - started
+    df = table.to_pandas()
+    print(f"{len(df)} amostras lidas em {elapsed * 1000:.0f} ms")
+    if len(df):
+        print(df.groupby('signal', observed=True)['value'].agg(['count', 'min', 'mean', 'max']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='decodifica um log bruto para Parquet')
+    export_parser.add_argument('source', help='diretório do log bruto ou log candump -l / Vector .asc')
+    export_parser.add_argument('directory', help='diretório do arquivo Parquet')
+    export_parser.add_argument('--dbc', default=SIMULATOR_DATABASE, help='base de sinais (.dbc ou .json)')
+    query_parser = commands.add_parser('query', help='resume sinais de um intervalo')
+    query_parser.add_argument('directory')
+    query_parser.add_argument('--signals', nargs='+')
+    query_parser.add_argument('--start', help='início (ISO 8601, horário local)')
+    query_parser.add_argument('--end', help='fim (ISO 8601, horário local)')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export(args.source, args.directory, load_database(args.dbc))
+    else:
+        query(args.directory, args.signals,
+              utc_from_local(args.start) if args.start else None,
+              utc_from_local(args.end) if args.end else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""ESP32 simulado: roda o web_server do firmware no PC e reproduz frames CAN.
+
+Uso:
+    python tools/fake_esp32.py                       # tráfego sintético
+    python tools/fake_esp32.py --log captura.log     # replay de um log candump -l ou .asc
+
+    # carga J1939/ISOBUS reprodutível (ver tools/j1939_traffic.py)
+    python tools/fake_esp32.py --traffic j1939 --rate 3000 --bitrate 500000 --seed 1 --buffer 8192
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'esp32'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+# O firmware usa uasyncio; no CPython a API equivalente é asyncio
+sys.modules.setdefault('uasyncio', asyncio)
+
+from web_server import FrameBuffer, WebServer, MAX_FRAMES
+from can_logs import read_log
+from j1939_traffic import TrafficGenerator, parse_mix
+
+# Tráfego J1939: gerado em blocos de CHUNK_US e entregue ao buffer a cada STEP_US
+CHUNK_US = 250_000
+STEP_US = 10_000
+
+
+async def replay_log(frames, path, speed, loop):
+    """Reproduz o log respeitando os intervalos originais (divididos por speed)"""
+    while True:
+        start = time.monotonic()
+        first = None
+        for timestamp, can_id, data in read_log(path):
+            if first is None:
+                first = timestamp
+            delay = (timestamp - first) / speed - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            frames.add(can_id, data)
+        if not loop:
+            return
+
+
+async def synthetic(frames, rate):
+    """Mesmos IDs e payloads de 2 bytes da simulação de app.py, a rate frames/s por ID"""
+    signals = [
+        (0xCF00400, lambda t: (1500 + 300 * math.sin(t / 5)) / 0.125),
+        (0xCF00500, lambda t: (30 + 5 * math.sin(t / 7)) / 0.1),
+        (0xCFEE600, lambda t: 90 + 10 * math.sin(t / 60) + 40),
+        (0xCF00700, lambda t: (75 - t / 60 % 75) / 0.4),
+        (0xCF00800, lambda t: (60 + 20 * math.sin(t / 3)) / 0.4),
+    ]
+    start = time.monotonic()
+    tick = 0
+    while True:
+        t = time.monotonic() - start
+        for can_id, value in signals:
+            raw = max(0, min(0xFFFF, int(value(t))))
+            frames.add(can_id, raw.to_bytes(2, 'big'))
+        tick += 1
+        await asyncio.sleep(max(0, start + tick / rate - time.monotonic()))
+
+
+async def j1939(frames, traffic):
+    """Frames do TrafficGenerator no ritmo do relógio, com timestamps a partir de agora"""
+    start = time.monotonic()
+    epoch_us = time.time_ns() // 1000
+    pending = traffic.frames(0, CHUNK_US)
+    generated = CHUNK_US
+    step = 0
+    while True:
+        elapsed = int((time.monotonic() - start) * 1e6)
+        if elapsed + STEP_US >= generated:
+            pending = np.concatenate([pending, traffic.frames(generated, generated + CHUNK_US)])
+            generated += CHUNK_US
+        due = int(np.searchsorted(pending['timestamp'], elapsed, side='right'))
+        batch, pending = pending[:due], pending[due:]
+        for timestamp, can_id, dlc, data in zip(batch['timestamp'].tolist(), batch['can_id'].tolist(),
+                                                batch['dlc'].tolist(), batch['data']):
+            frames.add(can_id, data[:dlc].tobytes(), epoch_us + timestamp)
+        step += 1
+        await asyncio.sleep(max(0, start + step * STEP_US / 1e6 - time.monotonic()))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--log', help='log candump -l ou Vector ASC para reproduzir')
+    parser.add_argument('--speed', type=float, default=1.0, help='fator de velocidade do replay')
+    parser.add_argument('--once', action='store_true', help='não repetir o log ao terminar')
+    parser.add_argument('--traffic', choices=('simulador', 'j1939'), default='simulador',
+                        help='tráfego sintético: IDs do simulador ou J1939/ISOBUS realista')
+    parser.add_argument('--rate', type=float,
+                        help='simulador: frames/s por ID (padrão 10); j1939: frames/s totais (padrão 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='semente do tráfego j1939')
+    parser.add_argument('--pgn', action='append', help='j1939: PGN=Hz em hexadecimal, ex.: F004=50')
+    parser.add_argument('--bitrate', type=int, default=250_000,
+                        help='j1939: bits/s do barramento; taxas acima da banda são recusadas')
+    parser.add_argument('--buffer', type=int, default=MAX_FRAMES, help='frames no buffer circular')
+    args = parser.parse_args()
+
+    frames = FrameBuffer(args.buffer)
+    server = WebServer(frames, port=args.port)
+    print(f"ESP32 simulado em http://127.0.0.1:{args.port}")
+
+    if args.log:
+        source = replay_log(frames, args.log, args.speed, not args.once)
+    elif args.traffic == 'j1939':
+        try:
+            traffic = TrafficGenerator(args.seed, args.rate or 1000, mix=parse_mix(args.pgn),
+                                       bitrate=args.bitrate)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Tráfego J1939: {len(traffic.sources)} ECU(s), {traffic.rate:.0f} frames/s, "
+              f"carga {traffic.bus_load:.0%} a {args.bitrate // 1000} kbit/s")
+        source = j1939(frames, traffic)
+    else:
+        source = synthetic(frames, args.rate or 10)
+    await asyncio.gather(server.serve(), source)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
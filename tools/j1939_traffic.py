@@ -0,0 +1,310 @@
+"""Gerador determinístico de tráfego J1939/ISOBUS para testes de carga.
+
+Uso:
+    # 60 s de um barramento de 500 kbit/s a ~3000 frames/s num log candump -l
+    python tools/j1939_traffic.py --rate 3000 --bitrate 500000 --seconds 60 -o carga.log
+
+    # mistura de PGNs própria (Hz; 0 remove o PGN)
+    python tools/j1939_traffic.py --pgn F004=50 --pgn FEEE=0 --seconds 10 -o carga.log
+
+    # como fonte do ESP32 simulado
+    python tools/fake_esp32.py --traffic j1939 --rate 3000 --bitrate 500000 --buffer 8192
+
+Cada ECU do motor envia EEC1 a 100 Hz, EEC2 a 20 Hz, CCVS e LFE a 10 Hz,
+ET1 e Dash Display a 1 Hz e um DM1 com dois DTCs por TP.BAM a 1 Hz; o
+motor (0x00) também anuncia o VIN por BAM, e um receptor GNSS (0x1C) envia
+a posição de um trajeto em faixas a 5 Hz. Para chegar na taxa pedida entram ECUs
+extras com endereços ISOBUS de implemento (0x80...), cada uma com fase
+própria. Os payloads são codificados pela base de sinais (layouts do
+J1939-71), então decodificam com o mesmo layout usado pelo dashboard e
+pelo parser ISOBUS do firmware.
+
+O ruído de cada frame é função só de (semente, fluxo, índice do frame):
+a mesma semente gera o mesmo tráfego, qualquer que seja o tamanho dos
+intervalos pedidos a frames().
+
+Um barramento só transporta bitrate / FRAME_BITS frames/s (~1850 a
+250 kbit/s): taxas acima disso são recusadas com ValueError em vez de gerar
+um tráfego que nenhum barramento real teria.
+"""
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'dashboard'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from can_logs import write_candump
+from j1939_parser import FRAME_DTYPE
+from signal_db import J1939_DATABASE, load_database
+
+# Frequência (Hz) de cada PGN por ECU do motor
+DEFAULT_MIX = {
+    0xF004: 100,  # EEC1
+    0xF003: 20,   # EEC2
+    0xFEF1: 10,   # CCVS
+    0xFEF2: 10,   # LFE
+    0xFEEE: 1,    # ET1
+    0xFEFC: 1,    # Dash Display
+}
+
+# Prioridade por PGN (padrão 6)
+PRIORITY = {0xF004: 3, 0xF003: 3, 0xFEF3: 3, 0xEC00: 7, 0xEB00: 7}
+
+ENGINE = 0x00
+NAVIGATION = 0x1C
+# Endereços dinâmicos de implementos ISOBUS, usados pelas ECUs extras
+IMPLEMENT_ADDRESSES = range(0x80, 0xF8)
+
+POSITION_PGN = 0xFEF3
+POSITION_HZ = 5
+DM1_PGN = 0xFECA
+DM1_HZ = 1
+VIN_PGN = 0xFEEC
+VIN_PERIOD_S = 5
+VIN = b"1RW8320RCMD012345*"
+
+TP_CM_PGN = 0xEC00
+TP_DT_PGN = 0xEB00
+CM_BAM = 32
+# Intervalo entre os TP.DT de um BAM (J1939-21: 50 a 200 ms)
+BAM_PACKET_US = 50_000
+
+# Bits de um frame estendido com 8 bytes, com stuffing médio
+FRAME_BITS = 135
+
+# Fazenda de referência do trajeto simulado
+FIELD_ORIGIN = (-21.2000, -47.8000)
+
+
+def can_id(priority, pgn, source, destination=0xFF):
+    """ID de 29 bits; em PDU1 (PF < 240) o byte PS leva o destino"""
+    if (pgn >> 8) & 0xFF < 240:
+        pgn = (pgn & 0x1FF00) | destination
+    return (priority << 26) | (pgn << 8) | source
+
+
+def _splitmix(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _noise(key, k):
+    """Uniforme em [-1, 1) para cada índice k do fluxo `key`"""
+    with np.errstate(over='ignore'):
+        x = _splitmix(np.asarray(k, dtype=np.uint64) ^ np.uint64(key))
+    return (x >> np.uint64(11)).astype(np.float64) / 2.0 ** 52 - 1.0
+
+
+def _stream_key(seed, index):
+    with np.errstate(over='ignore'):
+        return int(_splitmix(np.array([seed * 1_000_003 + index], dtype=np.uint64))[0])
+
+
+def engine_values(t, noise, phase):
+    """Sinais do motor num ciclo de trabalho de 40 s; t em s, phase em rad"""
+    cycle = np.sin(2 * np.pi * t / 40 + phase)
+    return {
+        'RPM': 1600 + 500 * cycle + 15 * noise,
+        'Acelerador': 45 + 35 * cycle + 2 * noise,
+        'Carga Motor': 55 + 35 * cycle + 2 * noise,
+        'Velocidade': 9 + 3 * np.sin(2 * np.pi * t / 120 + phase) + 0.1 * noise,
+        'Temperatura Motor': 88 + 6 * np.sin(2 * np.pi * t / 900 + phase) + noise,
+        'Temperatura Óleo': 98 + 6 * np.sin(2 * np.pi * t / 900 + phase) + noise,
+        # 1 %/min, reabastecido a cada 80 min
+        'Nível Combustível': 90 - (t / 60 + 10 * phase) % 80,
+        'Consumo': 18 + 10 * cycle + 0.5 * noise,
+    }
+
+
+def field_position(t, speed=2.5, length=400.0, spacing=9.0):
+    """(lat, lon) de um trajeto em faixas de `length` m, afastadas `spacing` m"""
+    distance = speed * np.asarray(t, dtype=np.float64)
+    swath = distance // length
+    along = distance % length
+    x = np.where(swath % 2 == 0, along, length - along)
+    y = swath * spacing
+    lat0, lon0 = FIELD_ORIGIN
+    return lat0 + y / 111_320, lon0 + x / (111_320 * math.cos(math.radians(lat0)))
+
+
+def dm1_payload(k):
+    """DM1 com lâmpada âmbar e dois DTCs (temperatura alta, pressão de óleo baixa)"""
+    occurrences = k % 126 + 1
+    dtcs = b''
+    for spn, fmi in ((110, 0), (100, 1)):
+        dtcs += bytes((spn & 0xFF, (spn >> 8) & 0xFF, ((spn >> 11) & 0xE0) | fmi, occurrences))
+    return b'\x04\xff' + dtcs
+
+
+class _Stream:
+    """Mensagem periódica: emissão k no instante phase + k * period (us)"""
+
+    __slots__ = ('can_id', 'period', 'phase', 'payload')
+
+    def __init__(self, can_id, period, phase, payload):
+        self.can_id = can_id
+        self.period = period
+        self.phase = phase
+        # payload(k, timestamps em us) -> array uint8 (len(k), 8)
+        self.payload = payload
+
+    def indices(self, start, end):
+        first = max(0, -(-(start - self.phase) // self.period))
+        last = -(-(end - self.phase) // self.period)
+        return np.arange(first, max(first, last), dtype=np.int64)
+
+
+class TrafficGenerator:
+    """Tráfego J1939/ISOBUS sintético e reprodutível.
+
+    rate é a taxa aproximada em frames/s: define quantas ECUs do motor
+    entram no barramento. mix troca a frequência (Hz) dos PGNs de cada ECU.
+    ValueError se a carga resultante passar de 100% de bitrate.
+    """
+
+    def __init__(self, seed=0, rate=None, ecus=None, mix=None, database=None, bitrate=250_000):
+        self.seed = seed
+        self.bitrate = bitrate
+        self.database = database or load_database(J1939_DATABASE)
+        self.mix = {pgn: hz for pgn, hz in (mix or DEFAULT_MIX).items()
+                    if hz > 0 and pgn in self.database.pgns}
+
+        per_ecu = sum(self.mix.values()) + DM1_HZ * (1 + self._packets(len(dm1_payload(0))))
+        shared = POSITION_HZ + (1 + self._packets(len(VIN))) / VIN_PERIOD_S
+        if ecus is None:
+            ecus = max(1, round((rate - shared) / per_ecu)) if rate else 1
+        self.sources = [ENGINE] + list(IMPLEMENT_ADDRESSES)[:ecus - 1]
+        self.rate = shared + per_ecu * len(self.sources)
+        if self.bus_load > 1:
+            raise ValueError(f"{self.rate:.0f} frames/s não cabem em {bitrate // 1000} kbit/s "
+                             f"(carga {self.bus_load:.0%}): reduza --rate ou aumente --bitrate")
+        self._streams = []
+        self._build()
+
+    @staticmethod
+    def _packets(size):
+        return (size + 6) // 7
+
+    @property
+    def bus_load(self):
+        """Fração estimada da banda do barramento"""
+        return self.rate * FRAME_BITS / self.bitrate
+
+    def _add(self, pgn, source, hz, payload, offset=0, phase=None):
+        """Registra um fluxo; payload(k, t em s, ruído) monta os dados. Retorna a fase (us)"""
+        period = round(1_000_000 / hz)
+        key = _stream_key(self.seed, len(self._streams))
+        if phase is None:
+            phase = int((_noise(key ^ 1, [0])[0] + 1) / 2 * period)
+        self._streams.append(_Stream(
+            can_id(PRIORITY.get(pgn, 6), pgn, source), period, phase + offset,
+            lambda k, timestamps: payload(k, timestamps / 1e6, _noise(key, k))))
+        return phase
+
+    def _signals(self, pgn, source, hz, phase):
+        def payload(k, t, noise):
+            return self.database.encode_batch(engine_values(t, noise, phase), len(k), pgn=pgn)
+
+        self._add(pgn, source, hz, payload)
+
+    def _bam(self, pgn, source, hz, message, phase=None):
+        """TP.CM (BAM) e os TP.DT da mensagem message(k), espaçados de BAM_PACKET_US"""
+        size = len(message(0))
+        packets = self._packets(size)
+        control = bytes((CM_BAM, size & 0xFF, size >> 8, packets, 0xFF,
+                         pgn & 0xFF, (pgn >> 8) & 0xFF, pgn >> 16))
+
+        def announce(k, t, noise):
+            return np.tile(np.frombuffer(control, dtype=np.uint8), (len(k), 1))
+
+        def packet(number):
+            def payload(k, t, noise):
+                rows = [(bytes((number,)) + message(i)[(number - 1) * 7:number * 7]).ljust(8, b'\xff')
+                        for i in k.tolist()]
+                return np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(-1, 8)
+            return payload
+
+        phase = self._add(TP_CM_PGN, source, hz, announce, phase=phase)
+        for number in range(1, packets + 1):
+            self._add(TP_DT_PGN, source, hz, packet(number), number * BAM_PACKET_US, phase)
+        return phase
+
+    def _build(self):
+        for index, source in enumerate(self.sources):
+            phase = 1.7 * index
+            for pgn, hz in self.mix.items():
+                self._signals(pgn, source, hz, phase)
+            dm1_phase = self._bam(DM1_PGN, source, DM1_HZ, dm1_payload)
+            if source == ENGINE:
+                # Uma sessão BAM por origem de cada vez: o VIN sai meio período depois do DM1
+                self._bam(VIN_PGN, ENGINE, 1 / VIN_PERIOD_S, lambda k: VIN,
+                          dm1_phase + 500_000 // DM1_HZ)
+
+        def position(k, t, noise):
+            lat, lon = field_position(t)
+            # ~0,3 m de ruído do receptor
+            return self.database.encode_batch({'Latitude': lat + 3e-6 * noise, 'Longitude': lon + 3e-6 * noise},
+                                              len(k), pgn=POSITION_PGN)
+
+        if POSITION_PGN in self.database.pgns:
+            self._add(POSITION_PGN, NAVIGATION, POSITION_HZ, position)
+
+    def frames(self, start, end):
+        """Frames com timestamp (us desde o início do tráfego) em [start, end), em ordem"""
+        timestamps, ids, payloads = [], [], []
+        for stream in self._streams:
+            k = stream.indices(start, end)
+            if not len(k):
+                continue
+            timestamps.append(stream.phase + k * stream.period)
+            ids.append(np.full(len(k), stream.can_id, dtype=np.uint32))
+            payloads.append(stream.payload(k, timestamps[-1]))
+        frames = np.zeros(sum(len(t) for t in timestamps), dtype=FRAME_DTYPE)
+        if not len(frames):
+            return frames
+        order = np.argsort(np.concatenate(timestamps), kind='stable')
+        frames['timestamp'] = np.concatenate(timestamps)[order]
+        frames['can_id'] = np.concatenate(ids)[order]
+        frames['dlc'] = 8
+        frames['data'] = np.concatenate(payloads)[order]
+        return frames
+
+
+def parse_mix(items):
+    """["F004=50", ...] -> DEFAULT_MIX com as frequências trocadas"""
+    mix = dict(DEFAULT_MIX)
+    for item in items or ():
+        pgn, _, hz = item.partition('=')
+        mix[int(pgn, 16)] = float(hz)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', required=True, help='log candump -l de saída')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rate', type=float, default=1000, help='frames/s aproximados')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pgn', action='append', help='PGN=Hz em hexadecimal, ex.: F004=50')
+    parser.add_argument('--bitrate', type=int, default=250_000, help='bits/s do barramento, para a carga')
+    args = parser.parse_args()
+
+    try:
+        traffic = TrafficGenerator(args.seed, args.rate, mix=parse_mix(args.pgn), bitrate=args.bitrate)
+    except ValueError as e:
+        parser.error(str(e))
+    frames = traffic.frames(0, int(args.seconds * 1e6))
+    write_candump(args.output, frames)
+    print(f"{len(frames)} frames de {len(traffic.sources)} ECU(s) em {args.seconds:g} s "
+          f"({traffic.rate:.0f} frames/s, carga {traffic.bus_load:.0%} a {args.bitrate // 1000} kbit/s)")
+
+
+if __name__ == "__main__":
+    main()
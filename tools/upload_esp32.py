@@ -1,42 +1,232 @@
+"""Envia o firmware de src/esp32 para todos os ESP32 conectados por USB.
+
+Uso:
+    # todas as placas detectadas, só os arquivos alterados
+    python tools/upload_esp32.py
+
+    # placas específicas, módulos pré-compilados para .mpy
+    python tools/upload_esp32.py --port /dev/ttyUSB0 --port /dev/ttyUSB1 --mpy
+
+Cada placa é atualizada numa thread própria com duas chamadas ao mpremote:
+uma sessão lê o SHA-256 dos arquivos no dispositivo (e cria os diretórios),
+outra copia de uma vez só os arquivos cujo hash mudou, encadeados com "+",
+e reinicia a placa. Com --mpy os módulos são compilados uma vez com o
+mpy-cross (que precisa ser da mesma versão do MicroPython das placas);
+boot.py e main.py continuam como fonte, porque o MicroPython só os executa
+assim.
+"""
+import argparse
+import hashlib
+import json
 import os
+import posixpath
+import shutil
+import subprocess
 import sys
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 import serial.tools.list_ports
 
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FIRMWARE_DIR = os.path.join(ROOT, 'src', 'esp32')
+
+# Conversores USB-serial das placas ESP32 (CP210x, CH340) e USB nativo dos S2/S3/C3
+USB_VIDS = (0x10C4, 0x1A86, 0x303A)
+
+# Arquivos de fora de src/esp32 que o firmware usa: (local, caminho no dispositivo).
+# O parser ISOBUS lê o mesmo esquema de sinais e usa o mesmo remontador de TP do dashboard
+SHARED_FILES = (
+    (os.path.join(ROOT, 'src', 'dashboard', 'signals', 'j1939.json'), 'isobus/j1939.json'),
+    (os.path.join(ROOT, 'src', 'dashboard', 'j1939_transport.py'), 'j1939_transport.py'),
+)
+
+# Executados como fonte pelo MicroPython: nunca viram .mpy
+ENTRY_POINTS = ('boot.py', 'main.py')
+
+# Roda no dispositivo: cria diretórios, apaga arquivos obsoletos e imprime os hashes
+DEVICE_SCRIPT = """
+import os, hashlib, binascii, json
+def _h(p):
+    d = hashlib.sha256()
+    try:
+        with open(p, 'rb') as f:
+            while True:
+                b = f.read(1024)
+                if not b:
+                    break
+                d.update(b)
+    except OSError:
+        return None
+    return binascii.hexlify(d.digest()).decode()
+for _d in %r:
+    try:
+        os.mkdir(_d)
+    except OSError:
+        pass
+for _p in %r:
+    try:
+        os.remove(_p)
+    except OSError:
+        pass
+print('HASHES ' + json.dumps({_p: _h(_p) for _p in %r}))
+"""
+
+
+def find_esp32_ports():
+    """Portas seriais de todas as placas ESP32 conectadas"""
+    return sorted(
+        port.device for port in serial.tools.list_ports.comports()
+        if port.vid in USB_VIDS or "CP210" in port.description or "CH340" in port.description
+    )
+
+
 def find_esp32_port():
-    """Encontra a porta do ESP32"""
-    ports = serial.tools.list_ports.comports()
-    for port in ports:
-        if "CP210" in port.description or "CH340" in port.description:
-            return port.device
-    return None
-
-def upload_files():
-    """Upload dos arquivos para ESP32"""
-    port = find_esp32_port()
-    if not port:
+    """Primeira porta de ESP32 encontrada (ou None)"""
+    ports = find_esp32_ports()
+    return ports[0] if ports else None
+
+
+def mpremote_command():
+    if shutil.which('mpremote'):
+        return ['mpremote']
+    return [sys.executable, '-m', 'mpremote']
+
+
+def firmware_files(source, build_dir=None, shared=SHARED_FILES):
+    """[(arquivo local, caminho no dispositivo)]; com build_dir, módulos compilados para .mpy"""
+    sources = list(shared)
+    for directory, dirs, names in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for name in sorted(names):
+            local = os.path.join(directory, name)
+            sources.append((local, os.path.relpath(local, source).replace(os.sep, '/')))
+    files = []
+    for local, remote in sources:
+        if build_dir and remote.endswith('.py') and remote not in ENTRY_POINTS:
+            remote = remote[:-3] + '.mpy'
+            compiled = os.path.join(build_dir, remote)
+            os.makedirs(os.path.dirname(compiled) or build_dir, exist_ok=True)
+            subprocess.run(['mpy-cross', '-o', compiled, '-s', remote[:-4] + '.py', local],
+                           check=True)
+            local = compiled
+        files.append((local, remote))
+    return files
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def stale_paths(files):
+    """Versão .py/.mpy alternativa de cada módulo, que o import poderia preferir"""
+    remotes = {remote for _, remote in files}
+    stale = []
+    for remote in remotes:
+        if remote.endswith('.mpy'):
+            other = remote[:-4] + '.py'
+        elif remote.endswith('.py') and remote not in ENTRY_POINTS:
+            other = remote[:-3] + '.mpy'
+        else:
+            continue
+        if other not in remotes:
+            stale.append(other)
+    return sorted(stale)
+
+
+def device_hashes(port, files):
+    """{caminho: sha256 ou None} no dispositivo, numa única sessão do mpremote"""
+    remotes = [remote for _, remote in files]
+    dirs = sorted({posixpath.dirname(remote) for remote in remotes} - {''},
+                  key=lambda d: d.count('/'))
+    script = DEVICE_SCRIPT % (dirs, stale_paths(files), remotes)
+    result = subprocess.run([*mpremote_command(), 'connect', port, 'exec', script],
+                            capture_output=True, text=True, timeout=60)
+    for line in result.stdout.splitlines():
+        if line.startswith('HASHES '):
+            return json.loads(line[len('HASHES '):])
+    raise RuntimeError(result.stderr.strip() or result.stdout.strip() or "sem resposta do dispositivo")
+
+
+def deploy(port, files, local_hashes, force=False, reset=True):
+    """Atualiza uma placa; retorna o resumo com os tempos de cada etapa"""
+    started = time.monotonic()
+    report = {'port': port, 'sent': 0, 'bytes': 0, 'error': None}
+    try:
+        remote_hashes = device_hashes(port, files)
+        report['hash_s'] = time.monotonic() - started
+        changed = [(local, remote) for local, remote in files
+                   if force or remote_hashes.get(remote) != local_hashes[local]]
+        steps = []
+        for local, remote in changed:
+            steps += ['fs', 'cp', local, ':' + remote, '+']
+        if changed and reset:
+            steps += ['reset']
+        elif steps:
+            steps.pop()
+        if steps:
+            result = subprocess.run([*mpremote_command(), 'connect', port, *steps],
+                                    capture_output=True, text=True, timeout=300)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip() or f"mpremote saiu com {result.returncode}")
+        report['sent'] = len(changed)
+        report['bytes'] = sum(os.path.getsize(local) for local, _ in changed)
+    except (RuntimeError, OSError, subprocess.SubprocessError) as e:
+        report['error'] = str(e)
+    report['total_s'] = time.monotonic() - started
+    return report
+
+
+def upload_files(ports=None, source=FIRMWARE_DIR, mpy=False, force=False, reset=True):
+    """Atualiza todas as placas em paralelo; True se todas deram certo"""
+    ports = ports or find_esp32_ports()
+    if not ports:
         print("ESP32 não encontrado!")
         return False
-    
-    print(f"ESP32 encontrado na porta {port}")
-    
-    # Comandos para upload
-    commands = [
-        f"mpremote connect {port} reset",
-        f"mpremote connect {port} fs cp src/esp32/main.py :main.py",
-        f"mpremote connect {port} reset"
-    ]
-    
-    for cmd in commands:
-        print(f"Executando: {cmd}")
-        result = os.system(cmd)
-        if result != 0:
-            print(f"Erro ao executar: {cmd}")
-            return False
-        time.sleep(1)
-    
-    print("Upload concluído com sucesso!")
-    return True
+    if mpy and not shutil.which('mpy-cross'):
+        print("mpy-cross não encontrado (pip install mpy-cross)")
+        return False
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        files = firmware_files(source, build_dir if mpy else None)
+        local_hashes = {local: file_hash(local) for local, _ in files}
+        print(f"{len(files)} arquivo(s) de {source} para {len(ports)} placa(s): {', '.join(ports)}")
+
+        started = time.monotonic()
+        reports = []
+        with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+            futures = [pool.submit(deploy, port, files, local_hashes, force, reset) for port in ports]
+            for future in futures:
+                report = future.result()
+                reports.append(report)
+                if report['error']:
+                    print(f"{report['port']}: ERRO após {report['total_s']:.1f} s: {report['error']}")
+                else:
+                    print(f"{report['port']}: {report['sent']}/{len(files)} arquivo(s), "
+                          f"{report['bytes'] / 1024:.1f} KiB, hash {report['hash_s']:.1f} s, "
+                          f"total {report['total_s']:.1f} s")
+
+    failed = [report['port'] for report in reports if report['error']]
+    print(f"{len(ports) - len(failed)}/{len(ports)} placa(s) atualizada(s) "
+          f"em {time.monotonic() - started:.1f} s")
+    if failed:
+        print(f"Falharam: {', '.join(failed)}")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', action='append', help='porta serial (repetível; padrão: todas detectadas)')
+    parser.add_argument('--source', default=FIRMWARE_DIR, help='diretório do firmware')
+    parser.add_argument('--mpy', action='store_true', help='pré-compila os módulos com mpy-cross')
+    parser.add_argument('--force', action='store_true', help='envia todos os arquivos, mesmo sem mudança')
+    parser.add_argument('--no-reset', action='store_true', help='não reinicia as placas no fim')
+    args = parser.parse_args()
+    ok = upload_files(args.port, args.source, args.mpy, args.force, not args.no_reset)
+    sys.exit(0 if ok else 1)
+
 
 if __name__ == "__main__":
-    upload_files() 
\ No newline at end of file
+    main()